@@ -1,14 +1,128 @@
 
-from flask import Flask, request, jsonify, send_from_directory
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime
+from io import BytesIO
+from flask import Flask, Request, Response, request, jsonify, send_from_directory, url_for
 from flask_cors import CORS
-from controller import AppController
+from werkzeug.datastructures import FileStorage
+from controller import AppController, STATIC_FOLDER, RESULTS_SUBFOLDER, RESPONSE_MODES
+from model_registry import registry as model_registry
+from job_queue import JobQueue, QueueFullError
+from models import OUTPUT_FORMATS
+from uploads import UploadSpool
+import metrics
+
+class UploadRequest(Request):
+    """Parses uploaded files into UploadSpools: in memory up to UPLOAD_SPOOL_MB, else a temp file."""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return UploadSpool()
 
 # --- App Setup ---
-app = Flask(__name__)
-CORS(app) # Allow requests from the React frontend
+# static_folder=None: /static is served by serve_static below, not Flask's built-in route
+app = Flask(__name__, static_folder=None)
+app.request_class = UploadRequest
+# Allow requests from the React frontend, which may read the paging and cache headers
+CORS(app, expose_headers=['ETag', 'Link', 'X-Next-Cursor'])
+
+# Optional form fields forwarded to the controller, with their types
+OPTIONAL_PARAMS = {
+    'downsample_mode': str,
+    'downsample_factor': int,
+    'max_size': int,
+    'output_format': str,
+    'quality': int,
+    'compress_level': int,
+    'percentile_method': str,
+    'saturation_mode': str,
+    'stretch_mode': str,
+}
+
+# Browser cache lifetime (seconds) of images served for response_mode='url'
+RESULT_MAX_AGE = 365 * 24 * 3600
+
+# Entries per /history page, by default and at most
+HISTORY_PAGE_SIZE = int(os.environ.get('HISTORY_PAGE_SIZE', 50))
+HISTORY_MAX_PAGE_SIZE = 500
+
+# Background jobs for async /colorize-layers requests. They live in this process only:
+# serve async requests from one worker process or with sticky routing
+job_queue = JobQueue(max_workers=int(os.environ.get('JOB_WORKERS', 2)),
+                     max_pending=int(os.environ.get('JOB_QUEUE_SIZE', 8)),
+                     max_finished=int(os.environ.get('JOB_MAX_FINISHED', 32)))
+
+# --- Controller (created on first use so the app starts fast) ---
+_controller = None
+_controller_lock = threading.Lock()
 
-# --- Initialize Controller ---
-controller = AppController()
+def get_controller():
+    """Return the shared AppController, creating it on first use."""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = AppController()
+    return _controller
+
+def warm_up():
+    """Import torch and load the denoising model ahead of the first request."""
+    get_controller().warm_up()
+
+# Set WARMUP_ON_START=1 to load the model at startup, e.g. in a gunicorn --preload master
+if os.environ.get('WARMUP_ON_START') == '1':
+    warm_up()
+    # Forked workers then share the loaded weights copy-on-write
+    model_registry.prepare_for_fork()
+
+def _form_flag(name):
+    return request.form.get(name, '').lower() in ('1', 'true', 'yes')
+
+def _detach_uploads(files):
+    """
+    Take the uploads' spools from the request, which closes its files when it
+    ends, for a background job; returns FileStorage objects owning them.
+    """
+    detached = {}
+    for channel, file_storage in files.items():
+        stream = file_storage.stream
+        if not isinstance(stream, UploadSpool):
+            stream = UploadSpool.from_stream(stream)
+        detached[channel] = FileStorage(stream=stream, filename=file_storage.filename)
+        file_storage.stream = BytesIO()
+    return detached
+
+def _close_uploads(files):
+    for file_storage in files.values():
+        file_storage.close()
+
+def _run_colorize_job(controller, files, model_params, response_mode, progress):
+    try:
+        result, error = controller.colorize_layers(files, model_params, progress=progress,
+                                                   response_mode=response_mode)
+    finally:
+        # Deletes spill files as soon as the job is done with them
+        _close_uploads(files)
+    if error:
+        raise RuntimeError(error)
+    return result
+
+def _result_response(result):
+    """
+    Send a colorization result: the image itself for response_mode='binary',
+    JSON otherwise. Either way the image hash is the ETag, so a client that
+    already has the image gets a 304 without the body.
+    """
+    if result['etag'] in request.if_none_match:
+        response = app.response_class(status=304)
+    elif 'image_bytes' in result:
+        response = app.response_class(result['image_bytes'], mimetype=result['mimetype'])
+    else:
+        response = jsonify(result)
+    response.set_etag(result['etag'])
+    return response
 
 # --- API Routes ---
 
@@ -25,25 +139,165 @@ def handle_colorize_layers():
         'blue': request.files['blue_file']
     }
 
+    response_mode = request.form.get('response_mode', 'json')
+    if response_mode not in RESPONSE_MODES:
+        return jsonify({"error": f"Unknown response_mode, expected one of {RESPONSE_MODES}"}), 400
+    output_format = request.form.get('output_format', 'png').lower()
+    if output_format not in OUTPUT_FORMATS:
+        return jsonify({"error": f"Unknown output_format, expected one of {tuple(OUTPUT_FORMATS)}"}), 400
+
     model_params = {
         'palette': request.form.get('palette', 'natural')
     }
+    for name, cast in OPTIONAL_PARAMS.items():
+        value = request.form.get(name, type=cast)
+        if value is not None:
+            model_params[name] = value
+    # Strip-by-strip rendering; left out, the server decides by output size
+    if 'streaming' in request.form:
+        model_params['streaming'] = _form_flag('streaming')
 
-    result, error = controller.colorize_layers(files, model_params)
+    # async=1: queue the work and return a job id right away
+    # progressive=1: same, plus a quick low-resolution preview in the response
+    progressive = _form_flag('progressive')
+    if _form_flag('async') or progressive:
+        uploads = _detach_uploads(files)
+        # The job fills in defaults on its own params while the preview runs
+        preview_params = dict(model_params)
+        if progressive:
+            # Opened before the job starts, so they stay readable if the job finishes first
+            layers = {channel: file_storage.stream.source() for channel, file_storage in uploads.items()}
+        try:
+            job = job_queue.submit(_run_colorize_job, get_controller(),
+                                   uploads, model_params, response_mode)
+        except QueueFullError as e:
+            _close_uploads(uploads)
+            response = jsonify({"error": str(e)})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        body = {
+            "job_id": job.job_id,
+            "status": job.status,
+            "status_url": f"/jobs/{job.job_id}",
+            "result_url": f"/jobs/{job.job_id}/result"
+        }
+        if progressive:
+            body['preview'], preview_error = get_controller().preview_layers(layers, preview_params)
+            if preview_error:
+                body['preview_error'] = preview_error
+        return jsonify(body), 202
+
+    result, error = get_controller().colorize_layers(files, model_params,
+                                                     response_mode=response_mode)
 
     if error:
         return jsonify({"error": error}), 500
     
-    return jsonify(result), 200
+    return _result_response(result)
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if job.status == 'failed':
+        return jsonify({"error": job.error}), 500
+    if job.status != 'done':
+        # Not finished yet: report status, the client keeps polling
+        return jsonify(job.to_dict()), 202
+    return _result_response(job.result)
+
+def _history_query():
+    """Parse the /history query string into HistoryManager.query arguments; raises ValueError."""
+    args = request.args
+    limit = int(args.get('limit', HISTORY_PAGE_SIZE))
+    if not 1 <= limit <= HISTORY_MAX_PAGE_SIZE:
+        raise ValueError(f"limit must be between 1 and {HISTORY_MAX_PAGE_SIZE}")
+    query = {'limit': limit}
+    if 'cursor' in args:
+        query['cursor'] = int(args['cursor'])
+    for name in ('status', 'palette', 'filename'):
+        if args.get(name):
+            query[name] = args[name]
+    for name in ('since', 'until'):
+        if args.get(name):
+            query[name] = datetime.fromisoformat(args[name])
+    if args.get('fields'):
+        query['fields'] = tuple(field.strip() for field in args['fields'].split(','))
+    return query
+
+def _history_etag(version, query):
+    """Same history version + same query -> same page."""
+    key = json.dumps([version, query], sort_keys=True, default=str)
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
 
 @app.route('/history', methods=['GET'])
 def get_history():
-    history = controller.get_history()
-    return jsonify(history)
+    """
+    One page of the history, newest first: a JSON list of entries. Query
+    arguments: limit, cursor, status, palette, since, until (ISO dates),
+    filename (substring) and fields (comma-separated). The cursor of the
+    next page is in the X-Next-Cursor and Link headers.
+    """
+    try:
+        query = _history_query()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    controller = get_controller()
+    # Unchanged history: answer 304 without running the query
+    etag = _history_etag(controller.history_version(), query)
+    if etag in request.if_none_match:
+        response = app.response_class(status=304)
+    else:
+        try:
+            entries, next_cursor, version = controller.query_history(**query)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        etag = _history_etag(version, query)
+        response = jsonify(entries)
+        if next_cursor is not None:
+            response.headers['X-Next-Cursor'] = str(next_cursor)
+            next_url = url_for('get_history', **dict(request.args.items(), cursor=next_cursor))
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+    response.set_etag(etag)
+    # Browsers revalidate on every poll and get the 304
+    response.cache_control.no_cache = True
+    return response
+
+@app.route('/cache/stats', methods=['GET'])
+def get_cache_stats():
+    return jsonify(get_controller().get_cache_stats())
+
+@app.route('/metrics', methods=['GET'])
+def get_metrics():
+    # Prometheus text format. Scrapes do not create the controller: no cache
+    # metrics until the first request has used it
+    cache_stats = _controller.get_cache_stats() if _controller is not None else {}
+    return Response(metrics.render(metrics.cache_metrics(cache_stats)),
+                    content_type=metrics.CONTENT_TYPE)
 
 @app.route('/static/<path:filename>')
 def serve_static(filename):
-    return send_from_directory(controller.STATIC_FOLDER, filename)
+    # The controller writes relative to the working directory, not the app root
+    static_folder = os.path.abspath(STATIC_FOLDER)
+    # Rendered results are named by their content hash and never change
+    if filename.startswith(f"{RESULTS_SUBFOLDER}/"):
+        response = send_from_directory(static_folder, filename, max_age=RESULT_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
+    return send_from_directory(static_folder, filename)
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok"})
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
@@ -1,10 +1,11 @@
-from astropy.io import fits
-from astropy.visualization import make_lupton_rgb, AsinhStretch, SqrtStretch, LinearStretch
 import numpy as np
 from PIL import Image
 
 def get_stretch_function(stretch_name='asinh'):
     """Selects the stretch function based on name."""
+    # astropy.visualization is slow to import, so load it only when needed
+    from astropy.visualization import AsinhStretch, SqrtStretch, LinearStretch
+
     if stretch_name == 'sqrt':
         return SqrtStretch()
     if stretch_name == 'linear':
@@ -38,6 +39,8 @@ def colorize_fits(fits_data, red_channel, green_channel, blue_channel, stretch_n
     image_g = fits_data[green_channel, :, :]
     image_b = fits_data[blue_channel, :, :]
 
+    from astropy.visualization import make_lupton_rgb
+
     stretch = get_stretch_function(stretch_name)
 
     # Use a standard astronomical library function to create a visually appealing RGB image
@@ -0,0 +1,31 @@
+"""
+Compact the processing history database.
+
+Keeps the newest entries, folds the write-ahead log into the database and
+VACUUMs it so the freed space goes back to the file system. Safe to run
+while the app is serving requests (writers wait for it).
+
+HOW TO RUN:
+    python compact_history.py --max-entries 100000
+"""
+
+import argparse
+import os
+from history_manager import HistoryManager, HISTORY_DB
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact the history database.")
+    parser.add_argument('--db', default=HISTORY_DB, help="history database (default: HISTORY_DB)")
+    parser.add_argument('--max-entries', type=int, default=0,
+                        help="keep only the newest N entries (default: keep all)")
+    args = parser.parse_args()
+
+    size = os.path.getsize(args.db)
+    manager = HistoryManager(db_path=args.db, legacy_file=None, max_entries=0, write_behind=False)
+    removed = manager.compact(args.max_entries, vacuum=True)
+    print(f"✓ Removed {removed} entries, {manager.count()} left, "
+          f"{size / 1e6:.1f} MB -> {os.path.getsize(args.db) / 1e6:.1f} MB")
+    manager.close()
+
+if __name__ == "__main__":
+    main()
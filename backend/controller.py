@@ -1,15 +1,55 @@
 import os
-import numpy as np
-from astropy.io import fits
-from image_processing import ImageProcessor
+from image_processing import ImageProcessor, SATURATION_MODES, STRETCH_MODES, STRETCH_CURVES
 from history_manager import HistoryManager
-from models import FITSData, HistoryItem
+from fits_loader import FITSLoader
+from downsampler import Downsampler
+from models import HistoryItem, OUTPUT_FORMATS
+from result_cache import ResultCache, DiskLRUCache, create_result_cache
+from percentiles import PERCENTILE_METHODS
+from streaming import STREAMING_FORMATS
+from uploads import UploadSpool
+from metrics import stage, REQUEST_SECONDS
 import base64
-from io import BytesIO
+import contextlib
+import hashlib
+import threading
+import time
 from datetime import datetime
 
-UPLOAD_FOLDER = 'uploads'
 STATIC_FOLDER = 'static'
+# Rendered images for response_mode='url' go to STATIC_FOLDER/RESULTS_SUBFOLDER
+RESULTS_SUBFOLDER = 'results'
+# Size budget of those images per process; the least recently rendered are removed first
+URL_RESULTS_MB = int(os.environ.get('URL_RESULTS_MB', 1024))
+
+# Shapes of the colorization result: JSON with a data URI, raw image bytes, or a /static URL
+RESPONSE_MODES = ('json', 'binary', 'url')
+
+# Encoder defaults, overridable per request with `quality` / `compress_level`
+PNG_COMPRESS_LEVEL = int(os.environ.get('PNG_COMPRESS_LEVEL', 6))
+JPEG_QUALITY = int(os.environ.get('JPEG_QUALITY', 90))
+
+# Default percentile estimation for the stretch: 'exact', 'subsample' or 'histogram'
+PERCENTILE_METHOD = os.environ.get('PERCENTILE_METHOD', 'exact')
+
+# Default saturation boost: 'hsv' or 'luma'
+SATURATION_MODE = os.environ.get('SATURATION_MODE', 'hsv')
+
+# Default stretch evaluation: 'exact' or 'lut' (lookup table)
+STRETCH_MODE = os.environ.get('STRETCH_MODE', 'exact')
+
+# Progressive mode: size (longest edge), format and quality of the quick preview
+PREVIEW_MAX_SIZE = int(os.environ.get('PREVIEW_MAX_SIZE', 512))
+PREVIEW_FORMAT = 'jpeg'
+PREVIEW_QUALITY = 80
+
+# Renders of more output pixels than this are colorized strip by strip (png/png16/tiff16 only)
+STREAM_MIN_PIXELS = int(os.environ.get('STREAM_MIN_PIXELS', 64_000_000))
+
+# Finished images cache: 'memory', 'disk' or 'off'
+RESULT_CACHE = os.environ.get('RESULT_CACHE', 'memory')
+RESULT_CACHE_MB = int(os.environ.get('RESULT_CACHE_MB', 256))
+RESULT_CACHE_DIR = os.environ.get('RESULT_CACHE_DIR', os.path.join('cache', 'results'))
 
 # These configurations represent the "AI Models and Palettes"
 MODELS = {
@@ -35,82 +75,108 @@ class AppController:
     def __init__(self):
         self.image_processor = ImageProcessor()
         self.history_manager = HistoryManager()
-        os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-        os.makedirs(STATIC_FOLDER, exist_ok=True)
+        self.fits_loader = FITSLoader()
+        self.result_cache = create_result_cache(RESULT_CACHE, RESULT_CACHE_MB * 1024 * 1024,
+                                                RESULT_CACHE_DIR)
+        # Also removes the temporary files of renders that crashed mid-write
+        self.url_results = DiskLRUCache(os.path.join(STATIC_FOLDER, RESULTS_SUBFOLDER),
+                                        URL_RESULTS_MB * 1024 * 1024)
+
+    def colorize_layers(self, files, model_params, progress=None, response_mode='json'):
+        """
+        Handles the full colorization process for separate layer files.
 
-    def colorize_layers(self, files, model_params):
-        """Handles the full colorization process for separate layer files."""
+        `progress`, if given, is called as progress(stage, fraction) as the
+        work advances (used by background jobs to report status).
+        `response_mode` picks the shape of the result, see _format_result.
+        """
+        report = progress or (lambda stage, fraction: None)
+        filenames = {}
+        spooled = contextlib.ExitStack()
+        started = time.perf_counter()
+        status = "Failure"
         try:
-            # Save the files first
-            filenames = {}
-            for channel, file_storage in files.items():
-                filepath = os.path.join(UPLOAD_FOLDER, file_storage.filename)
-                file_storage.save(filepath)
-                filenames[channel] = file_storage.filename
-
-            # Load each file and stack them into a data cube
-            r_path = os.path.join(UPLOAD_FOLDER, filenames['red'])
-            g_path = os.path.join(UPLOAD_FOLDER, filenames['green'])
-            b_path = os.path.join(UPLOAD_FOLDER, filenames['blue'])
-
-            with fits.open(r_path) as hdul_r, fits.open(g_path) as hdul_g, fits.open(b_path) as hdul_b:
-                data_r = hdul_r[0].data
-                data_g = hdul_g[0].data
-                data_b = hdul_b[0].data
-
-                # Downsample the data to reduce memory usage
-                downsample_factor = 4
-                data_r = data_r[::downsample_factor, ::downsample_factor]
-                data_g = data_g[::downsample_factor, ::downsample_factor]
-                data_b = data_b[::downsample_factor, ::downsample_factor]
-
-                stacked_data = np.stack([data_r, data_g, data_b])
-                fits_data_obj = FITSData(data=stacked_data, header=hdul_r[0].header)
-            
+            if response_mode not in RESPONSE_MODES:
+                raise ValueError(f"Unknown response mode '{response_mode}', expected one of {RESPONSE_MODES}")
+
+            # Read the uploads from memory (or their spill file), without saving them under their names
+            report('reading', 0.0)
+            filenames = {channel: file_storage.filename for channel, file_storage in files.items()}
+            with stage('reading') as reading:
+                spools = self._spool_uploads(files, spooled)
+                layers = [spools['red'], spools['green'], spools['blue']]
+                reading.bytes = sum(spool.size() for spool in layers)
+
             input_filename_for_history = f"{filenames['red']}, {filenames['green']}, {filenames['blue']}"
-            
-            # Get palette from frontend, or default to 'natural'
-            selected_palette = model_params.get('palette', 'natural')
-            palette_config = MODELS.get(selected_palette, MODELS['natural'])
-
-            # Set channel mappings based on selected palette
-            model_params['red_channel'] = palette_config['red_channel']
-            model_params['green_channel'] = palette_config['green_channel']
-            model_params['blue_channel'] = palette_config['blue_channel']
-
-            # Enhanced stretch parameters based on reference code
-            model_params['stretch_name'] = model_params.get('stretch_name', 'power')
-            model_params['power'] = model_params.get('power', 2.4)
-            model_params['black_point'] = model_params.get('black_point', 0.5)
-            model_params['white_point'] = model_params.get('white_point', 99.8)
-            model_params['saturation'] = model_params.get('saturation', 1.3)
-            model_params['red_scale'] = model_params.get('red_scale', 1.0)
-            model_params['green_scale'] = model_params.get('green_scale', 1.0)
-            model_params['blue_scale'] = model_params.get('blue_scale', 1.0)
-            
-            # ML Denoising parameter (new!)
-            model_params['use_denoising'] = model_params.get('use_denoising', True)
-
-            # Process image with ML denoising
-            processed_image = self.image_processor.process_image(fits_data_obj, model_params)
-            
-            pil_img = processed_image.export_to()
-
-            # Encode image to Base64
-            buffered = BytesIO()
-            pil_img.save(buffered, format="PNG")
-            img_str = base64.b64encode(buffered.getvalue()).decode("utf-8")
-            image_data = f"data:image/png;base64,{img_str}"
 
+            self._apply_defaults(model_params)
+
+            # Same file contents + same request and server settings -> same image: serve it from the cache
+            cache_key = None
+            cached = None
+            if self.result_cache is not None:
+                with stage('digest', reading.bytes):
+                    digests = [spool.digest() for spool in layers]
+                cache_key = ResultCache.make_key(
+                    digests, {**model_params, 'server': self.image_processor.settings_key()})
+                cached = self.result_cache.get(cache_key)
+
+            image_path = None
+            if cached is not None:
+                image_bytes, serializable_metadata = cached
+            else:
+                downsampler = Downsampler(mode=model_params['downsample_mode'],
+                                          factor=model_params['downsample_factor'],
+                                          max_size=model_params['max_size'])
+
+                report('loading', 0.1)
+                with self.fits_loader.open_layers([spool.source() for spool in layers]) as (
+                        sections, shape, header):
+                    serializable_metadata = {k: str(v) for k, v in header.items()}
+                    # Too large for memory: colorize and encode strip by strip into a file
+                    if self._use_streaming(shape, downsampler, model_params):
+                        with stage('streaming'):
+                            image_path = self._stream_to_file(sections, shape, downsampler, model_params,
+                                                              report)
+
+                if image_path is None:
+                    # Read only the rows we need, chunk by chunk, instead of the full-resolution arrays.
+                    # Fresh sources: astropy closes the file objects it was given
+                    with stage('loading') as loading:
+                        fits_data_obj = self.fits_loader.load_cube([spool.source() for spool in layers],
+                                                                   downsampler=downsampler)
+                        loading.bytes = fits_data_obj.get_raw_data().nbytes
+
+                    # Process image with ML denoising
+                    processed_image = self.image_processor.process_image(fits_data_obj, model_params,
+                                                                         progress=report)
+                    
+                    report('encoding', 0.9)
+                    with stage('encoding') as encoding:
+                        image_bytes = processed_image.export_to(model_params['output_format'],
+                                                                quality=model_params['quality'],
+                                                                compress_level=model_params['compress_level'])
+                        encoding.bytes = len(image_bytes)
+
+                    if cache_key is not None:
+                        self.result_cache.put(cache_key, image_bytes, serializable_metadata)
+
+            with stage('formatting'):
+                if image_path is not None:
+                    result = self._format_file_result(image_path, serializable_metadata,
+                                                      model_params['output_format'], response_mode)
+                else:
+                    result = self._format_result(image_bytes, serializable_metadata,
+                                                 model_params['output_format'], response_mode)
+
+            # Only now: writing a 'url' result can still fail
             self.history_manager.add_entry(HistoryItem(
                 input_filename=input_filename_for_history,
                 settings_used=model_params,
                 status="Success"
             ))
-
-            serializable_metadata = {k: str(v) for k, v in fits_data_obj.header.items()}
-
-            return {"imageData": image_data, "metadata": serializable_metadata}, None
+            status = "Success"
+            return result, None
 
         except Exception as e:
             self.history_manager.add_entry(HistoryItem(
@@ -119,6 +185,203 @@ class AppController:
                 status="Failure"
             ))
             return None, str(e)
+        finally:
+            spooled.close()
+            self._observe_request(model_params, status, time.perf_counter() - started)
+
+    def _observe_request(self, model_params, status, seconds):
+        """Record the request latency; unknown palettes and stretches share a label."""
+        palette = model_params.get('palette', 'natural')
+        stretch = model_params.get('stretch_name', 'power')
+        REQUEST_SECONDS.observe(seconds, palette=palette if palette in MODELS else 'other',
+                                stretch=stretch if stretch in STRETCH_CURVES else 'other',
+                                status=status)
+
+    def preview_layers(self, layers, model_params):
+        """
+        Quick low-resolution look at the layers, meant to be shown while the
+        full render runs: a strided read down to PREVIEW_MAX_SIZE, no denoising,
+        JPEG output. Previews are neither cached nor recorded in the history.
+
+        Args:
+            layers: dict channel -> FITS file path or binary file object
+            model_params: the request parameters of the full render (not modified)
+        """
+        try:
+            preview_params = dict(model_params, use_denoising=False, percentile_method='subsample',
+                                  output_format=PREVIEW_FORMAT, quality=PREVIEW_QUALITY)
+            self._apply_defaults(preview_params)
+
+            # Strided reads only touch the rows that end up in the preview
+            downsampler = Downsampler(mode='stride', max_size=PREVIEW_MAX_SIZE)
+            fits_data_obj = self.fits_loader.load_cube(
+                [layers['red'], layers['green'], layers['blue']], downsampler=downsampler)
+            processed_image = self.image_processor.process_image(fits_data_obj, preview_params)
+            image_bytes = processed_image.export_to(PREVIEW_FORMAT, quality=PREVIEW_QUALITY)
+
+            serializable_metadata = {k: str(v) for k, v in fits_data_obj.header.items()}
+            return self._format_result(image_bytes, serializable_metadata, PREVIEW_FORMAT, 'json'), None
+
+        except Exception as e:
+            return None, str(e)
+
+    def _spool_uploads(self, files, stack):
+        """
+        Returns dict channel -> UploadSpool. Uploads parsed by the app already
+        are spools; other streams are spooled here and closed with `stack`.
+        """
+        spools = {}
+        for channel, file_storage in files.items():
+            stream = file_storage.stream
+            if isinstance(stream, UploadSpool):
+                spools[channel] = stream
+            else:
+                spools[channel] = stack.enter_context(UploadSpool.from_stream(stream))
+        return spools
+
+    def _use_streaming(self, shape, downsampler, model_params):
+        """Stream when asked to, or when the output exceeds STREAM_MIN_PIXELS in a streamable format."""
+        if model_params['streaming'] is not None:
+            if model_params['streaming'] and model_params['output_format'] not in STREAMING_FORMATS:
+                raise ValueError(f"Streaming needs one of the output formats {STREAMING_FORMATS}")
+            return model_params['streaming']
+        height, width = downsampler.output_shape(shape)
+        return height * width > STREAM_MIN_PIXELS and model_params['output_format'] in STREAMING_FORMATS
+
+    def _stream_to_file(self, sections, shape, downsampler, model_params, progress):
+        """Render into a temporary file next to the URL results; returns its path."""
+        tmp_path = os.path.join(STATIC_FOLDER, RESULTS_SUBFOLDER,
+                                f"stream.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, 'wb') as f:
+                self.image_processor.stream_image(sections, shape, downsampler, model_params, f,
+                                                  progress=progress)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    def _format_file_result(self, image_path, metadata, output_format, response_mode):
+        """
+        _format_result for an image rendered into the temporary file `image_path`
+        (which is consumed). For 'url' the file is moved into place without
+        being read into memory; streamed images skip the result cache.
+        """
+        if response_mode != 'url':
+            with open(image_path, 'rb') as f:
+                image_bytes = f.read()
+            os.remove(image_path)
+            return self._format_result(image_bytes, metadata, output_format, response_mode)
+
+        mimetype, extension = OUTPUT_FORMATS[output_format]
+        etag = ResultCache.file_digest(image_path)
+        filename = f"{etag}.{extension}"
+        self.url_results.put_file(filename, image_path)
+        return {"imageUrl": f"/static/{RESULTS_SUBFOLDER}/{filename}", "mimetype": mimetype,
+                "etag": etag, "metadata": metadata}
+
+    def _format_result(self, image_bytes, metadata, output_format, response_mode):
+        """
+        Shape the encoded image for the requested response mode:
+
+        - 'json': base64 data URI in `imageData` (the original API)
+        - 'binary': the raw encoded bytes in `image_bytes`, sent as the response body
+        - 'url': the image is written to STATIC_FOLDER and `imageUrl` points at it
+
+        Every mode carries the `mimetype` and an `etag` (SHA-256 of the encoded
+        image) for conditional requests.
+        """
+        mimetype, extension = OUTPUT_FORMATS[output_format]
+        etag = hashlib.sha256(image_bytes).hexdigest()
+        if response_mode == 'binary':
+            return {"image_bytes": image_bytes, "mimetype": mimetype, "etag": etag,
+                    "metadata": metadata}
+        if response_mode == 'url':
+            # Named by content, so an existing file is already the right image
+            filename = f"{etag}.{extension}"
+            filepath = os.path.join(STATIC_FOLDER, RESULTS_SUBFOLDER, filename)
+            if not (self.url_results.touch(filename) and os.path.exists(filepath)):
+                tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(image_bytes)
+                self.url_results.put_file(filename, tmp_path)
+            return {"imageUrl": f"/static/{RESULTS_SUBFOLDER}/{filename}", "mimetype": mimetype,
+                    "etag": etag, "metadata": metadata}
+        return {"imageData": self._to_data_uri(image_bytes, mimetype), "mimetype": mimetype,
+                "etag": etag, "metadata": metadata}
+
+    def _apply_defaults(self, model_params):
+        """Fill in every processing setting the request did not specify (in place)."""
+        # Downsampling settings: anti-aliased 4x block mean unless requested otherwise
+        model_params['downsample_mode'] = model_params.get('downsample_mode', 'mean')
+        model_params['downsample_factor'] = model_params.get('downsample_factor', 4)
+        model_params['max_size'] = model_params.get('max_size')
+
+        # Get palette from frontend, or default to 'natural'
+        selected_palette = model_params.get('palette', 'natural')
+        palette_config = MODELS.get(selected_palette, MODELS['natural'])
+
+        # Set channel mappings based on selected palette
+        model_params['red_channel'] = palette_config['red_channel']
+        model_params['green_channel'] = palette_config['green_channel']
+        model_params['blue_channel'] = palette_config['blue_channel']
+
+        # Enhanced stretch parameters based on reference code
+        model_params['stretch_name'] = model_params.get('stretch_name', 'power')
+        model_params['power'] = model_params.get('power', 2.4)
+        model_params['black_point'] = model_params.get('black_point', 0.5)
+        model_params['white_point'] = model_params.get('white_point', 99.8)
+        model_params['saturation'] = model_params.get('saturation', 1.3)
+        model_params['red_scale'] = model_params.get('red_scale', 1.0)
+        model_params['green_scale'] = model_params.get('green_scale', 1.0)
+        model_params['blue_scale'] = model_params.get('blue_scale', 1.0)
+        model_params['percentile_method'] = model_params.get('percentile_method', PERCENTILE_METHOD)
+        if model_params['percentile_method'] not in PERCENTILE_METHODS:
+            raise ValueError(f"Unknown percentile method '{model_params['percentile_method']}', "
+                             f"expected one of {PERCENTILE_METHODS}")
+        model_params['saturation_mode'] = model_params.get('saturation_mode', SATURATION_MODE)
+        if model_params['saturation_mode'] not in SATURATION_MODES:
+            raise ValueError(f"Unknown saturation mode '{model_params['saturation_mode']}', "
+                             f"expected one of {SATURATION_MODES}")
+        model_params['stretch_mode'] = model_params.get('stretch_mode', STRETCH_MODE)
+        if model_params['stretch_mode'] not in STRETCH_MODES:
+            raise ValueError(f"Unknown stretch mode '{model_params['stretch_mode']}', "
+                             f"expected one of {STRETCH_MODES}")
+        
+        # ML Denoising parameter (new!)
+        model_params['use_denoising'] = model_params.get('use_denoising', True)
+
+        # Output encoding: format plus quality (jpeg/webp) or zlib level (png)
+        model_params['output_format'] = model_params.get('output_format', 'png').lower()
+        if model_params['output_format'] not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{model_params['output_format']}', "
+                             f"expected one of {tuple(OUTPUT_FORMATS)}")
+        model_params['quality'] = model_params.get('quality', JPEG_QUALITY)
+        # Strip-by-strip rendering: True/False, or None to decide by size (STREAM_MIN_PIXELS)
+        model_params['streaming'] = model_params.get('streaming')
+        model_params['compress_level'] = model_params.get('compress_level', PNG_COMPRESS_LEVEL)
+
+    def _to_data_uri(self, image_bytes, mimetype='image/png'):
+        img_str = base64.b64encode(image_bytes).decode("utf-8")
+        return f"data:{mimetype};base64,{img_str}"
+
+    def get_cache_stats(self):
+        """Hit/miss counters of the result and denoised-cube caches (None if disabled)."""
+        return {
+            "results": self.result_cache.stats() if self.result_cache is not None else None,
+            "denoised": self.image_processor.get_cache_stats(),
+        }
+
+    def warm_up(self):
+        """Import torch and load the denoising model before the first request."""
+        self.image_processor.preload_models()
 
     def get_history(self):
-        return self.history_manager.get_history()
\ No newline at end of file
+        return self.history_manager.get_history()
+
+    def query_history(self, **query):
+        """One page of the history, see HistoryManager.query."""
+        return self.history_manager.query(**query)
+
+    def history_version(self):
+        return self.history_manager.version()
\ No newline at end of file
@@ -2,7 +2,27 @@ import numpy as np
 import torch
 import torch.nn as nn
 from torch.utils.data import DataLoader
+from torch.nn.utils.fusion import fuse_conv_bn_eval
+import contextlib
+import copy
 import os
+import warnings
+from model_registry import registry as model_registry
+from parallel import parallel_map, TORCH_THREADS
+
+NUM_LAYERS = 17
+
+# Inference backends AstronomicalDenoiser can run on
+DENOISER_BACKENDS = ('eager', 'torchscript', 'onnx')
+ARTIFACT_SUFFIXES = {'torchscript': '.torchscript.pt', 'onnx': '.onnx'}
+
+# Numeric precisions for CPU inference; reduced ones are opt-in
+DENOISER_PRECISIONS = ('fp32', 'bf16', 'int8')
+
+# Cap the network's intra-op threads so it does not compete with the channel pool
+# and concurrent jobs for cores (see parallel.py)
+if TORCH_THREADS > 0:
+    torch.set_num_threads(TORCH_THREADS)
 
 class DnCNN(nn.Module):
     """DnCNN denoising network for astronomical images."""
@@ -29,17 +49,169 @@ class DnCNN(nn.Module):
         return x - out  # Residual learning
 
 
-class AstronomicalDenoiser:
-    """Handles ML-based denoising of FITS data."""
+def fuse_dncnn(model):
+    """Return an eval-mode copy of `model` with each BatchNorm folded into the conv before it."""
+    fused = copy.deepcopy(model).eval()
+    layers = []
+    for layer in fused.dncnn:
+        if isinstance(layer, nn.BatchNorm2d) and layers and isinstance(layers[-1], nn.Conv2d):
+            layers[-1] = fuse_conv_bn_eval(layers[-1], layer)
+        else:
+            layers.append(layer)
+    fused.dncnn = nn.Sequential(*layers)
+    return fused
+
+
+class QuantizableDnCNN(nn.Module):
+    """Fused DnCNN body between quant/dequant stubs; the residual stays in float."""
+    def __init__(self, model):
+        super(QuantizableDnCNN, self).__init__()
+        self.quant = torch.ao.quantization.QuantStub()
+        self.dncnn = fuse_dncnn(model).dncnn
+        self.dequant = torch.ao.quantization.DeQuantStub()
     
-    def __init__(self, model_path='models/dncnn_astro.pth'):
-        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-        self.model = DnCNN(channels=1, num_of_layers=17)
+    def forward(self, x):
+        out = self.dequant(self.dncnn(self.quant(x)))
+        return x - out
+
+
+def quantize_dncnn(model, calibration_batches):
+    """
+    Post-training static int8 quantization of the DnCNN convs.
+
+    Args:
+        model: eval-mode DnCNN on the CPU
+        calibration_batches: iterable of (N, 1, H, W) float tensors used to
+            observe activation ranges
+
+    Returns:
+        Quantized module with the same forward signature as DnCNN.
+    """
+    import torch.ao.quantization
+    
+    engines = torch.backends.quantized.supported_engines
+    engine = next(e for e in ('x86', 'fbgemm', 'onednn', 'qnnpack') if e in engines)
+    torch.backends.quantized.engine = engine
+    
+    with warnings.catch_warnings():
+        # torch.ao eager-mode quantization emits migration notices
+        warnings.simplefilter('ignore')
+        qmodel = QuantizableDnCNN(model).eval()
+        layers = qmodel.dncnn
+        conv_relu_pairs = [[f'dncnn.{i}', f'dncnn.{i + 1}'] for i in range(len(layers) - 1)
+                           if isinstance(layers[i], nn.Conv2d) and isinstance(layers[i + 1], nn.ReLU)]
+        torch.ao.quantization.fuse_modules(qmodel, conv_relu_pairs, inplace=True)
+        
+        qmodel.qconfig = torch.ao.quantization.get_default_qconfig(engine)
+        torch.ao.quantization.prepare(qmodel, inplace=True)
+        with torch.no_grad():
+            for batch in calibration_batches:
+                qmodel(batch)
+        torch.ao.quantization.convert(qmodel, inplace=True)
+    return qmodel
+
+
+def bf16_supported():
+    """Whether this CPU has native bfloat16 kernels."""
+    return torch.backends.mkldnn.is_available() and torch.ops.mkldnn._is_mkldnn_bf16_supported()
+
+
+def psnr(reference, test, data_range=1.0):
+    """Peak signal-to-noise ratio in dB between two arrays."""
+    mse = np.mean((np.asarray(reference, dtype=np.float64) - np.asarray(test, dtype=np.float64)) ** 2)
+    if mse == 0:
+        return float('inf')
+    return 10 * np.log10(data_range ** 2 / mse)
+
+
+def reference_images(count=4, size=128, seed=0):
+    """Deterministic synthetic star fields in [0, 1] for calibration and accuracy checks."""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:size, 0:size]
+    images = []
+    for _ in range(count):
+        image = rng.normal(0.1, 0.02, (size, size))
+        for _ in range(20):
+            cy, cx = rng.uniform(0, size, 2)
+            width = rng.uniform(1.0, 6.0)
+            image += rng.uniform(0.1, 0.8) * np.exp(-((x - cx) ** 2 + (y - cy) ** 2) / (2 * width ** 2))
+        images.append(np.clip(image, 0, 1).astype(np.float32))
+    return images
+
+
+def default_artifact_path(model_path, backend):
+    """Where the exported artifact for `backend` lives next to the weights."""
+    base, _ = os.path.splitext(model_path)
+    return base + ARTIFACT_SUFFIXES[backend]
+
+
+def load_dncnn(model_path, device='cpu'):
+    """DnCNN in eval mode with the weights in `model_path`; raises instead of using random weights."""
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(f"no weights at {model_path} to export from")
+    model = DnCNN(channels=1, num_of_layers=NUM_LAYERS)
+    model.load_state_dict(torch.load(model_path, map_location=device))
+    model.to(device)
+    model.eval()
+    return model
+
+
+def export_dncnn(model, output_path, backend='torchscript'):
+    """
+    Fuse Conv+BN and write an inference-only artifact.
+
+    Args:
+        model: DnCNN with loaded weights
+        output_path: file to write
+        backend: 'torchscript' (frozen traced module) or 'onnx'
+    """
+    if backend not in ARTIFACT_SUFFIXES:
+        raise ValueError(f"Cannot export backend '{backend}', expected one of {tuple(ARTIFACT_SUFFIXES)}")
+    
+    fused = fuse_dncnn(model).cpu()
+    # The network is fully convolutional, so any example size works
+    example = torch.rand(1, 1, 64, 64)
+    
+    os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+    with torch.no_grad():
+        if backend == 'torchscript':
+            traced = torch.jit.freeze(torch.jit.trace(fused, example))
+            torch.jit.save(traced, output_path)
+        else:
+            dynamic = {0: 'batch', 2: 'height', 3: 'width'}
+            torch.onnx.export(fused, (example,), output_path, dynamo=False,
+                              input_names=['input'], output_names=['output'],
+                              dynamic_axes={'input': dynamic, 'output': dynamic},
+                              external_data=False)
+    print(f"✓ Exported fused {backend} denoiser to {output_path}")
+
+
+class DenoiserEngine:
+    """A loaded DnCNN ready for inference with one backend and precision."""
+    
+    def __init__(self, model_path, device, backend='eager', artifact_path=None, precision='fp32',
+                 min_psnr=40.0, reference_set=None):
+        self.device = device
+        self.backend = backend
+        self.model = None
+        self.session = None  # onnxruntime session for the 'onnx' backend
+        self.precision = 'fp32'
+        
+        if backend == 'eager':
+            self.model = self._load_eager(model_path)
+        else:
+            self._load_exported(model_path, artifact_path or default_artifact_path(model_path, backend))
+        
+        if precision != 'fp32':
+            self._enable_precision(precision, min_psnr, reference_set)
+    
+    def _load_eager(self, model_path):
+        """Build DnCNN and load pre-trained weights if available."""
+        model = DnCNN(channels=1, num_of_layers=NUM_LAYERS)
         
-        # Load pre-trained weights if available
         if os.path.exists(model_path):
             try:
-                self.model.load_state_dict(torch.load(model_path, map_location=self.device))
+                model.load_state_dict(torch.load(model_path, map_location=self.device))
                 print(f"✓ Loaded pre-trained denoising model from {model_path}")
             except Exception as e:
                 print(f"⚠ Could not load model weights: {e}")
@@ -49,34 +221,257 @@ class AstronomicalDenoiser:
             print("  Using randomly initialized model")
             print("  Download pre-trained weights from: https://github.com/cszn/DnCNN")
         
-        self.model.to(self.device)
-        self.model.eval()
+        model.to(self.device)
+        model.eval()
+        return model
     
-    def denoise_channel(self, data):
-        """Denoise a single 2D channel."""
+    @staticmethod
+    def _artifact_stale(model_path, artifact_path):
+        """
+        True when the artifact is missing or older than the weights. Without
+        weights an existing artifact is used as is.
+        """
+        if not os.path.exists(artifact_path):
+            return True
+        return os.path.exists(model_path) and os.path.getmtime(artifact_path) < os.path.getmtime(model_path)
+    
+    def _load_exported(self, model_path, artifact_path):
+        """Load a TorchScript or ONNX artifact, exporting it first if needed."""
+        try:
+            if self.backend == 'onnx':
+                import onnxruntime as ort
+            
+            if self._artifact_stale(model_path, artifact_path):
+                print(f"⚠ No up-to-date {self.backend} artifact at {artifact_path}, exporting from weights")
+                export_dncnn(load_dncnn(model_path, self.device), artifact_path, self.backend)
+            
+            if self.backend == 'torchscript':
+                self.model = torch.jit.load(artifact_path, map_location=self.device)
+                self.model.eval()
+            else:
+                self.session = ort.InferenceSession(artifact_path, providers=['CPUExecutionProvider'])
+            print(f"✓ Loaded {self.backend} denoiser from {artifact_path}")
+        except Exception as e:
+            print(f"⚠ Could not use the {self.backend} backend: {e}")
+            print("  Falling back to the eager PyTorch model")
+            self.backend = 'eager'
+            self.session = None
+            self.model = self._load_eager(model_path)
+    
+    def _enable_precision(self, precision, min_psnr, reference_set):
+        """Switch to a reduced precision if it is supported and accurate enough."""
+        if self.backend != 'eager' or self.device.type != 'cpu':
+            print(f"⚠ {precision} precision needs the eager backend on the CPU, using fp32")
+            return
+        if precision == 'bf16' and not bf16_supported():
+            print("⚠ This CPU has no bfloat16 support, using fp32")
+            return
+        
+        references = reference_set if reference_set is not None else reference_images()
+        batches = [np.ascontiguousarray(image, dtype=np.float32)[np.newaxis] for image in references]
+        expected = [self.run(batch) for batch in batches]
+        
+        fp32_model = self.model
+        if precision == 'int8':
+            self.model = quantize_dncnn(fp32_model, [torch.from_numpy(b).unsqueeze(1) for b in batches])
+        self.precision = precision
+        
+        score = min(psnr(e, self.run(b)) for e, b in zip(expected, batches))
+        if score < min_psnr:
+            print(f"⚠ {precision} denoiser PSNR {score:.1f} dB is below {min_psnr} dB, using fp32")
+            self.model = fp32_model
+            self.precision = 'fp32'
+        else:
+            print(f"✓ Using {precision} denoiser (PSNR {score:.1f} dB vs fp32)")
+    
+    def _autocast(self):
+        """bfloat16 autocast context for the 'bf16' precision."""
+        if self.precision == 'bf16':
+            return torch.autocast('cpu', dtype=torch.bfloat16)
+        return contextlib.nullcontext()
+    
+    def run(self, batch):
+        """Run the network on a normalized (N, H, W) batch in one forward pass."""
+        if self.session is not None:
+            return self.session.run(None, {'input': batch[:, np.newaxis]})[0][:, 0]
+        
+        tensor_data = torch.from_numpy(batch).unsqueeze(1)
+        tensor_data = tensor_data.to(self.device)
+        
+        with torch.no_grad(), self._autocast():
+            denoised = self.model(tensor_data)
+        
+        return denoised.float().cpu()[:, 0].numpy()
+
+
+class AstronomicalDenoiser:
+    """Handles ML-based denoising of FITS data."""
+    
+    def __init__(self, model_path='models/dncnn_astro.pth', tile_size=256, tile_overlap=None,
+                 backend='eager', artifact_path=None, precision='fp32', min_psnr=40.0,
+                 reference_set=None):
+        """
+        The network itself is loaded lazily on first use and shared through
+        the process-wide model registry, so denoisers with the same model
+        path, device, backend and precision reuse one set of weights.
+        
+        Args:
+            model_path: path to the DnCNN state dict
+            tile_size: edge length of the tiles the image is split into for
+                inference (None runs the whole channel at once)
+            tile_overlap: halo of context pixels added around each tile.
+                Defaults to the network's receptive radius, which makes the
+                tiled result identical to whole-image inference.
+            backend: 'eager' (PyTorch module), 'torchscript' or 'onnx'
+                (onnxruntime on CPU). The last two run a Conv+BN fused export.
+            artifact_path: exported model for the torchscript/onnx backends;
+                defaults to the weights path with a backend suffix. It is
+                exported from the weights on first use if missing.
+            precision: 'fp32', 'bf16' (autocast, needs CPU support) or 'int8'
+                (static quantization). Reduced precisions need the eager
+                backend on the CPU.
+            min_psnr: accuracy guard; a reduced precision whose output is
+                below this PSNR (dB) versus fp32 on the reference set is
+                rejected and fp32 is used instead
+            reference_set: list of 2D images in [0, 1] used for int8
+                calibration and the accuracy guard (synthetic by default).
+                A denoiser with a custom reference set gets a private model.
+        """
+        if backend not in DENOISER_BACKENDS:
+            raise ValueError(f"Unknown denoiser backend '{backend}', expected one of {DENOISER_BACKENDS}")
+        if precision not in DENOISER_PRECISIONS:
+            raise ValueError(f"Unknown precision '{precision}', expected one of {DENOISER_PRECISIONS}")
+        
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        self.model_path = model_path
+        self.artifact_path = artifact_path or (
+            default_artifact_path(model_path, backend) if backend != 'eager' else None)
+        self.requested_backend = backend
+        self.requested_precision = precision
+        self.min_psnr = min_psnr
+        self.reference_set = reference_set
+        self._engine = None
+        
+        # Each 3x3 conv widens the receptive field by one pixel on every side
+        self.receptive_radius = NUM_LAYERS
+        self.tile_size = tile_size
+        self.tile_overlap = self.receptive_radius if tile_overlap is None else tile_overlap
+        if self.tile_overlap < self.receptive_radius:
+            print(f"⚠ tile_overlap={self.tile_overlap} is smaller than the receptive radius "
+                  f"({self.receptive_radius}px), tile seams may be visible")
+    
+    @property
+    def registry_key(self):
+        """Identifies the loaded model in the process-wide registry."""
+        artifact = os.path.abspath(self.artifact_path) if self.artifact_path else None
+        return ('dncnn', os.path.abspath(self.model_path), str(self.device), self.requested_backend,
+                artifact, self.requested_precision, self.min_psnr)
+    
+    def _load_engine(self):
+        return DenoiserEngine(self.model_path, self.device, backend=self.requested_backend,
+                              artifact_path=self.artifact_path, precision=self.requested_precision,
+                              min_psnr=self.min_psnr, reference_set=self.reference_set)
+    
+    @property
+    def engine(self):
+        """The loaded network, fetched from the registry on first use."""
+        if self._engine is None:
+            if self.reference_set is not None:
+                self._engine = self._load_engine()
+            else:
+                self._engine = model_registry.get(self.registry_key, self._load_engine)
+        return self._engine
+    
+    def preload(self):
+        """Load the network now instead of on the first denoise call."""
+        self.engine
+        return self
+    
+    @property
+    def model(self):
+        return self.engine.model
+    
+    @property
+    def backend(self):
+        return self.engine.backend
+    
+    @property
+    def precision(self):
+        return self.engine.precision
+    
+    def _run_model(self, batch):
+        """Run the network on a normalized (N, H, W) batch in one forward pass."""
+        return self.engine.run(batch)
+    
+    def _tiles(self, height, width):
+        """
+        Yield (core, padded) windows covering the image.
+
+        `core` is the (top, bottom, left, right) region a tile is responsible
+        for, `padded` the same region grown by the halo and clamped to the
+        image. Only the core of each result is kept, so neighbouring tiles
+        never overlap in the output and no seams appear as long as the halo
+        covers the receptive field.
+        """
+        tile = self.tile_size
+        halo = self.tile_overlap
+        for top in range(0, height, tile):
+            bottom = min(top + tile, height)
+            for left in range(0, width, tile):
+                right = min(left + tile, width)
+                padded = (max(top - halo, 0), min(bottom + halo, height),
+                          max(left - halo, 0), min(right + halo, width))
+                yield (top, bottom, left, right), padded
+    
+    def _denoise_tiled(self, normalized):
+        """
+        Denoise a normalized (N, H, W) stack with a fixed memory ceiling.
+
+        The same tile of every layer is batched into a single forward pass.
+        """
+        _, height, width = normalized.shape
+        if self.tile_size is None or (height <= self.tile_size and width <= self.tile_size):
+            return self._run_model(np.ascontiguousarray(normalized))
+        
+        denoised = np.empty(normalized.shape, dtype=np.float32)
+        for (top, bottom, left, right), (p_top, p_bottom, p_left, p_right) in self._tiles(height, width):
+            tiles = np.ascontiguousarray(normalized[:, p_top:p_bottom, p_left:p_right])
+            result = self._run_model(tiles)
+            denoised[:, top:bottom, left:right] = result[:, top - p_top:bottom - p_top,
+                                                         left - p_left:right - p_left]
+        return denoised
+    
+    def _normalize(self, data):
+        """
+        Clean a 2D channel and scale it to [0, 1] for the model.
+
+        Returns (cleaned, normalized, data_min, data_range); `normalized` is
+        None for flat channels, which cannot be normalized.
+        """
+        # Integer channels in float32: their range and offset would wrap around
+        if not np.issubdtype(data.dtype, np.floating):
+            data = data.astype(np.float32)
         # Handle NaN and inf
         data = np.nan_to_num(data, nan=0.0, posinf=0.0, neginf=0.0)
         
-        # Normalize to [0, 1] range for the model
         data_min = data.min()
         data_max = data.max()
         data_range = data_max - data_min
         
         if data_range == 0:
-            return data  # Avoid division by zero
-        
-        normalized = (data - data_min) / data_range
-        
-        # Convert to tensor
-        tensor_data = torch.from_numpy(normalized).float().unsqueeze(0).unsqueeze(0)
-        tensor_data = tensor_data.to(self.device)
+            return data, None, data_min, data_range  # Avoid division by zero
         
-        # Denoise
-        with torch.no_grad():
-            denoised = self.model(tensor_data)
+        normalized = ((data - data_min) / data_range).astype(np.float32)
+        return data, normalized, data_min, data_range
+    
+    def denoise_channel(self, data):
+        """Denoise a single 2D channel."""
+        data, normalized, data_min, data_range = self._normalize(data)
+        if normalized is None:
+            return data
         
-        # Convert back to numpy
-        denoised = denoised.cpu().squeeze().numpy()
+        # Denoise tile by tile to keep activation memory bounded
+        denoised = self._denoise_tiled(normalized[np.newaxis])[0]
         
         # Denormalize
         denoised = denoised * data_range + data_min
@@ -87,6 +482,9 @@ class AstronomicalDenoiser:
         """
         Denoise a 3D FITS data cube (multiple channels).
         
+        All non-flat channels are normalized individually and run through
+        the network together as one batch.
+        
         Args:
             fits_data: numpy array of shape (channels, height, width)
         
@@ -96,11 +494,77 @@ class AstronomicalDenoiser:
         if fits_data.ndim != 3:
             raise ValueError("Expected 3D data cube (channels, height, width)")
         
-        denoised_cube = np.zeros_like(fits_data)
+        # Integer cubes come out as float32: the denoised values are not whole numbers
+        dtype = fits_data.dtype if np.issubdtype(fits_data.dtype, np.floating) else np.float32
+        denoised_cube = np.zeros(fits_data.shape, dtype=dtype)
+        
+        # Normalize each channel straight into its slot of one preallocated (N, H, W)
+        # batch; the channels are independent, so they run on the channel pool
+        batch = np.empty(fits_data.shape, dtype=np.float32)
+        def normalize_channel(i):
+            # A float copy first: min/range/subtract would wrap around in the integer dtype
+            data = fits_data[i].astype(dtype)
+            np.nan_to_num(data, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+            data_min = data.min()
+            data_range = data.max() - data_min
+            if data_range == 0:
+                denoised_cube[i] = data  # Flat channels cannot be normalized
+                return None
+            np.subtract(data, data_min, out=data)
+            np.divide(data, data_range, out=batch[i])
+            return data_min, data_range
+        
+        stats = parallel_map(normalize_channel, range(fits_data.shape[0]))
+        batch_indices = [i for i, channel_stats in enumerate(stats) if channel_stats is not None]
+        if not batch_indices:
+            return denoised_cube
+        if len(batch_indices) < fits_data.shape[0]:
+            batch = batch[batch_indices]
+        
+        print(f"  Denoising {len(batch_indices)}/{fits_data.shape[0]} channels in one batch...")
+        denoised = self._denoise_tiled(batch)
+        
+        def denormalize_channel(slot):
+            i = batch_indices[slot]
+            data_min, data_range = stats[i]
+            np.multiply(denoised[slot], data_range, out=denoised_cube[i])
+            np.add(denoised_cube[i], data_min, out=denoised_cube[i])
+        
+        parallel_map(denormalize_channel, range(len(batch_indices)))
+        
+        return denoised_cube
+    
+    def denoise_window(self, window, stats):
+        """
+        Denoise an (N, H, W) window of rows cut from larger channels.
+        
+        Each channel is normalized with the (data_min, data_range) of the whole
+        channel, as denoise_fits_cube would, so rows with at least
+        `tile_overlap` rows of context above and below in the window come out
+        the same as when denoising the full cube.
+        
+        Args:
+            window: numpy array of shape (channels, rows, width)
+            stats: per channel, (data_min, data_range) of the NaN-cleaned
+                full channel
+        
+        Returns:
+            Denoised float32 array of the window's shape
+        """
+        window = np.nan_to_num(window, nan=0.0, posinf=0.0, neginf=0.0)
+        denoised = window.astype(np.float32)
+        active = [i for i, (data_min, data_range) in enumerate(stats) if data_range != 0]
+        if not active:
+            return denoised
+        
+        batch = np.empty((len(active),) + window.shape[1:], dtype=np.float32)
+        for slot, i in enumerate(active):
+            data_min, data_range = stats[i]
+            batch[slot] = (window[i] - data_min) / data_range
         
-        # Denoise each channel separately
-        for i in range(fits_data.shape[0]):
-            print(f"  Denoising channel {i+1}/{fits_data.shape[0]}...")
-            denoised_cube[i] = self.denoise_channel(fits_data[i])
+        result = self._denoise_tiled(batch)
+        for slot, i in enumerate(active):
+            data_min, data_range = stats[i]
+            denoised[i] = result[slot] * data_range + data_min
         
-        return denoised_cube
\ No newline at end of file
+        return denoised
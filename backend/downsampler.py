@@ -0,0 +1,114 @@
+import math
+import numpy as np
+from PIL import Image
+
+DOWNSAMPLE_MODES = ('stride', 'mean', 'median', 'area')
+
+class Downsampler:
+    """
+    Reduces 2D image layers chunk by chunk so peak memory stays bounded.
+
+    Modes:
+        stride: keep every n-th pixel (fast, but aliases and drops photons)
+        mean:   block average via reshape-sum (anti-aliased, flux preserving)
+        median: block median (robust against cosmic rays and hot pixels)
+        area:   area-weighted resampling, supports non-integer scales
+    """
+
+    def __init__(self, mode='mean', factor=1, max_size=None, chunk_rows=256):
+        if mode not in DOWNSAMPLE_MODES:
+            raise ValueError(f"Unknown downsample mode '{mode}', expected one of {DOWNSAMPLE_MODES}")
+        if factor < 1:
+            raise ValueError("downsample factor must be >= 1")
+        if max_size is not None and max_size < 1:
+            raise ValueError("max_size must be >= 1")
+        self.mode = mode
+        self.factor = factor
+        self.max_size = max_size
+        # Number of *output* rows produced per chunk
+        self.chunk_rows = chunk_rows
+
+    def _scale(self, shape):
+        """Input pixels per output pixel along each axis."""
+        if self.max_size is None:
+            return float(self.factor)
+        # Only ever shrink: a target larger than the image means full resolution
+        return max(1.0, max(shape) / self.max_size)
+
+    def _block_factor(self, shape):
+        """Integer block size used by the stride/mean/median modes."""
+        factor = math.ceil(self._scale(shape) - 1e-9)
+        return max(1, min(factor, min(shape)))
+
+    def output_shape(self, shape):
+        """Return the (height, width) that `downsample_into` will produce."""
+        height, width = shape
+        if self.mode == 'area':
+            scale = self._scale(shape)
+            return max(1, round(height / scale)), max(1, round(width / scale))
+
+        factor = self._block_factor(shape)
+        if self.mode == 'stride':
+            return -(-height // factor), -(-width // factor)
+        # Block modes drop the incomplete trailing row/column of blocks
+        return height // factor, width // factor
+
+    def downsample_into(self, source, shape, out):
+        """
+        Downsample `source` into the preallocated array `out`.
+
+        Args:
+            source: anything sliceable as source[rows, cols] -- an ndarray,
+                a memmap or an astropy `hdu.section`
+            shape: (height, width) of the source
+            out: array of shape `output_shape(shape)`
+        """
+        out_height, out_width = out.shape
+        if (out_height, out_width) != self.output_shape(shape):
+            raise ValueError("Output buffer does not match the downsampled shape")
+
+        for out_start in range(0, out_height, self.chunk_rows):
+            out_stop = min(out_start + self.chunk_rows, out_height)
+            out[out_start:out_stop] = self._chunk(source, shape, out_start, out_stop, out_width)
+
+    def downsample_rows(self, source, shape, out_start, out_stop):
+        """Compute only output rows [out_start, out_stop), for callers working strip by strip."""
+        out_width = self.output_shape(shape)[1]
+        return self._chunk(source, shape, out_start, out_stop, out_width)
+
+    def _chunk(self, source, shape, out_start, out_stop, out_width):
+        """Compute output rows [out_start, out_stop) from the source."""
+        height, width = shape
+
+        if self.mode == 'area':
+            scale_y = height / self.output_shape(shape)[0]
+            top = out_start * scale_y
+            bottom = min(out_stop * scale_y, height)
+            row_start = int(math.floor(top))
+            row_stop = min(int(math.ceil(bottom)), height)
+            block = np.asarray(source[row_start:row_stop, :], dtype=np.float32)
+            resized = Image.fromarray(block).resize(
+                (out_width, out_stop - out_start), Image.BOX,
+                box=(0, top - row_start, width, bottom - row_start))
+            return np.asarray(resized)
+
+        factor = self._block_factor(shape)
+        row_start = out_start * factor
+
+        if self.mode == 'stride':
+            row_stop = min(out_stop * factor, height)
+            # Read whole rows and skip columns in memory: a column step on an
+            # hdu.section is read pixel by pixel
+            return np.asarray(source[row_start:row_stop:factor, :])[:, ::factor]
+
+        rows = out_stop - out_start
+        block = np.asarray(source[row_start:row_start + rows * factor, :out_width * factor],
+                           dtype=np.float32)
+        blocks = block.reshape(rows, factor, out_width, factor)
+
+        if self.mode == 'mean':
+            return blocks.sum(axis=(1, 3), dtype=np.float64) / (factor * factor)
+
+        # median: gather each factor x factor block into the last axis
+        blocks = blocks.transpose(0, 2, 1, 3).reshape(rows, out_width, factor * factor)
+        return np.median(blocks, axis=-1)
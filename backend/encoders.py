@@ -0,0 +1,169 @@
+import struct
+import zlib
+import numpy as np
+
+class PNGWriter:
+    """
+    Minimal PNG encoder for 8- or 16-bit RGB images, written row block by row block.
+
+    Pillow cannot write 16-bit RGB PNGs, and it needs the whole image up
+    front. This writer only needs numpy and zlib: rows go through one zlib
+    stream with the "None" filter and are flushed as IDAT chunks.
+    """
+
+    SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+    def __init__(self, stream, width, height, bit_depth=8, compress_level=6):
+        if bit_depth not in (8, 16):
+            raise ValueError(f"Unsupported PNG bit depth {bit_depth}, expected 8 or 16")
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self.bit_depth = bit_depth
+        self.rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._dtype = np.dtype('>u2') if bit_depth == 16 else np.dtype(np.uint8)
+
+        stream.write(self.SIGNATURE)
+        # Color type 2 (RGB), default compression/filter, no interlace
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, bit_depth, 2, 0, 0, 0))
+
+    def _chunk(self, tag, data):
+        self.stream.write(struct.pack('>I', len(data)))
+        self.stream.write(tag)
+        self.stream.write(data)
+        self.stream.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(tag))))
+
+    def write_rows(self, rows):
+        """Append an (N, width, 3) block of rows (uint8 or uint16 matching bit_depth)."""
+        if rows.ndim != 3 or rows.shape[1:] != (self.width, 3):
+            raise ValueError(f"Expected rows of shape (N, {self.width}, 3), got {rows.shape}")
+        if self.rows_written + rows.shape[0] > self.height:
+            raise ValueError("More rows than the image height")
+
+        # Every scanline starts with its filter type byte (0: None)
+        scanlines = np.zeros((rows.shape[0], 1 + self.width * 3 * self._dtype.itemsize), dtype=np.uint8)
+        scanlines[:, 1:] = rows.astype(self._dtype, copy=False).reshape(rows.shape[0], -1).view(np.uint8)
+        compressed = self._compressor.compress(scanlines)
+        if compressed:
+            self._chunk(b'IDAT', compressed)
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        """Finish the zlib stream and write the end chunk."""
+        if self.rows_written != self.height:
+            raise ValueError(f"Wrote {self.rows_written} of {self.height} rows")
+        self._chunk(b'IDAT', self._compressor.flush())
+        self._chunk(b'IEND', b'')
+
+
+def write_png(stream, rgb, compress_level=6):
+    """Write an (H, W, 3) uint8 or uint16 array as an RGB PNG."""
+    bit_depth = 16 if rgb.dtype == np.uint16 else 8
+    writer = PNGWriter(stream, rgb.shape[1], rgb.shape[0], bit_depth, compress_level)
+    writer.write_rows(rgb)
+    writer.close()
+
+
+class TIFFWriter:
+    """
+    Uncompressed little-endian 16-bit RGB TIFF, written row block by row block.
+
+    Baseline TIFF with a single strip; Pillow cannot write 16-bit RGB TIFFs.
+    All tags depend only on the size, so the header goes out first and the
+    pixel data follows as it is produced. Past the 4 GB reach of classic TIFF
+    offsets the file is a BigTIFF (64-bit offsets), unless `bigtiff` says otherwise.
+    """
+
+    # Classic TIFF offsets and byte counts are unsigned 32-bit
+    CLASSIC_LIMIT = 2 ** 32 - 1
+
+    def __init__(self, stream, width, height, bigtiff=None):
+        self.stream = stream
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+
+        data_size = width * height * 3 * 2
+        if bigtiff is None:
+            # The header is under 200 bytes either way
+            bigtiff = data_size + 200 > self.CLASSIC_LIMIT
+        self.bigtiff = bigtiff
+
+        SHORT, LONG, LONG8 = 3, 4, 16
+        num_tags = 10
+        if bigtiff:
+            # BitsPerSample fits in the 8-byte value field, no extra block
+            ifd_offset = 16
+            data_offset = ifd_offset + 8 + num_tags * 20 + 8
+            bits = (16, 16, 16)
+            offset_type = LONG8
+        else:
+            ifd_offset = 8
+            bits_offset = ifd_offset + 2 + num_tags * 12 + 4
+            data_offset = bits_offset + 6
+            bits = bits_offset
+            offset_type = LONG
+
+        tags = [
+            (256, LONG, 1, width),                   # ImageWidth
+            (257, LONG, 1, height),                  # ImageLength
+            (258, SHORT, 3, bits),                   # BitsPerSample -> 16, 16, 16
+            (259, SHORT, 1, 1),                      # Compression: none
+            (262, SHORT, 1, 2),                      # PhotometricInterpretation: RGB
+            (273, offset_type, 1, data_offset),      # StripOffsets
+            (277, SHORT, 1, 3),                      # SamplesPerPixel
+            (278, LONG, 1, height),                  # RowsPerStrip
+            (279, offset_type, 1, data_size),        # StripByteCounts
+            (284, SHORT, 1, 1),                      # PlanarConfiguration: chunky
+        ]
+
+        if bigtiff:
+            stream.write(struct.pack('<2sHHHQ', b'II', 43, 8, 0, ifd_offset))
+            stream.write(struct.pack('<Q', num_tags))
+            for tag, field_type, count, value in tags:
+                # Values are left-justified in the 8-byte value field
+                if field_type == SHORT:
+                    values = value if count == 3 else (value,)
+                    field = struct.pack(f'<{len(values)}H', *values)
+                elif field_type == LONG:
+                    field = struct.pack('<I', value)
+                else:
+                    field = struct.pack('<Q', value)
+                stream.write(struct.pack('<HHQ', tag, field_type, count) + field.ljust(8, b'\0'))
+            stream.write(struct.pack('<Q', 0))  # No further IFDs
+            return
+
+        if data_offset + data_size > self.CLASSIC_LIMIT:
+            raise ValueError(f"A {width}x{height} 16-bit RGB image needs a BigTIFF")
+        stream.write(struct.pack('<2sHI', b'II', 42, ifd_offset))
+        stream.write(struct.pack('<H', num_tags))
+        for tag, field_type, count, value in tags:
+            # Single SHORT values are left-justified in the 4-byte value field
+            if field_type == SHORT and count == 1:
+                stream.write(struct.pack('<HHIHH', tag, field_type, count, value, 0))
+            else:
+                stream.write(struct.pack('<HHII', tag, field_type, count, value))
+        stream.write(struct.pack('<I', 0))  # No further IFDs
+        stream.write(struct.pack('<HHH', 16, 16, 16))
+
+    def write_rows(self, rows):
+        """Append an (N, width, 3) uint16 block of rows."""
+        if rows.ndim != 3 or rows.shape[1:] != (self.width, 3):
+            raise ValueError(f"Expected rows of shape (N, {self.width}, 3), got {rows.shape}")
+        if self.rows_written + rows.shape[0] > self.height:
+            raise ValueError("More rows than the image height")
+        self.stream.write(np.ascontiguousarray(rows, dtype='<u2').tobytes())
+        self.rows_written += rows.shape[0]
+
+    def close(self):
+        """Check that the image is complete (the format has no trailer)."""
+        if self.rows_written != self.height:
+            raise ValueError(f"Wrote {self.rows_written} of {self.height} rows")
+
+
+def write_tiff16(stream, rgb):
+    """Write an (H, W, 3) uint16 array as an uncompressed little-endian RGB TIFF."""
+    writer = TIFFWriter(stream, rgb.shape[1], rgb.shape[0])
+    writer.write_rows(rgb)
+    writer.close()
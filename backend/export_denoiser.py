@@ -0,0 +1,31 @@
+"""
+Export the DnCNN denoiser for inference.
+
+Folds every BatchNorm into the preceding conv and writes a TorchScript
+or ONNX artifact next to the weights, so workers can start with
+DENOISER_BACKEND=torchscript or DENOISER_BACKEND=onnx.
+
+HOW TO RUN:
+    python export_denoiser.py --backend onnx
+"""
+
+import argparse
+from denoiser import ARTIFACT_SUFFIXES, default_artifact_path, export_dncnn, load_dncnn
+
+def main():
+    parser = argparse.ArgumentParser(description="Export a fused DnCNN inference artifact.")
+    parser.add_argument('--model-path', default='models/dncnn_astro.pth', help="DnCNN state dict")
+    parser.add_argument('--backend', choices=sorted(ARTIFACT_SUFFIXES), default='torchscript')
+    parser.add_argument('--output', help="artifact path (default: next to the weights)")
+    args = parser.parse_args()
+
+    # Never export an untrained network: workers would load it as if it were current
+    try:
+        model = load_dncnn(args.model_path)
+    except FileNotFoundError as e:
+        parser.error(str(e))
+    output = args.output or default_artifact_path(args.model_path, args.backend)
+    export_dncnn(model, output, args.backend)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import contextlib
+import numpy as np
+from models import FITSData
+from downsampler import Downsampler
+
+class FITSLoader:
+    """Loads FITS channel layers section by section instead of reading whole arrays."""
+
+    def __init__(self, chunk_rows=256):
+        # Number of *output* rows read from disk per section access
+        self.chunk_rows = chunk_rows
+
+    def _image_shape(self, hdu):
+        """Return (height, width) of an image HDU without touching its data."""
+        shape = hdu.shape
+        if len(shape) != 2:
+            raise ValueError(f"Expected a 2D image layer, got shape {shape}")
+        return shape
+
+    def load_cube(self, sources, downsample_factor=1, downsampler=None):
+        """
+        Load several single-layer FITS files into one downsampled data cube.
+
+        Args:
+            sources: list of file paths (or file objects), one per channel
+            downsample_factor: keep every n-th row and column (used when no
+                downsampler is given)
+            downsampler: optional Downsampler deciding mode and output size
+
+        Returns:
+            FITSData with a float32 cube of shape (channels, height, width)
+            and the header of the first source.
+        """
+        # Imported here so that starting the app does not pay for astropy
+        from astropy.io import fits
+
+        if downsampler is None:
+            downsampler = Downsampler(mode='stride', factor=downsample_factor,
+                                      chunk_rows=self.chunk_rows)
+
+        cube = None
+        header = None
+        first_shape = None
+        for index, source in enumerate(sources):
+            # No explicit memmap=True: astropy's strict memmap refuses scaled data
+            # (BZERO/BSCALE/BLANK, e.g. every uint16 frame). File sources are
+            # memory-mapped by default anyway
+            with fits.open(source, lazy_load_hdus=True) as hdul:
+                hdu = hdul[0]
+                shape = self._image_shape(hdu)
+                out_shape = downsampler.output_shape(shape)
+
+                if cube is None:
+                    cube = np.empty((len(sources),) + out_shape, dtype=np.float32)
+                    header = hdu.header.copy()
+                    first_shape = shape
+                elif shape != first_shape:
+                    raise ValueError("All channel layers must have the same dimensions.")
+
+                # hdu.section only reads the requested rows from disk (or the memmap)
+                downsampler.downsample_into(hdu.section, shape, cube[index])
+
+        return FITSData(data=cube, header=header)
+
+    @contextlib.contextmanager
+    def open_layers(self, sources):
+        """
+        Open several single-layer FITS files without reading their data.
+
+        Yields (sections, shape, header): one `hdu.section` per source to read
+        rows from on demand, their common (height, width) and the header of
+        the first source. The files stay open until the block exits.
+        """
+        from astropy.io import fits
+
+        with contextlib.ExitStack() as stack:
+            sections = []
+            shape = None
+            header = None
+            for source in sources:
+                # Default memmap: see load_cube
+                hdu = stack.enter_context(fits.open(source, lazy_load_hdus=True))[0]
+                if shape is None:
+                    shape = self._image_shape(hdu)
+                    header = hdu.header.copy()
+                elif self._image_shape(hdu) != shape:
+                    raise ValueError("All channel layers must have the same dimensions.")
+                sections.append(hdu.section)
+            yield sections, shape, header
@@ -1,35 +1,378 @@
-
+import atexit
+import contextlib
 import json
 import os
+import sqlite3
+import threading
+import weakref
+from datetime import datetime
 from models import HistoryItem
 
+# SQLite database of the processing history (WAL mode: one writer at a time
+# across processes, readers never blocked)
+HISTORY_DB = os.environ.get('HISTORY_DB', 'history.db')
+# Seconds a write waits for another process holding the database lock
+HISTORY_BUSY_TIMEOUT = float(os.environ.get('HISTORY_BUSY_TIMEOUT', 30))
+# Keep at most this many entries, oldest removed at startup and by compaction (0 keeps all)
+HISTORY_MAX_ENTRIES = int(os.environ.get('HISTORY_MAX_ENTRIES', 0))
+
+# Write-behind: add_entry only queues the entry, a background thread writes queued
+# entries in one transaction once HISTORY_BATCH_SIZE are waiting or after
+# HISTORY_FLUSH_INTERVAL seconds. Set HISTORY_WRITE_BEHIND=0 to write in the request.
+HISTORY_WRITE_BEHIND = os.environ.get('HISTORY_WRITE_BEHIND', '1') == '1'
+HISTORY_BATCH_SIZE = int(os.environ.get('HISTORY_BATCH_SIZE', 100))
+HISTORY_FLUSH_INTERVAL = float(os.environ.get('HISTORY_FLUSH_INTERVAL', 1.0))
+# 'batch': fsync every committed batch; 'periodic': fsync at WAL checkpoints only
+# (a power loss may drop the last batches, never corrupt the database)
+HISTORY_DURABILITY = os.environ.get('HISTORY_DURABILITY', 'periodic')
+HISTORY_DURABILITIES = {'batch': 'FULL', 'periodic': 'NORMAL'}
+
+# The old whole-file JSON history, imported once when the database is created
 HISTORY_FILE = 'history.json'
 
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp TEXT NOT NULL,
+    filename TEXT,
+    status TEXT,
+    settings TEXT
+);
+CREATE INDEX IF NOT EXISTS history_timestamp ON history (timestamp);
+CREATE INDEX IF NOT EXISTS history_status ON history (status);
+CREATE INDEX IF NOT EXISTS history_filename ON history (filename);
+CREATE INDEX IF NOT EXISTS history_palette ON history (json_extract(settings, '$.palette'));
+CREATE TABLE IF NOT EXISTS history_state (version INTEGER NOT NULL);
+INSERT INTO history_state (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM history_state);
+"""
+
+# Keys of the entries returned by HistoryManager.query
+HISTORY_FIELDS = ('id', 'timestamp', 'filename', 'settings', 'status')
+
+# Managers of this process, reset in forked children (e.g. gunicorn --preload workers)
+_managers = weakref.WeakSet()
+# Connections inherited across a fork: SQLite forbids using them in the child, and
+# closing them there could disturb the parent's locks, so they are only kept alive
+_inherited_connections = []
+
+def _after_fork_in_child():
+    for manager in list(_managers):
+        manager._after_fork()
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
 class HistoryManager:
-    """Manages the user's processing history."""
-    def __init__(self):
-        self.history_log = self._load_history()
+    """
+    Manages the user's processing history.
+
+    Entries are rows of an indexed SQLite table, so adding one is a single
+    insert whatever the size of the history, and several processes can
+    write to the same database safely.
+
+    In write-behind mode add_entry returns at once and a writer thread
+    stores the queued entries in batches. Reads flush the queue first, so
+    they always include every entry added before them; close() (also run
+    at interpreter exit) flushes it too.
 
-    def _load_history(self):
-        if not os.path.exists(HISTORY_FILE):
+    A forked child process opens its own connection and starts its own
+    writer thread on first use; entries queued before the fork are written
+    by the parent.
+    """
+    def __init__(self, db_path=None, legacy_file=HISTORY_FILE, max_entries=None, write_behind=None,
+                 batch_size=None, flush_interval=None, durability=None):
+        self.db_path = db_path or HISTORY_DB
+        self.max_entries = HISTORY_MAX_ENTRIES if max_entries is None else max_entries
+        self.write_behind = HISTORY_WRITE_BEHIND if write_behind is None else write_behind
+        self.batch_size = batch_size or HISTORY_BATCH_SIZE
+        self.flush_interval = HISTORY_FLUSH_INTERVAL if flush_interval is None else flush_interval
+        self.durability = durability or HISTORY_DURABILITY
+        if self.durability not in HISTORY_DURABILITIES:
+            raise ValueError(f"Unknown history durability '{self.durability}', "
+                             f"expected one of {tuple(HISTORY_DURABILITIES)}")
+        # Background jobs may log entries from several threads at once
+        self._lock = threading.Lock()
+        # Write-behind queue: rows waiting for the writer thread
+        self._pending = []
+        self._pending_changed = threading.Condition()
+        # Held while a batch is taken and written, so batches land in the order they were queued
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        # Started by the first add_entry, in whichever process that happens
+        self._writer = None
+        self._conn = None
+        self._disconnected = False
+
+        self._initialize(legacy_file)
+        if self.max_entries > 0:
+            self.compact(self.max_entries)
+        _managers.add(self)
+        if self.write_behind:
+            atexit.register(self.close)
+
+    def _after_fork(self):
+        """In a forked child: new locks, no writer thread yet, connect again on first use."""
+        self._lock = threading.Lock()
+        self._pending = []
+        self._pending_changed = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._writer = None
+        if self._conn is not None:
+            _inherited_connections.append(self._conn)
+            self._conn = None
+
+    def _connection(self):
+        """This process's connection, opened on first use (the caller holds the lock)."""
+        if self._conn is None:
+            if self._disconnected:
+                raise ValueError("History manager is closed")
+            self._conn = self._connect()
+        return self._conn
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=HISTORY_BUSY_TIMEOUT, check_same_thread=False,
+                               isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={HISTORY_DURABILITIES[self.durability]}')
+        conn.executescript(_SCHEMA)
+        return conn
+
+    def _initialize(self, legacy_file):
+        """
+        On a new database, import the entries of an old history.json once.
+        user_version marks the database as initialized, so concurrent first
+        starts of several processes import only once.
+        """
+        with self._lock, self._transaction() as conn:
+            if conn.execute('PRAGMA user_version').fetchone()[0] > 0:
+                return
+            rows = self._load_legacy(legacy_file) if legacy_file else []
+            self._insert(rows)
+            self._bump_version()
+            conn.execute('PRAGMA user_version = 1')
+        if rows:
+            print(f"✓ Imported {len(rows)} history entries from {legacy_file}")
+
+    def _load_legacy(self, legacy_file):
+        """Rows of an old history.json, oldest first."""
+        if not os.path.exists(legacy_file):
             return []
-        with open(HISTORY_FILE, 'r') as f:
-            try:
-                return [HistoryItem(**item) for item in json.load(f)]
-            except (json.JSONDecodeError, TypeError):
-                return [] # Return empty list if file is corrupt or not in the expected format
+        try:
+            with open(legacy_file, 'r') as f:
+                return [(entry['timestamp'], entry['filename'], entry['status'], json.dumps(entry['settings']))
+                        for entry in reversed(json.load(f))]
+        except (json.JSONDecodeError, TypeError, KeyError):
+            return [] # Nothing to import if the file is corrupt or not in the expected format
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Write transaction (the caller holds the lock)."""
+        conn = self._connection()
+        # BEGIN IMMEDIATE takes the write lock up front, waiting up to the busy timeout
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def _insert(self, rows):
+        self._connection().executemany(
+            'INSERT INTO history (timestamp, filename, status, settings) VALUES (?, ?, ?, ?)', rows)
+
+    def _bump_version(self):
+        """Mark the history as changed (inside the write transaction)."""
+        self._connection().execute('UPDATE history_state SET version = version + 1')
 
-    def _save_history(self):
-        with open(HISTORY_FILE, 'w') as f:
-            json.dump([item.to_dict() for item in self.history_log], f, indent=2)
+    @staticmethod
+    def _row(item):
+        return (item.timestamp.isoformat(), item.input_filename, item.status,
+                json.dumps(item.settings_used, default=str))
+
+    @staticmethod
+    def _item(row):
+        timestamp, filename, status, settings = row
+        return HistoryItem(input_filename=filename, settings_used=json.loads(settings), status=status,
+                           timestamp=datetime.fromisoformat(timestamp))
 
     def add_entry(self, item):
-        self.history_log.insert(0, item)
-        self._save_history()
+        if not self.write_behind:
+            self._write([self._row(item)])
+            return
+        with self._pending_changed:
+            if self._closed:
+                raise ValueError("History manager is closed")
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='history-writer', daemon=True)
+                self._writer.start()
+            self._pending.append(self._row(item))
+            if len(self._pending) >= self.batch_size:
+                self._pending_changed.notify()
+
+    def _write(self, rows):
+        with self._lock, self._transaction():
+            self._insert(rows)
+            self._bump_version()
+
+    def flush(self):
+        """Write all queued entries now."""
+        with self._flush_lock:
+            with self._pending_changed:
+                rows, self._pending = self._pending, []
+            if not rows:
+                return
+            try:
+                self._write(rows)
+            except Exception:
+                # Keep them for the next flush, ahead of newer entries
+                with self._pending_changed:
+                    self._pending[:0] = rows
+                raise
+
+    def _write_loop(self):
+        """Writer thread: flush when a batch is full or the interval has passed."""
+        while True:
+            with self._pending_changed:
+                self._pending_changed.wait_for(
+                    lambda: self._closed or len(self._pending) >= self.batch_size, self.flush_interval)
+                if self._closed:
+                    return
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠ Could not write {len(self._pending)} history entries, retrying: {e}")
+
+    def _query(self, sql, params=()):
+        self.flush()
+        with self._lock:
+            return self._connection().execute(sql, params).fetchall()
+
+    @property
+    def history_log(self):
+        """All entries as HistoryItems, newest first."""
+        rows = self._query('SELECT timestamp, filename, status, settings FROM history ORDER BY id DESC')
+        return [self._item(row) for row in rows]
 
     def get_history(self):
         return [item.to_dict() for item in self.history_log]
 
+    def query(self, limit, cursor=None, status=None, palette=None, since=None, until=None,
+              filename=None, fields=HISTORY_FIELDS):
+        """
+        One page of entries, newest first, filtered in SQL.
+
+        Args:
+            limit: maximum number of entries
+            cursor: only entries older than this one (next_cursor of the previous page)
+            status, palette: exact matches
+            since, until: datetime bounds of the timestamp (inclusive, exclusive)
+            filename: case-insensitive substring of the file names
+            fields: keys of each entry, from HISTORY_FIELDS
+
+        Returns:
+            (entries, next_cursor, version): next_cursor is None on the last page,
+            version changes whenever the history does
+        """
+        unknown = set(fields) - set(HISTORY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown history fields {sorted(unknown)}, expected some of {HISTORY_FIELDS}")
+        self.flush()
+
+        conditions = []
+        params = []
+        # The cursor is an id: pages are index range scans, however deep
+        if cursor is not None:
+            conditions.append('id < ?')
+            params.append(cursor)
+        if status is not None:
+            conditions.append('status = ?')
+            params.append(status)
+        if palette is not None:
+            # Same expression as the history_palette index
+            conditions.append("json_extract(settings, '$.palette') = ?")
+            params.append(palette)
+        if since is not None:
+            conditions.append('timestamp >= ?')
+            params.append(since.isoformat())
+        if until is not None:
+            conditions.append('timestamp < ?')
+            params.append(until.isoformat())
+        if filename:
+            escaped = filename.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+            conditions.append("filename LIKE ? ESCAPE '\\'")
+            params.append(f'%{escaped}%')
+
+        columns = [field for field in fields if field != 'id']
+        sql = (f"SELECT {', '.join(['id'] + columns)} FROM history"
+               f"{' WHERE ' + ' AND '.join(conditions) if conditions else ''}"
+               f" ORDER BY id DESC LIMIT ?")
+        with self._lock:
+            conn = self._connection()
+            # One read transaction, so the version matches the rows
+            conn.execute('BEGIN')
+            try:
+                version = conn.execute('SELECT version FROM history_state').fetchone()[0]
+                rows = conn.execute(sql, params + [limit + 1]).fetchall()
+            finally:
+                conn.execute('COMMIT')
+
+        entries = []
+        for row in rows[:limit]:
+            values = dict(zip(['id'] + columns, row))
+            if 'settings' in values:
+                values['settings'] = json.loads(values['settings'])
+            entries.append({field: values[field] for field in fields})
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return entries, next_cursor, version
+
+    def version(self):
+        """Counter that changes whenever entries are added or removed."""
+        return self._query('SELECT version FROM history_state')[0][0]
+
+    def count(self):
+        return self._query('SELECT COUNT(*) FROM history')[0][0]
+
     def clear_history(self):
-        self.history_log = []
-        self._save_history()
+        self.flush()
+        with self._lock, self._transaction() as conn:
+            conn.execute('DELETE FROM history')
+            self._bump_version()
+
+    def compact(self, max_entries=None, vacuum=False):
+        """
+        Drop all but the newest `max_entries` entries (all are kept if None or 0),
+        fold the write-ahead log into the database and optionally VACUUM it to
+        return the freed space to the file system. Returns the number removed.
+        """
+        self.flush()
+        with self._lock:
+            removed = 0
+            if max_entries:
+                with self._transaction() as conn:
+                    removed = conn.execute(
+                        'DELETE FROM history WHERE id <= '
+                        '(SELECT id FROM history ORDER BY id DESC LIMIT 1 OFFSET ?)', (max_entries,)).rowcount
+                    if removed:
+                        self._bump_version()
+            self._connection().execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            if vacuum:
+                self._connection().execute('VACUUM')
+        return removed
+
+    def close(self):
+        """Stop the writer thread, write the queued entries and close the database."""
+        with self._pending_changed:
+            if self._closed:
+                return
+            self._closed = True
+            self._pending_changed.notify()
+        if self._writer is not None:
+            self._writer.join()
+        atexit.unregister(self.close)
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._disconnected = True
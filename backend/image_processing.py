@@ -1,166 +1,466 @@
 from PIL import Image
 import numpy as np
-from models import ProcessedImage
-from denoiser import AstronomicalDenoiser
+import os
+import hashlib
+import functools
+from models import ProcessedImage, HIGH_BIT_DEPTH_FORMATS
+import percentiles
+from percentiles import estimate_percentiles
+from result_cache import LRUCache
+from streaming import StripColorizer
+from parallel import parallel_map, worker_count
+from metrics import stage
+
+# Denoiser inference backend: 'eager', 'torchscript' or 'onnx'
+DENOISER_BACKEND = os.environ.get('DENOISER_BACKEND', 'eager')
+# Denoiser precision: 'fp32', or opt-in 'bf16' / 'int8' for CPU-only nodes
+DENOISER_PRECISION = os.environ.get('DENOISER_PRECISION', 'fp32')
+# Memory budget for denoised cubes kept between requests (0 disables the stage cache)
+DENOISE_CACHE_MB = int(os.environ.get('DENOISE_CACHE_MB', 512))
+
+# Saturation boost: 'hsv' scales HSV saturation (hue and max channel kept),
+# 'luma' scales the chroma around the Rec. 709 luma (brightness kept)
+SATURATION_MODES = ('hsv', 'luma')
+LUMA_WEIGHTS = (0.2126, 0.7152, 0.0722)
+
+# Stretch evaluation: 'exact' runs the curve on every pixel, 'lut' rounds the
+# normalized values to a STRETCH_LUT_SIZE-point grid and looks the curve up
+STRETCH_MODES = ('exact', 'lut')
+STRETCH_CURVES = ('power', 'asinh', 'sqrt', 'log')
+STRETCH_LUT_SIZE = int(os.environ.get('STRETCH_LUT_SIZE', 65536))
 
 class AIModel:
     """AI Model Engine with proper RGB processing based on reference code."""
     
+    # Rows converted to 8-bit at a time
+    block_rows = 256
+    
     def get_prediction(self, fits_data, model_params):
         """This is where the 'AI' colorization happens."""
-        return self._colorize(fits_data, 
-                              red_channel=model_params['red_channel'],
-                              green_channel=model_params['green_channel'],
-                              blue_channel=model_params['blue_channel'],
-                              stretch_name=model_params['stretch_name'],
-                              power=model_params['power'],
-                              black_point=model_params['black_point'],
-                              white_point=model_params['white_point'],
-                              saturation=model_params['saturation'],
-                              red_scale=model_params['red_scale'],
-                              green_scale=model_params['green_scale'],
-                              blue_scale=model_params['blue_scale'])
-
-    def _stretch_data(self, data, method='power', power=2.4, black_point=0.5, white_point=99.8):
+        return self._to_image(self.get_rgb(fits_data, model_params))
+
+    def get_rgb(self, fits_data, model_params):
+        """Colorized image as an (H, W, 3) float array in [0, 1], before 8-bit conversion."""
+        return self._colorize_rgb(fits_data,
+                                  red_channel=model_params['red_channel'],
+                                  green_channel=model_params['green_channel'],
+                                  blue_channel=model_params['blue_channel'],
+                                  stretch_name=model_params['stretch_name'],
+                                  power=model_params['power'],
+                                  black_point=model_params['black_point'],
+                                  white_point=model_params['white_point'],
+                                  saturation=model_params['saturation'],
+                                  red_scale=model_params['red_scale'],
+                                  green_scale=model_params['green_scale'],
+                                  blue_scale=model_params['blue_scale'],
+                                  percentile_method=model_params.get('percentile_method', 'exact'),
+                                  saturation_mode=model_params.get('saturation_mode', 'hsv'),
+                                  stretch_mode=model_params.get('stretch_mode', 'exact'))
+
+    def _stretch_data(self, data, method='power', power=2.4, black_point=0.5, white_point=99.8,
+                      percentile_method='exact', stretch_mode='exact'):
         """Apply stretch method to data based on reference code."""
-        # Ensure float32 for efficiency
-        data = data.astype(np.float32)
-        
+        # Ensure float32 for efficiency (on a copy, the stretch works in place)
+        buffer = np.array(data, dtype=np.float32)
+        if self._stretch_dtype(method, stretch_mode) == np.float32:
+            out = buffer
+        else:
+            out = np.empty(buffer.shape, dtype=self._stretch_dtype(method, stretch_mode))
+        self._stretch_into(buffer, out, method, power, black_point, white_point, percentile_method,
+                           stretch_mode)
+        return out
+
+    def _stretch_dtype(self, method, stretch_mode='exact'):
+        """asinh and log divide by a float64 constant, so their result is float64 (tables are float32)."""
+        if stretch_mode == 'lut':
+            return np.float32
+        return np.float64 if method in ('asinh', 'log') else np.float32
+
+    def _stretch_into(self, data, out, method, power, black_point, white_point, percentile_method,
+                      stretch_mode='exact'):
+        """
+        Stretch the float32 array `data` in place and write the result to `out`
+        (which may be `data` itself for the float32 stretches).
+
+        Every step is a ufunc with out=, in the same order and dtypes as the
+        plain expressions, so the result is bit-identical without temporaries.
+        """
         # Handle NaN and inf values
-        data = np.nan_to_num(data, nan=0.0, posinf=0.0, neginf=0.0)
+        np.nan_to_num(data, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        
+        # Clip background and foreground using percentiles (both from one pass)
+        vmin, vmax = estimate_percentiles(data, [black_point, white_point], percentile_method)
         
-        # Clip background and foreground using percentiles
-        vmin = np.percentile(data, black_point)
-        vmax = np.percentile(data, white_point)
+        self._stretch_between(data, out, method, power, vmin, vmax, stretch_mode)
+
+    def _stretch_between(self, data, out, method, power, vmin, vmax, stretch_mode='exact',
+                         channel_range=None):
+        """
+        Normalize the NaN-free float32 `data` (overwritten) from vmin-vmax to
+        0-1 and write the stretched result to `out`.
+
+        `channel_range` is the (min, max) of the whole channel when `data` is
+        only a strip of it: asinh rescales by the curve's channel extremes.
+        """
+        if stretch_mode not in STRETCH_MODES:
+            raise ValueError(f"Unknown stretch mode '{stretch_mode}', expected one of {STRETCH_MODES}")
         
         # Normalize to 0-1 range
-        data = (data - vmin) / (vmax - vmin + 1e-10)
-        data = np.clip(data, 0, 1)
+        np.subtract(data, vmin, out=data)
+        np.divide(data, vmax - vmin + 1e-10, out=data)
+        np.clip(data, 0, 1, out=data)
+        
+        extremes = None
+        if method == 'asinh' and channel_range is not None:
+            # Normalized the same way as the data, so they bound it exactly
+            extremes = np.array(channel_range, dtype=np.float32)
+            np.subtract(extremes, vmin, out=extremes)
+            np.divide(extremes, vmax - vmin + 1e-10, out=extremes)
+            np.clip(extremes, 0, 1, out=extremes)
+        
+        if stretch_mode == 'lut' and method in STRETCH_CURVES:
+            self._lookup_stretch(data, out, method, power, extremes)
+            return
         
         # Apply stretch method
+        result = self._stretch_curve(data, out, method, power)
+        if method == 'asinh':
+            if extremes is None:
+                low, high = result.min(), result.max()
+            else:
+                low, high = self._stretch_curve(extremes, np.empty(2), method, power)
+            np.subtract(result, low, out=result)
+            np.divide(result, high - low + 1e-10, out=result)
+        
+        if result is not out:
+            np.copyto(out, result)
+
+    @staticmethod
+    def _stretch_curve(data, out, method, power):
+        """
+        Apply the stretch curve to the normalized 0-1 array `data` in place;
+        asinh and log write their float64 result to `out`. Returns the array
+        holding the result. asinh still needs its min/max normalization.
+        """
         if method == 'power':
-            data = np.power(data, 1.0 / power)
+            np.power(data, 1.0 / power, out=data)
         elif method == 'asinh':
             asinh_scale = 0.05
-            data = np.arcsinh(data / asinh_scale) / np.arcsinh(1.0 / asinh_scale)
-            data = (data - data.min()) / (data.max() - data.min() + 1e-10)
+            np.divide(data, asinh_scale, out=data)
+            np.arcsinh(data, out=data)
+            np.divide(data, np.arcsinh(1.0 / asinh_scale), out=out)
+            return out
         elif method == 'sqrt':
-            data = np.sqrt(data)
+            np.sqrt(data, out=data)
         elif method == 'log':
-            data = np.log1p(data * 10) / np.log1p(10)
-        
+            np.multiply(data, 10, out=data)
+            np.log1p(data, out=data)
+            np.divide(data, np.log1p(10), out=out)
+            return out
         return data
 
+    def _lookup_stretch(self, data, out, method, power, extremes=None):
+        """
+        Stretch the normalized 0-1 array `data` (overwritten) into `out` by
+        rounding it to the STRETCH_LUT_SIZE grid and indexing the curve's table.
+        `extremes` are the normalized channel (min, max) when `data` is a strip.
+        """
+        # Only the power curve depends on `power`: one table per curve otherwise
+        table = stretch_table(method, power if method == 'power' else None, STRETCH_LUT_SIZE)
+        scale = table.size - 1
+        
+        if method == 'asinh':
+            # The curve is increasing, so its extremes are at the extreme indices
+            low_value, high_value = (data.min(), data.max()) if extremes is None else extremes
+            low = table[int(np.rint(low_value * scale))]
+            high = table[int(np.rint(high_value * scale))]
+            table = (table - low) / (high - low + 1e-10)
+        
+        # Gather a block of rows at a time: np.take wants intp indices
+        data, out = np.atleast_2d(data), np.atleast_2d(out)
+        index = np.empty((min(self.block_rows, data.shape[0]),) + data.shape[1:], dtype=np.intp)
+        for start in range(0, data.shape[0], self.block_rows):
+            rows = data[start:start + self.block_rows]
+            block = index[:rows.shape[0]]
+            np.multiply(rows, scale, out=rows)
+            np.rint(rows, out=rows)
+            np.copyto(block, rows, casting='unsafe')
+            np.take(table, block, out=out[start:start + rows.shape[0]], mode='clip')
+
+    def _boost_saturation(self, rgb, factor, mode='hsv'):
+        """Boost color saturation of the 0-1 RGB array in place with one of SATURATION_MODES."""
+        if mode not in SATURATION_MODES:
+            raise ValueError(f"Unknown saturation mode '{mode}', expected one of {SATURATION_MODES}")
+        if mode == 'luma':
+            return self._boost_saturation_luma(rgb, factor)
+        return self._boost_saturation_hsv(rgb, factor)
+
     def _boost_saturation_hsv(self, rgb, factor):
-        """Boost color saturation using HSV color space."""
+        """
+        Boost color saturation as in HSV space, in place.
+
+        Scaling S with H and V fixed moves every channel towards or away from
+        the maximum: c' = max - k * (max - c), with k = factor, or less where
+        S would exceed 1 (k = max / (max - min) makes the smallest channel 0).
+        Same result as the HSV round trip without computing hue.
+        """
         if factor == 1.0:
             return rgb
         
-        # Convert RGB to HSV
-        # RGB assumed to be in range [0, 1]
-        r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+        # Work a block of rows at a time so the temporaries stay small (blocks run in parallel)
+        def boost_block(start):
+            block = rgb[start:start + self.block_rows]
+            r, g, b = block[:, :, 0], block[:, :, 1], block[:, :, 2]
+            
+            maxc = np.maximum(r, g)
+            np.maximum(maxc, b, out=maxc)
+            gain = np.minimum(r, g)
+            np.minimum(gain, b, out=gain)
+            
+            if factor > 1.0:
+                # Limit the gain where saturation would clip at 1 (grays have no limit)
+                np.subtract(maxc, gain, out=gain)
+                np.maximum(gain, np.finfo(gain.dtype).tiny, out=gain)
+                np.divide(maxc, gain, out=gain)
+                np.minimum(gain, factor, out=gain)
+            else:
+                # Saturation clips at 0 instead
+                gain.fill(max(factor, 0.0))
+            
+            # c' = k * c + (1 - k) * max
+            np.multiply(block, gain[:, :, np.newaxis], out=block)
+            np.subtract(1.0, gain, out=gain)
+            np.multiply(gain, maxc, out=gain)
+            np.add(block, gain[:, :, np.newaxis], out=block)
         
-        maxc = np.maximum(np.maximum(r, g), b)
-        minc = np.minimum(np.minimum(r, g), b)
-        v = maxc
-        
-        deltac = maxc - minc
-        s = deltac / (maxc + 1e-10)
-        deltac = np.where(deltac == 0, 1, deltac)  # Avoid division by zero
-        
-        rc = (maxc - r) / deltac
-        gc = (maxc - g) / deltac
-        bc = (maxc - b) / deltac
-        
-        h = np.zeros_like(v)
-        h = np.where(r == maxc, bc - gc, h)
-        h = np.where(g == maxc, 2.0 + rc - bc, h)
-        h = np.where(b == maxc, 4.0 + gc - rc, h)
-        h = (h / 6.0) % 1.0
-        
-        # Boost saturation
-        s = np.clip(s * factor, 0, 1)
-        
-        # Convert back to RGB
-        i = (h * 6.0).astype(int)
-        f = (h * 6.0) - i
-        p = v * (1.0 - s)
-        q = v * (1.0 - s * f)
-        t = v * (1.0 - s * (1.0 - f))
-        i = i % 6
-        
-        conditions = [
-            i == 0, i == 1, i == 2, i == 3, i == 4, i == 5
-        ]
+        parallel_map(boost_block, range(0, rgb.shape[0], self.block_rows))
+        return rgb
+
+    def _boost_saturation_luma(self, rgb, factor):
+        """
+        Boost color saturation around the Rec. 709 luma, in place.
+
+        c' = Y + factor * (c - Y) keeps the brightness of every pixel; channels
+        pushed outside 0-1 are clipped, which can shift the hue of the most
+        saturated highlights.
+        """
+        if factor == 1.0:
+            return rgb
         
-        r = np.select(conditions, [v, q, p, p, t, v])
-        g = np.select(conditions, [t, v, v, q, p, p])
-        b = np.select(conditions, [p, p, t, v, v, q])
+        weights = np.array(LUMA_WEIGHTS, dtype=rgb.dtype)
+        def boost_block(start):
+            block = rgb[start:start + self.block_rows]
+            luma = block @ weights
+            np.multiply(luma, 1.0 - factor, out=luma)
+            np.multiply(block, factor, out=block)
+            np.add(block, luma[:, :, np.newaxis], out=block)
+            np.clip(block, 0, 1, out=block)
         
-        return np.dstack([r, g, b])
+        parallel_map(boost_block, range(0, rgb.shape[0], self.block_rows))
+        return rgb
 
     def _colorize(self, fits_data, red_channel, green_channel, blue_channel, 
                   stretch_name, power, black_point, white_point, saturation,
-                  red_scale, green_scale, blue_scale):
+                  red_scale, green_scale, blue_scale, percentile_method='exact'):
         """Create RGB image with proper stretching based on reference code."""
+        return self._to_image(self._colorize_rgb(
+            fits_data, red_channel, green_channel, blue_channel, stretch_name, power,
+            black_point, white_point, saturation, red_scale, green_scale, blue_scale,
+            percentile_method))
+
+    def _colorize_rgb(self, fits_data, red_channel, green_channel, blue_channel,
+                      stretch_name, power, black_point, white_point, saturation,
+                      red_scale, green_scale, blue_scale, percentile_method='exact',
+                      saturation_mode='hsv', stretch_mode='exact'):
+        """Stretched, color-balanced and saturated RGB in the 0-1 range."""
         
         if fits_data.ndim != 3 or fits_data.shape[0] < max(red_channel, green_channel, blue_channel) + 1:
             raise ValueError("Input FITS data must be a 3D cube with enough channels.")
 
-        # Extract channels
-        image_r = fits_data[red_channel, :, :].astype(np.float32)
-        image_g = fits_data[green_channel, :, :].astype(np.float32)
-        image_b = fits_data[blue_channel, :, :].astype(np.float32)
-
-        # Apply color balance multipliers
-        if red_scale != 1.0:
-            image_r = image_r * red_scale
-        if green_scale != 1.0:
-            image_g = image_g * green_scale
-        if blue_scale != 1.0:
-            image_b = image_b * blue_scale
-
-        # Stretch each channel individually
-        stretched_r = self._stretch_data(image_r, stretch_name, power, black_point, white_point)
-        stretched_g = self._stretch_data(image_g, stretch_name, power, black_point, white_point)
-        stretched_b = self._stretch_data(image_b, stretch_name, power, black_point, white_point)
-
-        # Stack into RGB (range 0-1)
-        rgb = np.dstack([stretched_r, stretched_g, stretched_b])
+        # Stretch each channel individually, straight into its slot of the RGB buffer
+        height, width = fits_data.shape[1:]
+        rgb = np.empty((height, width, 3), dtype=self._stretch_dtype(stretch_name, stretch_mode))
+        # One float32 working copy, reused for all three channels when they run one by one
+        shared_scratch = np.empty((height, width), dtype=np.float32) if worker_count() == 1 else None
+        channels = ((red_channel, red_scale), (green_channel, green_scale), (blue_channel, blue_scale))
+        
+        def stretch_channel(task):
+            index, (channel, scale) = task
+            scratch = shared_scratch
+            if scratch is None:
+                scratch = np.empty((height, width), dtype=np.float32)
+            np.copyto(scratch, fits_data[channel], casting='unsafe')
+            
+            # Apply color balance multipliers
+            if scale != 1.0:
+                np.multiply(scratch, scale, out=scratch)
+            
+            self._stretch_into(scratch, rgb[:, :, index], stretch_name, power, black_point,
+                               white_point, percentile_method, stretch_mode)
+        
+        # The channels are independent: stretch them in parallel on the channel pool
+        with stage('stretch', rgb.nbytes):
+            parallel_map(stretch_channel, enumerate(channels))
 
         # Apply saturation boost
         if saturation != 1.0:
-            rgb = self._boost_saturation_hsv(rgb, saturation)
+            with stage('saturation', rgb.nbytes):
+                rgb = self._boost_saturation(rgb, saturation, saturation_mode)
 
-        # Convert to 8-bit (0-255)
-        rgb = np.clip(rgb * 255, 0, 255).astype(np.uint8)
+        return rgb
+
+    def _to_image(self, rgb):
+        """Convert a 0-1 float RGB array to an 8-bit PIL image (`rgb` is left untouched)."""
+        with stage('to_uint8', rgb.nbytes):
+            return Image.fromarray(self._to_uint8(rgb), mode='RGB')
+
+    def _to_uint8(self, rgb):
+        """8-bit (0-255) version of a 0-1 float RGB array (`rgb` is left untouched)."""
+        image = np.empty(rgb.shape, dtype=np.uint8)
         
-        return Image.fromarray(rgb, mode='RGB')
+        # Convert a block of rows at a time to keep the float temporary small (blocks run in parallel)
+        def convert_block(start):
+            rows = rgb[start:start + self.block_rows]
+            scaled = np.multiply(rows, 255)
+            np.clip(scaled, 0, 255, out=scaled)
+            np.copyto(image[start:start + rows.shape[0]], scaled, casting='unsafe')
+        
+        parallel_map(convert_block, range(0, rgb.shape[0], self.block_rows))
+        return image
+
+
+@functools.lru_cache(maxsize=32)
+def stretch_table(method, power, size):
+    """Read-only float32 table of a stretch curve at `size` evenly spaced points of 0-1."""
+    grid = np.linspace(0, 1, size, dtype=np.float32)
+    out = np.empty(size, dtype=np.float64)
+    table = AIModel._stretch_curve(grid, out, method, power).astype(np.float32)
+    table.flags.writeable = False
+    return table
 
 
 class ImageProcessor:
     """Handles the core image processing workflow with ML denoising."""
     def __init__(self):
         self.model_engine = AIModel()
-        # Initialize ML denoiser
-        self.denoiser = AstronomicalDenoiser(model_path='models/dncnn_astro.pth')
+        self._denoiser = None
+        self.denoiser_config = {
+            'model_path': 'models/dncnn_astro.pth',
+            'backend': DENOISER_BACKEND,
+            'precision': DENOISER_PRECISION,
+        }
+        # Denoised cubes only depend on the input data and the denoiser settings,
+        # so palette/stretch tweaks on the same data can skip the network entirely
+        self.denoise_cache = LRUCache(DENOISE_CACHE_MB * 1024 * 1024) if DENOISE_CACHE_MB > 0 else None
+
+    @property
+    def denoiser(self):
+        """
+        ML denoiser, created on first use.
+
+        denoiser.py pulls in torch, which takes seconds to import, so it is
+        only imported once a request actually needs denoising (or on warm-up).
+        The network itself is shared process-wide through the model registry.
+        """
+        if self._denoiser is None:
+            from denoiser import AstronomicalDenoiser
+            self._denoiser = AstronomicalDenoiser(**self.denoiser_config)
+        return self._denoiser
+
+    def preload_models(self):
+        """Load the denoising model into the shared registry ahead of the first request."""
+        self.denoiser.preload()
 
-    def process_image(self, fits_data, model_params):
-        """Orchestrates the colorization from FITS data to a ProcessedImage."""
+    def settings_key(self):
+        """
+        Server-side settings that change the rendered pixels, for result cache keys:
+        the denoiser configuration and weights, the stretch table size and the
+        percentile estimation sizes. Read per call, so a restart with other
+        settings or retrained weights never serves an old image from a disk cache.
+        """
+        model_path = self.denoiser_config['model_path']
+        return {
+            'denoiser': self.denoiser_config,
+            'weights_mtime': os.path.getmtime(model_path) if os.path.exists(model_path) else None,
+            'stretch_lut_size': STRETCH_LUT_SIZE,
+            'percentile_sample_size': percentiles.PERCENTILE_SAMPLE_SIZE,
+            'percentile_bins': percentiles.PERCENTILE_BINS,
+        }
+
+    def process_image(self, fits_data, model_params, progress=None):
+        """
+        Orchestrates the colorization from FITS data to a ProcessedImage.
+
+        `progress`, if given, is called as progress(stage, fraction).
+        """
+        report = progress or (lambda stage, fraction: None)
         
         # Get raw FITS data
         raw_data = fits_data.get_raw_data()
         
         # Apply ML denoising if enabled
         if model_params.get('use_denoising', True):  # Default to True
-            print("🤖 Applying ML-based noise reduction...")
-            denoised_data = self.denoiser.denoise_fits_cube(raw_data)
-            print("✓ Denoising complete!")
+            report('denoising', 0.2)
+            with stage('denoise', raw_data.nbytes):
+                denoised_data = self._denoise(raw_data)
         else:
             print("⊗ Denoising disabled, using raw data")
             denoised_data = raw_data
         
         # Colorize the (denoised) data
-        pil_image = self.model_engine.get_prediction(denoised_data, model_params)
+        report('colorizing', 0.7)
+        rgb = self.model_engine.get_rgb(denoised_data, model_params)
+        pil_image = self.model_engine._to_image(rgb)
         
-        return ProcessedImage(pil_image)
\ No newline at end of file
+        # Keep the float image only when a 16-bit export will need it
+        if model_params.get('output_format') in HIGH_BIT_DEPTH_FORMATS:
+            return ProcessedImage(pil_image, rgb=rgb)
+        return ProcessedImage(pil_image)
+
+    def stream_image(self, sections, shape, downsampler, model_params, stream, progress=None):
+        """
+        Colorize layers strip by strip straight into `stream`, for images too
+        large to process in memory (see StripColorizer). The denoised-cube
+        cache is not used.
+        """
+        denoiser = None
+        if model_params.get('use_denoising', True):
+            denoiser = self.denoiser
+        else:
+            print("⊗ Denoising disabled, using raw data")
+        StripColorizer(self.model_engine, denoiser).render(sections, shape, downsampler, model_params,
+                                                           stream, progress=progress)
+
+    def _denoise_key(self, raw_data):
+        """Content hash of the cube combined with the denoiser settings."""
+        data = np.ascontiguousarray(raw_data)
+        digest = hashlib.sha256()
+        digest.update(f"{data.dtype.str}{data.shape}{sorted(self.denoiser_config.items())}".encode('utf-8'))
+        digest.update(data)
+        return digest.hexdigest()
+
+    def _denoise(self, raw_data):
+        """Denoise a cube, reusing the result of an earlier identical call."""
+        if self.denoise_cache is None:
+            print("🤖 Applying ML-based noise reduction...")
+            denoised_data = self.denoiser.denoise_fits_cube(raw_data)
+            print("✓ Denoising complete!")
+            return denoised_data
+
+        key = self._denoise_key(raw_data)
+        denoised_data = self.denoise_cache.get(key)
+        if denoised_data is not None:
+            print("✓ Reusing cached denoised data")
+            return denoised_data
+
+        print("🤖 Applying ML-based noise reduction...")
+        denoised_data = self.denoiser.denoise_fits_cube(raw_data)
+        # Shared between requests: make sure nobody modifies it in place
+        denoised_data.flags.writeable = False
+        self.denoise_cache.put(key, denoised_data, denoised_data.nbytes)
+        print("✓ Denoising complete!")
+        return denoised_data
+
+    def get_cache_stats(self):
+        """Hit/miss counters of the denoised-cube cache (None if disabled)."""
+        return self.denoise_cache.stats() if self.denoise_cache is not None else None
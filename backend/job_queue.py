@@ -0,0 +1,137 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+class QueueFullError(Exception):
+    """Raised when the job queue has no free slot for another job."""
+
+
+class Job:
+    """One unit of background work and its progress."""
+    def __init__(self):
+        self.job_id = uuid.uuid4().hex
+        self.status = 'queued'  # queued -> running -> done | failed
+        self.stage = 'queued'
+        self.progress = 0.0
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def report(self, stage, progress):
+        """Progress callback handed to the job function."""
+        self.stage = stage
+        self.progress = progress
+
+    @property
+    def finished(self):
+        return self.status in ('done', 'failed')
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobQueue:
+    """
+    Runs jobs on a bounded thread pool.
+
+    At most `max_workers` jobs run at once and at most `max_pending` more
+    wait for a worker; beyond that `submit` raises QueueFullError so the
+    caller can push back on the client. Finished jobs are kept for
+    `retention_seconds` so their results can be fetched, but only the newest
+    `max_finished` of them: results hold whole images.
+    """
+
+    def __init__(self, max_workers=2, max_pending=8, retention_seconds=3600, max_finished=32):
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.retention_seconds = retention_seconds
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue `fn(*args, progress=callback, **kwargs)` and return its Job.
+
+        Raises:
+            QueueFullError: if every worker is busy and the queue is full
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Job queue is full, try again later")
+
+        job = Job()
+        with self._lock:
+            self._prune()
+            self._jobs[job.job_id] = job
+        try:
+            self._executor.submit(self._run, job, fn, args, kwargs)
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                del self._jobs[job.job_id]
+            raise
+        return job
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = 'running'
+        job.stage = 'running'
+        job.started_at = time.time()
+        try:
+            try:
+                job.result = fn(*args, progress=job.report, **kwargs)
+                job.report('done', 1.0)
+                status = 'done'
+            except Exception as e:
+                job.error = str(e)
+                job.stage = 'failed'
+                status = 'failed'
+            # finished_at first: _prune reads it of every finished job
+            job.finished_at = time.time()
+            job.status = status
+            with self._lock:
+                self._prune()
+        finally:
+            self._slots.release()
+
+    def _prune(self):
+        """
+        Forget finished jobs older than the retention period, then the oldest
+        beyond `max_finished` (lock held).
+        """
+        cutoff = time.time() - self.retention_seconds
+        finished = sorted((job for job in self._jobs.values() if job.finished),
+                          key=lambda job: job.finished_at)
+        excess = max(len(finished) - self.max_finished, 0)
+        for index, job in enumerate(finished):
+            if index < excess or job.finished_at < cutoff:
+                del self._jobs[job.job_id]
+
+    def get(self, job_id):
+        """Return the Job with this id, or None if it is unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        counts = {status: 0 for status in ('queued', 'running', 'done', 'failed')}
+        for job in jobs:
+            counts[job.status] += 1
+        return counts
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,243 @@
+import os
+import time
+import threading
+import tracemalloc
+import contextlib
+
+# Also record the peak Python/NumPy allocation of every stage (tracemalloc).
+# Off by default: tracing every allocation slows the pipeline down noticeably.
+METRICS_TRACE_MEMORY = os.environ.get('METRICS_TRACE_MEMORY', '0') == '1'
+
+# Histogram buckets (seconds): stages from sub-millisecond to minutes-long renders
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels) + '}'
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """A named family of values, one per combination of label values."""
+
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects the labels {self.labelnames}, got {tuple(labels)}")
+        return tuple((name, labels[name]) for name in self.labelnames)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for key in sorted(self._values, key=lambda key: [str(value) for _, value in key]):
+                lines.extend(self._samples(key, self._values[key]))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """Monotonically increasing total."""
+
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Last value set."""
+
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels))
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative `buckets`, plus their sum and count."""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                # One count per bucket, then the sum
+                counts = self._values[key] = [0] * len(self.buckets) + [0.0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[index] += 1
+                    break
+            counts[-1] += value
+
+    def count(self, **labels):
+        with self._lock:
+            counts = self._values.get(self._key(labels))
+            return sum(counts[:-1]) if counts else 0
+
+    def _samples(self, key, counts):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            labels = _format_labels(key + (('le', _format_value(bound)),))
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(counts[-1])}")
+        lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    """The metrics of the process, rendered together for /metrics."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, extra=()):
+        """Prometheus text exposition of every metric, followed by the metrics in `extra`."""
+        lines = []
+        for metric in list(self._metrics) + list(extra):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        for metric in self._metrics:
+            metric.clear()
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'colorizer_stage_seconds', "Wall time of each pipeline stage.", ('stage',)))
+STAGE_BYTES = REGISTRY.register(Counter(
+    'colorizer_stage_bytes_total', "Bytes processed by each pipeline stage.", ('stage',)))
+STAGE_PEAK_MEMORY = REGISTRY.register(Gauge(
+    'colorizer_stage_peak_memory_bytes',
+    "Peak traced allocation above the start of the last run of each stage (METRICS_TRACE_MEMORY=1).",
+    ('stage',)))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'colorizer_request_seconds', "Wall time of colorization requests.", ('palette', 'stretch', 'status')))
+
+
+class _StageRecord:
+    """What `stage` yields: set `bytes` when the size is only known at the end."""
+
+    def __init__(self, nbytes):
+        self.bytes = nbytes
+        self.start_memory = 0
+        self.peak_memory = 0
+
+
+# Open stages of the current thread, so nested stages keep their parents' peaks
+_open_stages = threading.local()
+
+def _update_peaks(records):
+    """Fold the traced peak since the last reset into every open stage."""
+    current, peak = tracemalloc.get_traced_memory()
+    for record in records:
+        record.peak_memory = max(record.peak_memory, peak - record.start_memory)
+    return current
+
+@contextlib.contextmanager
+def stage(name, nbytes=0):
+    """
+    Time the enclosed block as pipeline stage `name` and count `nbytes`
+    (or the `bytes` set on the yielded record) as processed. Failed runs
+    are timed too.
+    """
+    record = _StageRecord(nbytes)
+    records = None
+    if METRICS_TRACE_MEMORY:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        records = getattr(_open_stages, 'records', None)
+        if records is None:
+            records = _open_stages.records = []
+        record.start_memory = _update_peaks(records)
+        tracemalloc.reset_peak()
+        records.append(record)
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage=name)
+        if record.bytes:
+            STAGE_BYTES.inc(record.bytes, stage=name)
+        if records is not None:
+            # Peaks are process-wide: concurrent requests show up in each other's stages
+            _update_peaks(records)
+            records.remove(record)
+            STAGE_PEAK_MEMORY.set(record.peak_memory, stage=name)
+
+def render(extra=()):
+    """The /metrics document."""
+    return REGISTRY.render(extra)
+
+def cache_metrics(cache_stats):
+    """
+    Metrics of AppController.get_cache_stats(), built at scrape time from the
+    caches' own counters. Disabled caches (None) are left out.
+    """
+    hits = Counter('colorizer_cache_hits_total', "Cache lookups that found an entry.", ('cache',))
+    misses = Counter('colorizer_cache_misses_total', "Cache lookups that found nothing.", ('cache',))
+    evictions = Counter('colorizer_cache_evictions_total', "Entries evicted to stay in budget.", ('cache',))
+    hit_rate = Gauge('colorizer_cache_hit_ratio', "Hits per lookup since the process started.", ('cache',))
+    entries = Gauge('colorizer_cache_entries', "Entries currently cached.", ('cache',))
+    size = Gauge('colorizer_cache_bytes', "Bytes currently cached.", ('cache',))
+    for cache, stats in cache_stats.items():
+        if stats is None:
+            continue
+        hits.inc(stats['hits'], cache=cache)
+        misses.inc(stats['misses'], cache=cache)
+        evictions.inc(stats['evictions'], cache=cache)
+        hit_rate.set(stats['hit_rate'], cache=cache)
+        entries.set(stats['entries'], cache=cache)
+        size.set(stats['bytes'], cache=cache)
+    return [hits, misses, evictions, hit_rate, entries, size]
@@ -0,0 +1,61 @@
+import gc
+import threading
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded models.
+
+    Models are loaded lazily on the first `get` for their key and then
+    shared by every caller in the process, including other threads.
+    Loading the models in a pre-fork server (e.g. gunicorn --preload) and
+    calling `prepare_for_fork` lets forked workers share the weights
+    copy-on-write instead of each loading its own copy.
+    """
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, loader):
+        """Return the model for `key`, calling `loader()` once if it is not loaded yet."""
+        model = self._models.get(key)
+        if model is not None:
+            return model
+
+        # One lock per key: a slow load does not block other models
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            model = self._models.get(key)
+            if model is None:
+                model = loader()
+                self._models[key] = model
+        return model
+
+    def __contains__(self, key):
+        return key in self._models
+
+    def keys(self):
+        return list(self._models)
+
+    def clear(self):
+        """Drop all loaded models (they are reloaded on next use)."""
+        with self._lock:
+            self._models.clear()
+            self._key_locks.clear()
+
+    def prepare_for_fork(self):
+        """
+        Call in the parent after preloading, right before workers fork.
+
+        Moves every live object out of the garbage collector's generations,
+        so collections in the workers do not write to (and thereby copy)
+        the memory pages holding the shared models.
+        """
+        gc.collect()
+        gc.freeze()
+
+
+# The registry shared by the whole process
+registry = ModelRegistry()
@@ -1,6 +1,20 @@
 
 from datetime import datetime
+from io import BytesIO
 from PIL import Image
+import numpy as np
+from encoders import write_png, write_tiff16
+
+# Output formats: name -> (MIME type, file extension)
+OUTPUT_FORMATS = {
+    'png': ('image/png', 'png'),
+    'png16': ('image/png', 'png'),
+    'tiff16': ('image/tiff', 'tiff'),
+    'jpeg': ('image/jpeg', 'jpg'),
+    'webp': ('image/webp', 'webp'),
+}
+# Formats encoded from the float image instead of the 8-bit one
+HIGH_BIT_DEPTH_FORMATS = ('png16', 'tiff16')
 
 class FITSData:
     """Holds the raw FITS data from an uploaded file."""
@@ -13,14 +27,50 @@ class FITSData:
 
 class ProcessedImage:
     """Holds the final, colorized RGB image and handles adjustments."""
-    def __init__(self, pil_image):
+    def __init__(self, pil_image, rgb=None):
+        """
+        Args:
+            pil_image: the 8-bit RGB image
+            rgb: optional (H, W, 3) float image in [0, 1] it was quantized from,
+                used for the 16-bit formats
+        """
         self.pil_image = pil_image
+        self.rgb = rgb
+
+    def to_uint16(self):
+        """16-bit version of the image, from the float data when available."""
+        if self.rgb is not None:
+            return np.clip(self.rgb * 65535, 0, 65535).astype(np.uint16)
+        # Only the 8-bit image is left: scale 0-255 to 0-65535
+        return np.asarray(self.pil_image, dtype=np.uint16) * 257
+
+    def export_to(self, format="png", stream=None, quality=90, compress_level=6):
+        """
+        Encodes the image in one of OUTPUT_FORMATS.
+
+        Args:
+            format: 'png', 'png16', 'tiff16', 'jpeg' or 'webp' (case-insensitive)
+            stream: binary file object to write to; if None the bytes are returned
+            quality: 1-100, for jpeg and webp
+            compress_level: zlib level 0-9 for png and png16 (1 is fastest, 9 smallest)
+        """
+        format = format.lower()
+        if format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format '{format}', expected one of {tuple(OUTPUT_FORMATS)}")
+
+        target = BytesIO() if stream is None else stream
+        if format == 'png':
+            self.pil_image.save(target, format='PNG', compress_level=compress_level)
+        elif format == 'png16':
+            write_png(target, self.to_uint16(), compress_level=compress_level)
+        elif format == 'tiff16':
+            write_tiff16(target, self.to_uint16())
+        elif format == 'jpeg':
+            self.pil_image.save(target, format='JPEG', quality=quality)
+        else:
+            self.pil_image.save(target, format='WEBP', quality=quality)
 
-    def export_to(self, format="PNG"):
-        """Exports the image to a specified format."""
-        # In a real scenario, this would handle different formats.
-        # For now, it just returns the PIL image.
-        return self.pil_image
+        return target.getvalue() if stream is None else None
 
 class HistoryItem:
     """A simple data object representing one entry in the history log."""
@@ -0,0 +1,48 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Threads for independent per-channel and per-block NumPy work. NumPy releases
+# the GIL inside its loops, so threads scale without copying data to processes.
+# 0 uses one per available CPU core, 1 runs everything inline.
+CHANNEL_WORKERS = int(os.environ.get('CHANNEL_WORKERS', 0))
+
+# Intra-op threads of the denoising network (0 keeps PyTorch's default of one
+# per core). With several JOB_WORKERS, cores / JOB_WORKERS avoids oversubscription.
+TORCH_THREADS = int(os.environ.get('TORCH_THREADS', 0))
+
+_THREAD_PREFIX = 'channel'
+_pool = None
+_pool_lock = threading.Lock()
+
+def worker_count():
+    """Number of channel worker threads."""
+    if CHANNEL_WORKERS > 0:
+        return CHANNEL_WORKERS
+    # Respect CPU affinity (containers, taskset) where the platform reports it
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+def _get_pool():
+    """The process-wide pool, created on first use and shared by all requests."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=worker_count(), thread_name_prefix=_THREAD_PREFIX)
+    return _pool
+
+def parallel_map(function, items):
+    """
+    list(map(function, items)) with the calls spread over the channel pool.
+
+    Runs inline with a single worker, a single item, or when called from a
+    pool thread (nested calls would wait on their own pool). Exceptions are
+    raised in the caller.
+    """
+    items = list(items)
+    if (len(items) <= 1 or worker_count() <= 1
+            or threading.current_thread().name.startswith(_THREAD_PREFIX)):
+        return [function(item) for item in items]
+    return list(_get_pool().map(function, items))
@@ -0,0 +1,116 @@
+import math
+import os
+import numpy as np
+
+# How percentiles for the stretch are computed:
+# 'exact'     -- same values as np.percentile, one partition for all percentiles
+# 'subsample' -- exact percentiles of a strided sample of PERCENTILE_SAMPLE_SIZE pixels
+# 'histogram' -- read off PERCENTILE_BINS histograms (two passes), no copy of the data
+PERCENTILE_METHODS = ('exact', 'subsample', 'histogram')
+
+PERCENTILE_SAMPLE_SIZE = int(os.environ.get('PERCENTILE_SAMPLE_SIZE', 1_000_000))
+PERCENTILE_BINS = int(os.environ.get('PERCENTILE_BINS', 65536))
+
+def estimate_percentiles(data, percentiles, method='exact', sample_size=None, bins=None):
+    """
+    Percentiles of `data` (any shape, no NaNs) for the stretch normalization.
+
+    Args:
+        data: array of values
+        percentiles: sequence of percentiles in [0, 100]
+        method: one of PERCENTILE_METHODS
+        sample_size: pixels kept by 'subsample' (accuracy vs speed)
+        bins: histogram bins for 'histogram'; the error is at most one bin
+            width of the second pass, (max - min) / bins**2
+
+    Returns:
+        list of values of the data's dtype, one per percentile
+    """
+    if method not in PERCENTILE_METHODS:
+        raise ValueError(f"Unknown percentile method '{method}', expected one of {PERCENTILE_METHODS}")
+
+    flat = data.ravel()
+    if method == 'histogram':
+        return _histogram_percentiles(flat, percentiles, bins or PERCENTILE_BINS)
+
+    if method == 'subsample':
+        sample_size = sample_size or PERCENTILE_SAMPLE_SIZE
+        if flat.size > sample_size:
+            # A fixed stride keeps results deterministic (and cacheable)
+            flat = flat[::flat.size // sample_size]
+
+    # Partitioning reorders the values, so work on a copy
+    return _linear_percentiles(np.array(flat), percentiles)
+
+def _linear_percentiles(work, percentiles):
+    """
+    np.percentile's default 'linear' method for scalar percentiles, with a
+    single partition of `work` (modified in place) for all of them.
+    """
+    n = work.size
+    points = []
+    for q in percentiles:
+        # Same arithmetic as numpy, so results are bit-identical
+        quantile = q / 100
+        virtual_index = n * quantile + (1 + quantile * -1) - 1
+        previous_index = min(max(math.floor(virtual_index), 0), n - 1)
+        next_index = min(previous_index + 1, n - 1)
+        if virtual_index >= n - 1:
+            previous_index = next_index = n - 1
+        points.append((previous_index, next_index, virtual_index - math.floor(virtual_index)))
+
+    work.partition(sorted({index for point in points for index in point[:2]}))
+
+    values = []
+    for previous_index, next_index, gamma in points:
+        below, above = work[previous_index], work[next_index]
+        difference = above - below
+        if gamma >= 0.5:
+            values.append(above - difference * (1 - gamma))
+        else:
+            values.append(below + difference * gamma)
+    return values
+
+def _histogram_percentiles(flat, percentiles, bins):
+    """
+    Percentiles interpolated inside histogram bins. A few extreme values (hot
+    pixels) can stretch the range of the first histogram until the whole sky
+    falls into one bin, so each rank's bin is histogrammed again on its own:
+    the error is then below one bin width of that second pass.
+    """
+    low, high = flat.min(), flat.max()
+    if low == high:
+        return [low for _ in percentiles]
+
+    counts, edges = np.histogram(flat, bins=bins, range=(float(low), float(high)))
+    cumulative = np.cumsum(counts)
+    dtype = flat.dtype.type
+
+    refined = {}
+    values = []
+    for q in percentiles:
+        rank = q / 100 * (flat.size - 1)
+        index = _rank_bin(cumulative, rank)
+        before = cumulative[index - 1] if index > 0 else 0
+        # No finer bins than values in the bin, or than the data's dtype can tell apart
+        resolution = np.spacing(np.abs(dtype(edges[index:index + 2])).max())
+        fine_bins = int(min(bins, counts[index], (edges[index + 1] - edges[index]) / resolution))
+        if fine_bins > 1:
+            # np.histogram ignores values outside the range, without copying the data
+            if index not in refined:
+                refined[index] = np.histogram(flat, bins=fine_bins, range=(edges[index], edges[index + 1]))
+            bin_counts, bin_edges = refined[index]
+            bin_cumulative = np.cumsum(bin_counts)
+            rank -= before
+            index = _rank_bin(bin_cumulative, rank)
+            before = bin_cumulative[index - 1] if index > 0 else 0
+        else:
+            bin_counts, bin_edges = counts, edges
+        # Assume the values are spread evenly within the bin
+        fraction = min(max((rank - before + 0.5) / max(bin_counts[index], 1), 0.0), 1.0)
+        values.append(dtype(bin_edges[index] + fraction * (bin_edges[index + 1] - bin_edges[index])))
+    return values
+
+def _rank_bin(cumulative, rank):
+    """Index of the bin holding the value of `rank` (0-based) given cumulative bin counts."""
+    return min(int(np.searchsorted(cumulative, rank, side='right')), cumulative.size - 1)
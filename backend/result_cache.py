@@ -0,0 +1,225 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+# Temporary files untouched for this long were left behind by a crashed process
+STALE_TMP_SECONDS = 3600
+
+class LRUCache:
+    """Thread-safe in-memory cache bounded by the total size of its values."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()  # key -> (value, size), oldest first
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached value or None, marking it as recently used."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value, size):
+        """Store `value` (which takes `size` bytes), evicting the least recently used entries."""
+        if size > self.max_bytes:
+            return  # Would evict everything and still not fit
+        self._store(key, value, size)
+
+    def _store(self, key, value, size):
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            # The entry just stored stays, even if it alone is over budget (see DiskLRUCache.put_file)
+            while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+                evicted_key, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+                self._discard(evicted_key)
+
+    def _discard(self, key):
+        """Hook called for every evicted or cleared key."""
+
+    def clear(self):
+        with self._lock:
+            for key in self._entries:
+                self._discard(key)
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+class DiskLRUCache(LRUCache):
+    """
+    LRU cache whose byte values live in files under `directory`.
+
+    Only the index (key -> file size) is kept in memory. Entries already in
+    the directory are picked up on start, oldest modification time first,
+    and `.tmp` files older than STALE_TMP_SECONDS are removed.
+    """
+
+    def __init__(self, directory, max_bytes):
+        super().__init__(max_bytes)
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        cutoff = time.time() - STALE_TMP_SECONDS
+        existing = []
+        for entry in os.scandir(directory):
+            if not entry.is_file():
+                continue
+            if not entry.name.endswith('.tmp'):
+                existing.append(entry)
+            elif entry.stat().st_mtime < cutoff:
+                self._remove(entry.path)
+        for entry in sorted(existing, key=lambda e: e.stat().st_mtime):
+            size = entry.stat().st_size
+            self._entries[entry.name] = (None, size)
+            self.current_bytes += size
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+        try:
+            with open(self._path(key), 'rb') as f:
+                value = f.read()
+        except FileNotFoundError:
+            # Removed behind our back: forget it and count a miss
+            with self._lock:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self.current_bytes -= entry[1]
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return value
+
+    def put(self, key, value, size=None):
+        size = len(value) if size is None else size
+        if size > self.max_bytes:
+            return
+        # Write to a temporary name first so readers never see partial files
+        tmp_path = self._path(f"{key}.{uuid.uuid4().hex}.tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(value)
+        os.replace(tmp_path, self._path(key))
+        self._store(key, None, size)
+
+    def put_file(self, key, path):
+        """
+        Move the finished file `path` (on the same file system) into the cache
+        as `key`. Unlike put, a file over budget is kept until the next entry.
+        """
+        size = os.path.getsize(path)
+        os.replace(path, self._path(key))
+        self._store(key, None, size)
+
+    def touch(self, key):
+        """Mark `key` as recently used without reading it; False if it is not cached."""
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+            return True
+
+    def _discard(self, key):
+        self._remove(self._path(key))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class ResultCache:
+    """
+    Content-addressed cache of finished colorizations.
+
+    Keys are derived from the hashes of the uploaded files and the
+    normalized processing parameters, so the same inputs rendered with the
+    same settings map to the same entry regardless of file names.
+    """
+
+    def __init__(self, storage):
+        self.storage = storage
+
+    @staticmethod
+    def file_digest(path, chunk_size=1024 * 1024):
+        """SHA-256 hex digest of a file, read in chunks."""
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(chunk_size), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    @staticmethod
+    def make_key(file_digests, params):
+        """Combine input digests (in channel order) and parameters into one key."""
+        digest = hashlib.sha256()
+        for file_digest in file_digests:
+            digest.update(file_digest.encode('ascii'))
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Return (image_bytes, metadata) or None."""
+        blob = self.storage.get(key)
+        if blob is None:
+            return None
+        header, image_bytes = blob.split(b'\n', 1)
+        return image_bytes, json.loads(header)
+
+    def put(self, key, image_bytes, metadata):
+        # One JSON line of metadata followed by the encoded image
+        blob = json.dumps(metadata).encode('utf-8') + b'\n' + image_bytes
+        self.storage.put(key, blob, len(blob))
+
+    def stats(self):
+        return self.storage.stats()
+
+
+def create_result_cache(kind='memory', max_bytes=256 * 1024 * 1024, directory='cache/results'):
+    """Build a ResultCache on 'memory' or 'disk' storage; 'off' returns None."""
+    if kind == 'off':
+        return None
+    if kind == 'disk':
+        return ResultCache(DiskLRUCache(directory, max_bytes))
+    if kind == 'memory':
+        return ResultCache(LRUCache(max_bytes))
+    raise ValueError(f"Unknown result cache '{kind}', expected 'memory', 'disk' or 'off'")
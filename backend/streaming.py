@@ -0,0 +1,210 @@
+import os
+import tempfile
+import numpy as np
+from encoders import PNGWriter, TIFFWriter
+from percentiles import estimate_percentiles, PERCENTILE_SAMPLE_SIZE
+from parallel import parallel_map
+from metrics import stage
+
+# Output formats that can be encoded strip by strip
+STREAMING_FORMATS = ('png', 'png16', 'tiff16')
+
+# Output rows colorized and encoded at a time
+STREAM_STRIP_ROWS = int(os.environ.get('STREAM_STRIP_ROWS', 256))
+# Where denoised strips wait between passes (default: the system temp directory)
+STREAM_TEMP_DIR = os.environ.get('STREAM_TEMP_DIR') or None
+
+class StripColorizer:
+    """
+    Colorizes layers strip by strip, for images too large to hold in memory.
+
+    Pass 1 reads every strip once for the stretch statistics of each color:
+    a strided sample for the black and white points (the same values as the
+    'subsample' percentile method on the whole channel) and the channel
+    min/max. Pass 2 reads the strips again, stretches, saturates and encodes
+    them into a streaming PNG or TIFF encoder.
+
+    With denoising, a first pass finds the min/max the denoiser normalizes
+    each channel with, then the strips are denoised with a halo of context
+    rows and spilled to a temporary file that the two passes read back.
+
+    Memory use is a few strips of the output width, whatever the height.
+    """
+
+    def __init__(self, model_engine, denoiser=None, strip_rows=STREAM_STRIP_ROWS, sample_size=None,
+                 temp_dir=STREAM_TEMP_DIR):
+        """
+        Args:
+            model_engine: AIModel doing the stretch, saturation and 8-bit conversion
+            denoiser: AstronomicalDenoiser, or None to skip denoising
+            strip_rows: output rows per strip
+            sample_size: pixels per channel sampled for the percentiles
+                (default PERCENTILE_SAMPLE_SIZE)
+            temp_dir: directory for the denoised spill file
+        """
+        self.model_engine = model_engine
+        self.denoiser = denoiser
+        self.strip_rows = strip_rows
+        self.sample_size = sample_size or PERCENTILE_SAMPLE_SIZE
+        self.temp_dir = temp_dir
+
+    def render(self, sections, shape, downsampler, model_params, stream, progress=None):
+        """
+        Colorize the layers and write the encoded image to `stream`.
+
+        Args:
+            sections: one source per layer, sliceable as source[rows, cols]
+                (an hdu.section, memmap or ndarray)
+            shape: (height, width) of the sources
+            downsampler: Downsampler deciding the output size
+            model_params: settings as for AIModel.get_rgb, plus output_format
+                (one of STREAMING_FORMATS) and compress_level
+            stream: binary file object
+            progress: optional progress(stage, fraction) callback
+        """
+        report = progress or (lambda stage, fraction: None)
+        output_format = model_params.get('output_format', 'png')
+        if output_format not in STREAMING_FORMATS:
+            raise ValueError(f"Output format '{output_format}' cannot be streamed, "
+                             f"expected one of {STREAMING_FORMATS}")
+
+        out_shape = downsampler.output_shape(shape)
+
+        def read_rows(start, stop):
+            rows = np.empty((len(sections), stop - start, out_shape[1]), dtype=np.float32)
+            for index, section in enumerate(sections):
+                rows[index] = downsampler.downsample_rows(section, shape, start, stop)
+            return rows
+
+        with tempfile.TemporaryDirectory(dir=self.temp_dir) as temp_dir:
+            if self.denoiser is not None:
+                report('denoising', 0.2)
+                cube_shape = (len(sections),) + out_shape
+                with stage('denoise', int(np.prod(cube_shape)) * 4):
+                    read_rows = self._denoise_to_disk(read_rows, cube_shape, temp_dir)
+
+            report('statistics', 0.5)
+            limits = self._color_limits(read_rows, out_shape, model_params)
+
+            report('colorizing', 0.7)
+            self._encode(read_rows, out_shape, model_params, limits, stream)
+
+    def _strips(self, height):
+        """Yield (start, stop) output rows of each strip."""
+        for start in range(0, height, self.strip_rows):
+            yield start, min(start + self.strip_rows, height)
+
+    def _colors(self, model_params):
+        """(channel, scale) of red, green and blue."""
+        return [(model_params[f'{color}_channel'], model_params[f'{color}_scale'])
+                for color in ('red', 'green', 'blue')]
+
+    def _prepare(self, layer, scale, scratch):
+        """Float32 copy of a layer's rows with color balance and NaN/inf cleanup, as AIModel does."""
+        np.copyto(scratch, layer, casting='unsafe')
+        if scale != 1.0:
+            np.multiply(scratch, scale, out=scratch)
+        np.nan_to_num(scratch, copy=False, nan=0.0, posinf=0.0, neginf=0.0)
+        return scratch
+
+    def _denoise_to_disk(self, read_rows, cube_shape, temp_dir):
+        """Denoise every strip into a memmap; returns a read_rows over the denoised cube."""
+        channels, height, width = cube_shape
+        print("🤖 Applying ML-based noise reduction strip by strip...")
+
+        # The denoiser normalizes each channel with its min and range over the whole channel
+        lows = [None] * channels
+        highs = [None] * channels
+        for start, stop in self._strips(height):
+            rows = np.nan_to_num(read_rows(start, stop), nan=0.0, posinf=0.0, neginf=0.0)
+            for index in range(channels):
+                low, high = rows[index].min(), rows[index].max()
+                lows[index] = low if lows[index] is None else min(lows[index], low)
+                highs[index] = high if highs[index] is None else max(highs[index], high)
+        stats = [(low, high - low) for low, high in zip(lows, highs)]
+
+        denoised = np.memmap(os.path.join(temp_dir, 'denoised.f32'), dtype=np.float32, mode='w+',
+                             shape=cube_shape)
+        halo = self.denoiser.tile_overlap
+        for start, stop in self._strips(height):
+            top, bottom = max(start - halo, 0), min(stop + halo, height)
+            window = self.denoiser.denoise_window(read_rows(top, bottom), stats)
+            denoised[:, start:stop] = window[:, start - top:stop - top]
+        denoised.flush()
+        print("✓ Denoising complete!")
+
+        return lambda start, stop: np.array(denoised[:, start:stop])
+
+    def _color_limits(self, read_rows, out_shape, model_params):
+        """Per color: (vmin, vmax, (channel_min, channel_max)) for AIModel._stretch_between."""
+        height, width = out_shape
+        colors = self._colors(model_params)
+
+        # Same pixels as estimate_percentiles(..., 'subsample') keeps from the whole channel
+        size = height * width
+        step = size // self.sample_size if size > self.sample_size else 1
+
+        samples = [[] for _ in colors]
+        lows = [None] * len(colors)
+        highs = [None] * len(colors)
+        scratch = np.empty((self.strip_rows, width), dtype=np.float32)
+        for start, stop in self._strips(height):
+            rows = read_rows(start, stop)
+            offset = -(-start * width // step) * step - start * width
+            for index, (channel, scale) in enumerate(colors):
+                data = self._prepare(rows[channel], scale, scratch[:stop - start])
+                samples[index].append(data.ravel()[offset::step].copy())
+                low, high = data.min(), data.max()
+                lows[index] = low if lows[index] is None else min(lows[index], low)
+                highs[index] = high if highs[index] is None else max(highs[index], high)
+
+        limits = []
+        for index in range(len(colors)):
+            vmin, vmax = estimate_percentiles(np.concatenate(samples[index]),
+                                              [model_params['black_point'], model_params['white_point']])
+            limits.append((vmin, vmax, (lows[index], highs[index])))
+        return limits
+
+    def _encode(self, read_rows, out_shape, model_params, limits, stream):
+        """Stretch, saturate and encode strip by strip."""
+        height, width = out_shape
+        engine = self.model_engine
+        method = model_params['stretch_name']
+        stretch_mode = model_params.get('stretch_mode', 'exact')
+        saturation = model_params['saturation']
+        output_format = model_params.get('output_format', 'png')
+        compress_level = model_params.get('compress_level', 6)
+
+        if output_format == 'tiff16':
+            writer = TIFFWriter(stream, width, height)
+        else:
+            writer = PNGWriter(stream, width, height, 16 if output_format == 'png16' else 8,
+                               compress_level)
+
+        rgb = np.empty((self.strip_rows, width, 3), dtype=engine._stretch_dtype(method, stretch_mode))
+        # One working copy per color, so the colors of a strip can run in parallel
+        scratches = np.empty((3, self.strip_rows, width), dtype=np.float32)
+        tasks = list(enumerate(zip(self._colors(model_params), limits)))
+        for start, stop in self._strips(height):
+            rows = read_rows(start, stop)
+            block = rgb[:stop - start]
+
+            def stretch_color(task):
+                index, ((channel, scale), (vmin, vmax, channel_range)) = task
+                data = self._prepare(rows[channel], scale, scratches[index, :stop - start])
+                engine._stretch_between(data, block[:, :, index], method, model_params['power'],
+                                        vmin, vmax, stretch_mode, channel_range)
+
+            parallel_map(stretch_color, tasks)
+
+            if saturation != 1.0:
+                block = engine._boost_saturation(block, saturation,
+                                                 model_params.get('saturation_mode', 'hsv'))
+
+            if output_format == 'png':
+                writer.write_rows(engine._to_uint8(block))
+            else:
+                # Same rounding as ProcessedImage.to_uint16
+                writer.write_rows(np.clip(block * 65535, 0, 65535).astype(np.uint16))
+
+        writer.close()
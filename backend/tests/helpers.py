@@ -0,0 +1,23 @@
+"""
+Helpers shared by the test modules (imported by them, not a test module itself).
+"""
+
+from astropy.io import fits
+from io import BytesIO
+import numpy as np
+
+def make_fits_bytes(seed, shape=(64, 64)):
+    """Bytes of a single-layer float32 FITS file with sky-like random data"""
+    rng = np.random.default_rng(seed)
+    buffer = BytesIO()
+    fits.PrimaryHDU((rng.standard_normal(shape) * 5 + 100).astype(np.float32)).writeto(buffer)
+    return buffer.getvalue()
+
+# Mock file storage object for testing
+class MockFileStorage:
+    """Stands in for werkzeug's FileStorage: a filename and a stream of the file's contents"""
+    def __init__(self, filepath, filename):
+        self.filepath = filepath
+        self.filename = filename
+        with open(filepath, 'rb') as f:
+            self.stream = BytesIO(f.read())
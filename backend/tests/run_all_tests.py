@@ -18,9 +18,23 @@ os.chdir(tests_dir)
 
 test_files = [
     'test_models.py',
+    'test_encoders.py',
+    'test_fits_loader.py',
+    'test_downsampler.py',
+    'test_percentiles.py',
     'test_history_manager.py',
+    'test_denoiser.py',
+    'test_model_registry.py',
     'test_image_processing.py',
-    'test_controller.py'
+    'test_streaming.py',
+    'test_parallel.py',
+    'test_uploads.py',
+    'test_controller.py',
+    'test_job_queue.py',
+    'test_result_cache.py',
+    'test_app.py',
+    'test_metrics.py',
+    'test_startup.py'
 ]
 
 def run_test(test_file):
@@ -0,0 +1,242 @@
+"""
+Test Module for app.py
+Tests: /colorize-layers response modes (json, binary, url), output formats, ETags,
+       conditional requests, progressive rendering and the paged /history
+
+HOW TO RUN:
+    python tests/test_app.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints the payload size of each response mode and the preview latency
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import app as backend_app
+from helpers import make_fits_bytes
+from io import BytesIO
+from PIL import Image
+import base64
+import time
+
+def post_layers(client, headers=None, **fields):
+    """POST three small layers to /colorize-layers"""
+    data = {
+        'red_file': (BytesIO(make_fits_bytes(11)), 'app_r.fits'),
+        'green_file': (BytesIO(make_fits_bytes(12)), 'app_g.fits'),
+        'blue_file': (BytesIO(make_fits_bytes(13)), 'app_b.fits'),
+        'palette': 'natural',
+        'downsample_factor': '1',
+    }
+    data.update(fields)
+    return client.post('/colorize-layers', data=data, headers=headers or {},
+                       content_type='multipart/form-data')
+
+def test_response_modes():
+    """Test that all response modes deliver the same image"""
+    print("\n" + "="*60)
+    print("TEST 1: Response Modes")
+    print("="*60)
+
+    client = backend_app.app.test_client()
+
+    json_response = post_layers(client)
+    assert json_response.status_code == 200, f"JSON mode failed: {json_response.get_json()}"
+    body = json_response.get_json()
+    png_from_json = base64.b64decode(body['imageData'].split(',', 1)[1])
+    assert body['metadata'] is not None, "JSON mode should include metadata!"
+
+    binary_response = post_layers(client, response_mode='binary')
+    assert binary_response.status_code == 200, "Binary mode failed!"
+    assert binary_response.mimetype == 'image/png', "Binary mode should send a PNG!"
+    assert binary_response.data == png_from_json, "Binary image differs from JSON image!"
+    assert binary_response.headers['ETag'].strip('"') == body['etag'], "ETag mismatch!"
+
+    url_response = post_layers(client, response_mode='url')
+    assert url_response.status_code == 200, "URL mode failed!"
+    image_url = url_response.get_json()['imageUrl']
+    static_response = client.get(image_url)
+    assert static_response.status_code == 200, f"{image_url} not served!"
+    assert static_response.data == png_from_json, "Static image differs from JSON image!"
+    assert 'immutable' in static_response.headers['Cache-Control'], "Results should be immutable!"
+    static_response.close()
+
+    assert post_layers(client, response_mode='xml').status_code == 400, "Bad mode should be 400!"
+
+    jpeg_response = post_layers(client, response_mode='binary', output_format='jpeg', quality='80')
+    assert jpeg_response.mimetype == 'image/jpeg', "Output format should set the MIME type!"
+    assert jpeg_response.data.startswith(b'\xff\xd8'), "Expected JPEG bytes!"
+    tiff_body = post_layers(client, output_format='tiff16').get_json()
+    assert tiff_body['imageData'].startswith('data:image/tiff;base64,'), "Expected a TIFF data URI!"
+    assert post_layers(client, output_format='gif').status_code == 400, "Bad format should be 400!"
+
+    print("✓ PASSED: json, binary and url modes return the same image")
+    print(f"  - JSON body: {len(json_response.data)} bytes, PNG: {len(binary_response.data)} bytes")
+    print(f"  - URL: {image_url}")
+
+def test_conditional_requests():
+    """Test If-None-Match handling"""
+    print("\n" + "="*60)
+    print("TEST 2: Conditional Requests")
+    print("="*60)
+
+    client = backend_app.app.test_client()
+
+    first = post_layers(client, response_mode='binary')
+    etag = first.headers['ETag']
+
+    repeat = post_layers(client, headers={'If-None-Match': etag}, response_mode='binary')
+    assert repeat.status_code == 304, f"Expected 304, got {repeat.status_code}!"
+    assert repeat.data == b'', "304 should have no body!"
+
+    stale = post_layers(client, headers={'If-None-Match': '"stale"'}, response_mode='binary')
+    assert stale.status_code == 200 and stale.data == first.data, "Stale ETag should get the image!"
+
+    image_url = post_layers(client, response_mode='url').get_json()['imageUrl']
+    static_etag = client.get(image_url).headers['ETag']
+    cached = client.get(image_url, headers={'If-None-Match': static_etag})
+    assert cached.status_code == 304, "Static result should support conditional GET!"
+
+    print("✓ PASSED: Matching ETags return 304 Not Modified")
+    print(f"  - ETag: {etag}")
+
+def test_progressive():
+    """Test preview-then-full rendering"""
+    print("\n" + "="*60)
+    print("TEST 3: Progressive Rendering")
+    print("="*60)
+
+    client = backend_app.app.test_client()
+    start = time.perf_counter()
+    response = client.post('/colorize-layers', data={
+        'red_file': (BytesIO(make_fits_bytes(21, (1024, 1024))), 'prog_r.fits'),
+        'green_file': (BytesIO(make_fits_bytes(22, (1024, 1024))), 'prog_g.fits'),
+        'blue_file': (BytesIO(make_fits_bytes(23, (1024, 1024))), 'prog_b.fits'),
+        'palette': 'natural',
+        'downsample_factor': '4',
+        'progressive': '1',
+    }, content_type='multipart/form-data')
+    preview_latency = time.perf_counter() - start
+
+    assert response.status_code == 202, f"Expected 202, got {response.status_code}!"
+    body = response.get_json()
+    assert 'preview_error' not in body, f"Preview failed: {body.get('preview_error')}"
+    preview = body['preview']
+    assert preview['imageData'].startswith('data:image/jpeg;base64,'), "Preview should be a JPEG!"
+    preview_image = Image.open(BytesIO(base64.b64decode(preview['imageData'].split(',', 1)[1])))
+    assert max(preview_image.size) <= 512, f"Preview too large: {preview_image.size}!"
+
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        status = client.get(body['status_url']).get_json()
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.1)
+    full_latency = time.perf_counter() - start
+
+    assert status['status'] == 'done', f"Full render did not succeed: {status}!"
+    result = client.get(body['result_url']).get_json()
+    full_image = Image.open(BytesIO(base64.b64decode(result['imageData'].split(',', 1)[1])))
+    assert full_image.size == (256, 256), f"Unexpected full size {full_image.size}!"
+
+    print("✓ PASSED: Preview returned first, full render delivered through the job")
+    print(f"  - Preview {preview_image.size} after {preview_latency * 1000:.0f} ms "
+          f"(incl. upload), full {full_image.size} after {full_latency:.1f} s")
+
+def test_history_pages():
+    """Test cursor paging, filters, projection and ETags of /history"""
+    print("\n" + "="*60)
+    print("TEST 4: Paged History")
+    print("="*60)
+
+    from history_manager import HistoryManager
+    from models import HistoryItem
+    import tempfile
+    import shutil
+
+    client = backend_app.app.test_client()
+    controller = backend_app.get_controller()
+    history_manager = controller.history_manager
+    tmp_dir = tempfile.mkdtemp()
+    controller.history_manager = HistoryManager(db_path=os.path.join(tmp_dir, 'history.db'),
+                                                legacy_file=None)
+    try:
+        for i in range(12):
+            controller.history_manager.add_entry(HistoryItem(
+                f"page{i}.fits", {'palette': 'hubble' if i % 2 else 'natural'},
+                "Failure" if i == 4 else "Success"))
+
+        # Follow the Link headers through all pages
+        names = []
+        url = '/history?limit=5&fields=filename'
+        pages = 0
+        while url:
+            response = client.get(url)
+            assert response.status_code == 200, f"Page failed: {response.get_json()}"
+            assert all(set(entry) == {'filename'} for entry in response.get_json()), "Projection ignored!"
+            names.extend(entry['filename'] for entry in response.get_json())
+            link = response.headers.get('Link')
+            url = link[1:link.index('>')] if link else None
+            pages += 1
+        assert pages == 3 and names == [f"page{i}.fits" for i in reversed(range(12))], \
+            f"Paging returned {names}!"
+
+        response = client.get('/history?status=Failure')
+        assert [entry['filename'] for entry in response.get_json()] == ["page4.fits"], "Status filter!"
+        response = client.get('/history?palette=hubble&filename=page1')
+        assert [entry['filename'] for entry in response.get_json()] == ["page11.fits", "page1.fits"], \
+            "Palette and filename filters!"
+
+        # Unchanged history: 304 without a body; any change: a new ETag
+        first = client.get('/history?limit=3')
+        etag = first.headers['ETag']
+        assert 'no-cache' in first.headers['Cache-Control'], "Browsers should revalidate!"
+        cached = client.get('/history?limit=3', headers={'If-None-Match': etag})
+        assert cached.status_code == 304 and cached.data == b'', "Unchanged history should be a 304!"
+        other_query = client.get('/history?limit=4', headers={'If-None-Match': etag})
+        assert other_query.status_code == 200, "Another query should not match the ETag!"
+        controller.history_manager.add_entry(HistoryItem("new.fits", {}, "Success"))
+        changed = client.get('/history?limit=3', headers={'If-None-Match': etag})
+        assert changed.status_code == 200 and changed.get_json()[0]['filename'] == "new.fits", \
+            "A new entry should invalidate the ETag!"
+
+        for bad in ('limit=0', 'limit=x', 'cursor=abc', 'since=yesterday', 'fields=secret'):
+            assert client.get(f'/history?{bad}').status_code == 400, f"{bad} should be rejected!"
+    finally:
+        controller.history_manager.close()
+        controller.history_manager = history_manager
+        shutil.rmtree(tmp_dir)
+
+    print("✓ PASSED: Cursor pages, filters, projection and 304s")
+    print(f"  - ETag: {etag}")
+
+def run_all_tests():
+    """Run all app tests"""
+    print("\n" + "#"*60)
+    print("# TESTING app.py")
+    print("#"*60)
+
+    try:
+        test_response_modes()
+        test_conditional_requests()
+        test_progressive()
+        test_history_pages()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
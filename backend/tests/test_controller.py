@@ -15,7 +15,7 @@ EXPECTED OUTPUT:
     - All tests should print "✓ PASSED"
     - Creates colorized images from real FITS data
     - Generates Base64 encoded images
-    - Updates history.json
+    - Updates history.db
 """
 
 import sys
@@ -23,22 +23,15 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from controller import AppController
+from history_manager import HistoryManager
+from helpers import MockFileStorage, make_fits_bytes
 import base64
 import json
+import shutil
+import tempfile
 from io import BytesIO
 from PIL import Image
 
-# Mock file storage object for testing
-class MockFileStorage:
-    def __init__(self, filepath, filename):
-        self.filepath = filepath
-        self.filename = filename
-    
-    def save(self, destination):
-        """Copy file to destination"""
-        import shutil
-        shutil.copy(self.filepath, destination)
-
 def test_controller_initialization():
     """Test AppController initialization"""
     print("\n" + "="*60)
@@ -49,13 +42,11 @@ def test_controller_initialization():
     
     assert controller.image_processor is not None, "ImageProcessor not initialized!"
     assert controller.history_manager is not None, "HistoryManager not initialized!"
-    assert os.path.exists('uploads'), "Upload folder not created!"
     assert os.path.exists('static'), "Static folder not created!"
     
     print("✓ PASSED: AppController initialized successfully")
     print(f"  - ImageProcessor: {type(controller.image_processor).__name__}")
     print(f"  - HistoryManager: {type(controller.history_manager).__name__}")
-    print(f"  - Upload folder exists: {os.path.exists('uploads')}")
     print(f"  - Static folder exists: {os.path.exists('static')}")
 
 def test_colorize_with_real_fits():
@@ -233,6 +224,9 @@ def test_history_logging():
         return
     
     controller = AppController()
+    # Own database: controllers of the other tests may still flush queued entries into the shared one
+    tmp_dir = tempfile.mkdtemp()
+    controller.history_manager = HistoryManager(db_path=os.path.join(tmp_dir, 'history.db'), legacy_file=None)
     
     # Get initial history count
     initial_history = controller.get_history()
@@ -260,6 +254,8 @@ def test_history_logging():
     print(f"  - Updated count: {len(updated_history)}")
     print(f"  - Latest entry: {updated_history[0]['filename']}")
     print(f"  - Status: {updated_history[0]['status']}")
+    controller.history_manager.close()
+    shutil.rmtree(tmp_dir)
 
 def test_metadata_extraction():
     """Test that FITS metadata is extracted correctly"""
@@ -296,6 +292,50 @@ def test_metadata_extraction():
     print(f"  - Number of metadata keys: {len(metadata)}")
     print(f"  - Sample metadata keys: {list(metadata.keys())[:10]}")
 
+def test_failure_logging():
+    """Test that failed requests are logged through the write-behind queue too"""
+    print("\n" + "="*60)
+    print("TEST 7: Failure Logging")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    controller = AppController()
+    controller.history_manager = HistoryManager(db_path=os.path.join(tmp_dir, 'history.db'),
+                                                legacy_file=None, write_behind=True, flush_interval=60)
+    try:
+        broken = {channel: MockFileStorage(__file__, f'broken_{channel}.fits')
+                  for channel in ('red', 'green', 'blue')}
+        result, error = controller.colorize_layers(broken, {'palette': 'natural'})
+        assert result is None and error, "Colorizing a non-FITS file should fail!"
+
+        # Queued, not yet written: the request did not wait for the database
+        assert len(controller.history_manager._pending) == 1, "Failure should go through the queue!"
+        latest = controller.get_history()[0]
+        assert latest['status'] == "Failure" and 'broken_red.fits' in latest['filename'], \
+            f"Failure not recorded: {latest}"
+
+        # A result that cannot be written is a failure only, not also a success
+        layers = {}
+        for seed, channel in enumerate(('red', 'green', 'blue')):
+            path = os.path.join(tmp_dir, f'{channel}.fits')
+            with open(path, 'wb') as f:
+                f.write(make_fits_bytes(seed, (32, 32)))
+            layers[channel] = MockFileStorage(path, f'unwritable_{channel}.fits')
+        def fail_to_write(*args):
+            raise OSError("disk full")
+        controller._format_result = fail_to_write
+        result, error = controller.colorize_layers(layers, {'palette': 'natural', 'use_denoising': False},
+                                                   response_mode='url')
+        assert result is None and error == "disk full", "Formatting error not reported!"
+        statuses = [entry['status'] for entry in controller.get_history()]
+        assert statuses == ["Failure", "Failure"], f"Unwritable result also logged as a success: {statuses}"
+    finally:
+        controller.history_manager.close()
+        shutil.rmtree(tmp_dir)
+
+    print("✓ PASSED: Failed request logged")
+    print(f"  - Error: {error[:60]}")
+
 def run_all_tests():
     """Run all controller tests"""
     print("\n" + "#"*60)
@@ -309,6 +349,7 @@ def run_all_tests():
         test_custom_parameters()
         test_history_logging()
         test_metadata_extraction()
+        test_failure_logging()
         
         print("\n" + "="*60)
         print("✓✓✓ ALL TESTS PASSED ✓✓✓")
@@ -318,7 +359,7 @@ def run_all_tests():
         print("  - test_output_controller_hubble.png")
         print("  - test_output_controller_custom.png")
         print("  - test_output_controller_custom_params.png")
-        print("  - history.json (updated)")
+        print("  - history.db (updated)")
         print("\nThese are real colorized astronomical images from M51!")
         
     except AssertionError as e:
@@ -0,0 +1,257 @@
+"""
+Test Module for denoiser.py
+Tests: DnCNN, AstronomicalDenoiser
+
+HOW TO RUN:
+    python tests/test_denoiser.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Works without pre-trained weights (randomly initialized model)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from denoiser import (AstronomicalDenoiser, DenoiserEngine, DnCNN, fuse_dncnn, psnr,
+                      default_artifact_path)
+import numpy as np
+import torch
+import tempfile
+import shutil
+
+def create_noisy_channel(height=150, width=110):
+    """Create a synthetic noisy 2D channel"""
+    rng = np.random.default_rng(3)
+    y, x = np.mgrid[0:height, 0:width]
+    signal = np.exp(-((x - width / 2) ** 2 + (y - height / 2) ** 2) / 800.0) * 1000
+    return (signal + rng.normal(50, 5, (height, width))).astype(np.float32)
+
+def create_denoiser(**kwargs):
+    """Create a denoiser with deterministic random weights"""
+    torch.manual_seed(0)
+    return AstronomicalDenoiser(model_path='models/does_not_exist.pth', **kwargs)
+
+def test_tiled_matches_whole_image():
+    """Test that tiled inference equals whole-image inference"""
+    print("\n" + "="*60)
+    print("TEST 1: Tiled Inference Matches Whole Image")
+    print("="*60)
+
+    channel = create_noisy_channel()
+
+    whole = create_denoiser(tile_size=None).denoise_channel(channel)
+    tiled = create_denoiser(tile_size=48).denoise_channel(channel)
+
+    assert tiled.shape == channel.shape, "Tiled output shape mismatch!"
+    assert tiled.dtype == np.float32, "Output should be float32!"
+    max_diff = np.abs(tiled - whole).max() / (channel.max() - channel.min())
+    assert max_diff < 1e-4, f"Tiled result differs from whole image (max rel diff {max_diff})!"
+
+    print("✓ PASSED: Tiles blend without seams")
+    print(f"  - Max relative difference: {max_diff:.2e}")
+
+def test_tiles_cover_image():
+    """Test that tile cores cover every pixel exactly once"""
+    print("\n" + "="*60)
+    print("TEST 2: Tile Coverage")
+    print("="*60)
+
+    denoiser = create_denoiser(tile_size=40, tile_overlap=10)
+    coverage = np.zeros((97, 131), dtype=int)
+    for (top, bottom, left, right), (p_top, p_bottom, p_left, p_right) in denoiser._tiles(97, 131):
+        coverage[top:bottom, left:right] += 1
+        assert p_top <= top and p_bottom >= bottom, "Halo should contain the core!"
+        assert p_left <= left and p_right >= right, "Halo should contain the core!"
+
+    assert (coverage == 1).all(), "Every pixel should belong to exactly one tile core!"
+
+    print("✓ PASSED: Tile cores partition the image")
+
+def test_constant_channel():
+    """Test that a flat channel is returned unchanged"""
+    print("\n" + "="*60)
+    print("TEST 3: Constant Channel")
+    print("="*60)
+
+    channel = np.full((64, 64), 7.0, dtype=np.float32)
+    result = create_denoiser().denoise_channel(channel)
+    assert np.array_equal(result, channel), "Flat channel should be unchanged!"
+
+    print("✓ PASSED: Constant channel handled")
+
+def test_batched_cube_matches_channels():
+    """Test that the batched cube path equals channel-by-channel denoising"""
+    print("\n" + "="*60)
+    print("TEST 4: Batched Cube Denoising")
+    print("="*60)
+
+    cube = np.stack([create_noisy_channel(), create_noisy_channel()[::-1] * 2,
+                     np.full((150, 110), 3.0, dtype=np.float32)])
+    cube[0, 10, 10] = np.nan
+
+    denoiser = create_denoiser(tile_size=64)
+    batched = denoiser.denoise_fits_cube(cube)
+    per_channel = np.stack([denoiser.denoise_channel(layer) for layer in cube])
+
+    assert batched.shape == cube.shape, "Cube shape mismatch!"
+    assert np.isfinite(batched).all(), "NaNs should be cleaned!"
+    assert np.allclose(batched, per_channel, rtol=1e-5, atol=1e-3), "Batched result differs!"
+
+    # Integer cubes (e.g. BITPIX=16 files) are denoised into float32, their full range
+    # normalized without wrapping around
+    layers = np.nan_to_num(cube[:2, :64, :64])
+    low = layers.min(axis=(1, 2), keepdims=True)
+    high = layers.max(axis=(1, 2), keepdims=True)
+    integer_cube = np.round((layers - low) / (high - low) * 60000 - 30000).astype(np.int16)
+    denoised = denoiser.denoise_fits_cube(integer_cube)
+    expected = denoiser.denoise_fits_cube(integer_cube.astype(np.float32))
+    assert denoised.dtype == np.float32, f"Integer cube gave {denoised.dtype}!"
+    assert np.allclose(denoised, expected, rtol=1e-5, atol=1e-3), "Integer cube result differs!"
+    assert np.allclose(denoiser.denoise_channel(integer_cube[0]), expected[0], rtol=1e-5, atol=1e-3), \
+        "Integer channel result differs!"
+
+    print("✓ PASSED: Batched cube matches per-channel denoising")
+
+def test_fused_conv_bn():
+    """Test that folding BatchNorm into the convs keeps the output"""
+    print("\n" + "="*60)
+    print("TEST 5: Fused Conv+BN")
+    print("="*60)
+
+    torch.manual_seed(1)
+    model = DnCNN()
+    # Give the BatchNorm layers non-trivial statistics
+    for layer in model.dncnn:
+        if isinstance(layer, torch.nn.BatchNorm2d):
+            layer.running_mean.uniform_(-0.1, 0.1)
+            layer.running_var.uniform_(0.5, 1.5)
+    model.eval()
+
+    fused = fuse_dncnn(model)
+    assert not any(isinstance(l, torch.nn.BatchNorm2d) for l in fused.dncnn), "BatchNorm left in fused model!"
+
+    x = torch.rand(2, 1, 40, 36)
+    with torch.no_grad():
+        max_diff = (fused(x) - model(x)).abs().max().item()
+    assert max_diff < 1e-4, f"Fused model differs by {max_diff}!"
+
+    print("✓ PASSED: Fused model matches eager model")
+    print(f"  - Layers: {len(model.dncnn)} -> {len(fused.dncnn)}")
+
+def test_exported_backends():
+    """Test TorchScript and ONNX Runtime backends against eager"""
+    print("\n" + "="*60)
+    print("TEST 6: TorchScript / ONNX Backends")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        torch.manual_seed(2)
+        weights = os.path.join(tmp_dir, 'dncnn.pth')
+        torch.save(DnCNN().state_dict(), weights)
+
+        channel = create_noisy_channel(90, 70)
+        eager = AstronomicalDenoiser(model_path=weights, tile_size=48).denoise_channel(channel)
+
+        for backend in ('torchscript', 'onnx'):
+            denoiser = AstronomicalDenoiser(model_path=weights, tile_size=48, backend=backend)
+            if denoiser.backend != backend:
+                print(f"  ⊗ {backend}: not available, fell back to {denoiser.backend}")
+                continue
+            result = denoiser.denoise_channel(channel)
+            max_diff = np.abs(result - eager).max() / (channel.max() - channel.min())
+            assert max_diff < 1e-4, f"{backend} differs from eager by {max_diff}!"
+            print(f"  ✓ {backend}: max relative difference {max_diff:.2e}")
+
+        # No weights: no artifact exported from a random model
+        missing = os.path.join(tmp_dir, 'missing.pth')
+        engine = DenoiserEngine(missing, torch.device('cpu'), backend='torchscript')
+        assert engine.backend == 'eager', "Missing weights should fall back to eager!"
+        assert not os.path.exists(default_artifact_path(missing, 'torchscript')), "Exported random weights!"
+
+        # New weights: the artifact exported from the old ones is rebuilt
+        artifact = default_artifact_path(weights, 'torchscript')
+        if os.path.exists(artifact):
+            torch.manual_seed(5)
+            torch.save(DnCNN().state_dict(), weights)
+            later = os.path.getmtime(artifact) + 10
+            os.utime(weights, (later, later))
+            batch = (channel[np.newaxis, :48, :48] - channel.min()) / (channel.max() - channel.min())
+            batch = batch.astype(np.float32)
+            expected = DenoiserEngine(weights, torch.device('cpu')).run(batch)
+            exported = DenoiserEngine(weights, torch.device('cpu'), backend='torchscript')
+            assert exported.backend == 'torchscript', "Re-export failed!"
+            assert np.abs(exported.run(batch) - expected).max() < 1e-4, "Stale artifact used!"
+            print("  ✓ torchscript: artifact rebuilt after the weights changed")
+
+        try:
+            AstronomicalDenoiser(model_path=weights, backend='tensorrt')
+            assert False, "Should have raised ValueError!"
+        except ValueError:
+            pass
+
+        print("✓ PASSED: Exported backends match eager inference")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_reduced_precision():
+    """Test int8 / bf16 modes and the PSNR accuracy guard"""
+    print("\n" + "="*60)
+    print("TEST 7: Reduced Precision Modes")
+    print("="*60)
+
+    channel = create_noisy_channel(96, 80)
+    reference = create_denoiser(tile_size=None).denoise_channel(channel)
+
+    for precision in ('int8', 'bf16'):
+        denoiser = create_denoiser(tile_size=None, precision=precision, min_psnr=30.0)
+        result = denoiser.denoise_channel(channel)
+        score = psnr(reference, result, data_range=channel.max() - channel.min())
+        assert result.shape == channel.shape, f"{precision}: shape mismatch!"
+        assert denoiser.precision in (precision, 'fp32'), f"{precision}: unexpected precision!"
+        print(f"  ✓ {precision}: running as {denoiser.precision}, PSNR {score:.1f} dB vs fp32")
+
+    # An unreachable accuracy target must fall back to fp32
+    guarded = create_denoiser(precision='int8', min_psnr=float('inf'))
+    assert guarded.precision == 'fp32', "Accuracy guard should reject int8!"
+
+    try:
+        create_denoiser(precision='fp8')
+        assert False, "Should have raised ValueError!"
+    except ValueError:
+        pass
+
+    print("✓ PASSED: Reduced precision modes guarded by PSNR")
+
+def run_all_tests():
+    """Run all denoiser tests"""
+    print("\n" + "#"*60)
+    print("# TESTING denoiser.py")
+    print("#"*60)
+
+    try:
+        test_tiled_matches_whole_image()
+        test_tiles_cover_image()
+        test_constant_channel()
+        test_batched_cube_matches_channels()
+        test_fused_conv_bn()
+        test_exported_backends()
+        test_reduced_precision()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,138 @@
+"""
+Test Module for downsampler.py
+Tests: Downsampler
+
+HOW TO RUN:
+    python tests/test_downsampler.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints output shapes for each downsampling mode
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from downsampler import Downsampler, DOWNSAMPLE_MODES
+import numpy as np
+
+def create_test_layer(height=203, width=157):
+    """Create a synthetic 2D layer with some structure"""
+    rng = np.random.default_rng(7)
+    y, x = np.mgrid[0:height, 0:width]
+    return (np.sin(x / 5.0) * np.cos(y / 7.0) * 100 + rng.random((height, width)) * 10).astype(np.float32)
+
+def run_downsampler(downsampler, data):
+    """Downsample a whole array through the chunked API"""
+    out = np.empty(downsampler.output_shape(data.shape), dtype=np.float32)
+    downsampler.downsample_into(data, data.shape, out)
+    return out
+
+def test_block_modes():
+    """Test stride, mean and median against straightforward numpy versions"""
+    print("\n" + "="*60)
+    print("TEST 1: Stride / Mean / Median Modes")
+    print("="*60)
+
+    data = create_test_layer()
+    f = 4
+    h, w = data.shape[0] // f, data.shape[1] // f
+    blocks = data[:h * f, :w * f].reshape(h, f, w, f)
+
+    stride = run_downsampler(Downsampler('stride', factor=f, chunk_rows=5), data)
+    assert np.array_equal(stride, data[::f, ::f]), "Stride mode should equal strided slicing!"
+
+    mean = run_downsampler(Downsampler('mean', factor=f, chunk_rows=5), data)
+    assert mean.shape == (h, w), f"Unexpected mean shape {mean.shape}!"
+    assert np.allclose(mean, blocks.mean(axis=(1, 3)), atol=1e-4), "Block mean mismatch!"
+
+    median = run_downsampler(Downsampler('median', factor=f, chunk_rows=5), data)
+    expected = np.median(blocks.transpose(0, 2, 1, 3).reshape(h, w, f * f), axis=-1)
+    assert np.allclose(median, expected), "Block median mismatch!"
+
+    print("✓ PASSED: Block modes match numpy references")
+    print(f"  - stride: {stride.shape}, mean: {mean.shape}, median: {median.shape}")
+
+def test_area_mode():
+    """Test area resampling, including non-integer scales"""
+    print("\n" + "="*60)
+    print("TEST 2: Area Resampling")
+    print("="*60)
+
+    data = create_test_layer(200, 160)
+
+    # With an integer scale, area resampling is a block mean
+    area = run_downsampler(Downsampler('area', factor=4, chunk_rows=6), data)
+    mean = run_downsampler(Downsampler('mean', factor=4), data)
+    assert np.allclose(area, mean, atol=1e-3), "Integer-scale area should equal block mean!"
+
+    # Non-integer scale: chunked result must equal a single-chunk result
+    chunked = run_downsampler(Downsampler('area', max_size=70, chunk_rows=4), data)
+    whole = run_downsampler(Downsampler('area', max_size=70, chunk_rows=10000), data)
+    assert chunked.shape == (70, 56), f"Unexpected area shape {chunked.shape}!"
+    assert np.allclose(chunked, whole, atol=1e-3), "Chunking should not change area output!"
+    assert abs(chunked.mean() - data.mean()) < 1.0, "Area resampling should preserve mean flux!"
+
+    print("✓ PASSED: Area resampling works")
+    print(f"  - max_size=70 shape: {chunked.shape}")
+
+def test_max_size():
+    """Test the longest-edge target size"""
+    print("\n" + "="*60)
+    print("TEST 3: Longest Edge Target Size")
+    print("="*60)
+
+    shape = (2000, 1500)
+    for mode in DOWNSAMPLE_MODES:
+        out_shape = Downsampler(mode, max_size=512).output_shape(shape)
+        assert max(out_shape) <= 512, f"{mode}: longest edge {max(out_shape)} exceeds target!"
+        print(f"  ✓ {mode}: {shape} -> {out_shape}")
+
+    # A target larger than the image keeps full resolution
+    assert Downsampler('mean', max_size=4096).output_shape(shape) == shape, "Should not upscale!"
+
+    print("✓ PASSED: Target size respected")
+
+def test_invalid_settings():
+    """Test that bad settings are rejected"""
+    print("\n" + "="*60)
+    print("TEST 4: Invalid Settings")
+    print("="*60)
+
+    for kwargs in ({'mode': 'bicubic'}, {'factor': 0}, {'max_size': 0}):
+        try:
+            Downsampler(**kwargs)
+            assert False, f"Should have raised ValueError for {kwargs}!"
+        except ValueError as e:
+            print(f"  ✓ {kwargs}: {e}")
+
+    print("✓ PASSED: Invalid settings rejected")
+
+def run_all_tests():
+    """Run all downsampler tests"""
+    print("\n" + "#"*60)
+    print("# TESTING downsampler.py")
+    print("#"*60)
+
+    try:
+        test_block_modes()
+        test_area_mode()
+        test_max_size()
+        test_invalid_settings()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,179 @@
+"""
+Test Module for encoders.py
+Tests: PNGWriter, write_png, write_tiff16 (classic and BigTIFF), 16-bit export through ProcessedImage
+
+HOW TO RUN:
+    python tests/test_encoders.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints encode times and sizes of each output format for a 2k image
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from encoders import PNGWriter, TIFFWriter, write_png, write_tiff16
+from models import ProcessedImage
+from PIL import Image
+from io import BytesIO
+import numpy as np
+import struct
+import zlib
+import time
+
+def decode_png(png_bytes):
+    """Decode an unfiltered RGB PNG by hand, checking every chunk CRC"""
+    assert png_bytes[:8] == PNGWriter.SIGNATURE, "Missing PNG signature!"
+    data = png_bytes[8:]
+    chunks = []
+    while data:
+        length, = struct.unpack('>I', data[:4])
+        tag, body = data[4:8], data[8:8 + length]
+        crc, = struct.unpack('>I', data[8 + length:12 + length])
+        assert crc == zlib.crc32(tag + body), f"Bad CRC in {tag} chunk!"
+        chunks.append((tag, body))
+        data = data[12 + length:]
+
+    width, height, bit_depth, color_type = struct.unpack('>IIBB', chunks[0][1][:10])
+    assert chunks[0][0] == b'IHDR' and chunks[-1][0] == b'IEND', "Bad chunk order!"
+    assert color_type == 2, "Expected an RGB PNG!"
+    idat = b''.join(body for tag, body in chunks if tag == b'IDAT')
+    dtype = np.dtype('>u2') if bit_depth == 16 else np.dtype(np.uint8)
+    raw = np.frombuffer(zlib.decompress(idat), dtype=np.uint8).reshape(height, -1)
+    assert (raw[:, 0] == 0).all(), "Expected filter type 0 on every row!"
+    return raw[:, 1:].copy().view(dtype).reshape(height, width, 3)
+
+def test_png16():
+    """Test 16-bit PNG encoding"""
+    print("\n" + "="*60)
+    print("TEST 1: 16-bit PNG")
+    print("="*60)
+
+    rgb = np.random.default_rng(0).integers(0, 65536, (45, 67, 3)).astype(np.uint16)
+    buffer = BytesIO()
+    write_png(buffer, rgb, compress_level=1)
+
+    assert np.array_equal(decode_png(buffer.getvalue()), rgb), "16-bit PNG round trip failed!"
+    # Third-party decoders accept it too
+    assert Image.open(BytesIO(buffer.getvalue())).size == (67, 45), "Pillow cannot read the PNG!"
+
+    print("✓ PASSED: 16-bit PNG round trip is lossless")
+
+def test_png_writer_rows():
+    """Test writing a PNG in row blocks"""
+    print("\n" + "="*60)
+    print("TEST 2: Row-block PNG Writer")
+    print("="*60)
+
+    rgb = np.random.default_rng(1).integers(0, 256, (50, 40, 3)).astype(np.uint8)
+    buffer = BytesIO()
+    writer = PNGWriter(buffer, 40, 50)
+    for start in range(0, 50, 16):
+        writer.write_rows(rgb[start:start + 16])
+    writer.close()
+
+    assert np.array_equal(decode_png(buffer.getvalue()), rgb), "Row-block PNG differs!"
+    assert np.array_equal(np.asarray(Image.open(BytesIO(buffer.getvalue()))), rgb), "Pillow decode differs!"
+
+    try:
+        PNGWriter(BytesIO(), 40, 50).close()
+        assert False, "Closing an incomplete PNG should raise ValueError!"
+    except ValueError:
+        pass
+
+    print("✓ PASSED: Rows written in blocks form one valid PNG")
+
+def test_tiff16():
+    """Test 16-bit TIFF encoding"""
+    print("\n" + "="*60)
+    print("TEST 3: 16-bit TIFF")
+    print("="*60)
+
+    rgb = np.random.default_rng(2).integers(0, 65536, (30, 20, 3)).astype(np.uint16)
+    for bigtiff in (False, True):
+        buffer = BytesIO()
+        if bigtiff:
+            writer = TIFFWriter(buffer, 20, 30, bigtiff=True)
+            writer.write_rows(rgb)
+            writer.close()
+        else:
+            write_tiff16(buffer, rgb)
+
+        image = Image.open(BytesIO(buffer.getvalue()))
+        assert image.size == (20, 30), "Wrong TIFF size!"
+        codec, _, offset, args = image.tile[0]
+        assert args[0] == 'RGB;16L', f"Expected 16-bit RGB samples, got {args[0]}!"
+        decoded = np.frombuffer(buffer.getvalue(), dtype='<u2', count=rgb.size, offset=offset)
+        assert np.array_equal(decoded.reshape(rgb.shape), rgb), "TIFF pixel data differs!"
+        print(f"  ✓ {'BigTIFF' if bigtiff else 'classic TIFF'}: read back losslessly")
+
+    # Past 4 GB of pixels the offsets need 64 bits: BigTIFF is picked automatically
+    header = BytesIO()
+    writer = TIFFWriter(header, 30000, 30000)
+    assert writer.bigtiff and header.getvalue()[2:4] == b'+\x00', "Large image should be a BigTIFF!"
+    assert not TIFFWriter(BytesIO(), 20, 30).bigtiff, "Small images should stay classic TIFF!"
+    try:
+        TIFFWriter(BytesIO(), 30000, 30000, bigtiff=False)
+        assert False, "Classic TIFF over 4 GB should be rejected!"
+    except ValueError:
+        pass
+
+    print("✓ PASSED: 16-bit TIFF is readable and lossless")
+
+def test_processed_image_formats():
+    """Test 16-bit exports keep the float precision"""
+    print("\n" + "="*60)
+    print("TEST 4: ProcessedImage Output Formats")
+    print("="*60)
+
+    y, x = np.mgrid[0:2048, 0:2048] / 2048.0
+    rgb = np.dstack([x, y, (x + y) / 2]).astype(np.float32)
+    rgb8 = np.clip(rgb * 255, 0, 255).astype(np.uint8)
+    image = ProcessedImage(Image.fromarray(rgb8, mode='RGB'), rgb=rgb)
+
+    png16 = decode_png(image.export_to('png16', compress_level=1))
+    assert len(np.unique(png16[..., 0])) > 256, "16-bit export should keep more than 256 levels!"
+    assert np.abs((png16 >> 8).astype(int) - rgb8).max() <= 1, "16-bit export should match the 8-bit image!"
+
+    # Without the float image the 8-bit data is scaled up
+    upscaled = ProcessedImage(Image.fromarray(rgb8, mode='RGB')).to_uint16()
+    assert np.array_equal(upscaled, rgb8.astype(np.uint16) * 257), "8-bit upscaling is wrong!"
+
+    print("✓ PASSED: 16-bit exports use the float data")
+    for fmt, options in [('png', {'compress_level': 6}), ('png', {'compress_level': 1}),
+                         ('jpeg', {'quality': 85}), ('webp', {'quality': 85}),
+                         ('png16', {'compress_level': 1}), ('tiff16', {})]:
+        start = time.perf_counter()
+        encoded = image.export_to(fmt, **options)
+        elapsed = time.perf_counter() - start
+        print(f"  - {fmt:6s} {options}: {elapsed * 1000:7.1f} ms, {len(encoded) / 1e6:6.2f} MB")
+
+def run_all_tests():
+    """Run all encoders tests"""
+    print("\n" + "#"*60)
+    print("# TESTING encoders.py")
+    print("#"*60)
+
+    try:
+        test_png16()
+        test_png_writer_rows()
+        test_tiff16()
+        test_processed_image_formats()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,198 @@
+"""
+Test Module for fits_loader.py
+Tests: FITSLoader
+
+HOW TO RUN:
+    python tests/test_fits_loader.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Writes temporary FITS files and removes them afterwards
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from fits_loader import FITSLoader
+from downsampler import Downsampler
+from models import FITSData
+from astropy.io import fits
+import numpy as np
+from io import BytesIO
+import tempfile
+import shutil
+
+def write_test_layers(directory, shapes):
+    """Write one synthetic FITS layer per shape and return the paths"""
+    paths = []
+    rng = np.random.default_rng(42)
+    for index, shape in enumerate(shapes):
+        data = rng.random(shape).astype(np.float32) * 1000
+        path = os.path.join(directory, f"layer_{index}.fits")
+        hdu = fits.PrimaryHDU(data)
+        hdu.header['FILTER'] = f"F{index}"
+        hdu.writeto(path, overwrite=True)
+        paths.append(path)
+    return paths
+
+def test_load_cube_matches_strided_slicing():
+    """Test that section-wise loading equals full load + strided slicing"""
+    print("\n" + "="*60)
+    print("TEST 1: Section-wise Loading Matches Strided Slicing")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = write_test_layers(tmp_dir, [(203, 157)] * 3)
+
+        # Small chunks so several section reads are needed per layer
+        loader = FITSLoader(chunk_rows=7)
+        fits_obj = loader.load_cube(paths, downsample_factor=4)
+
+        assert isinstance(fits_obj, FITSData), "Should return FITSData!"
+        assert fits_obj.data.shape == (3, 51, 40), f"Unexpected shape {fits_obj.data.shape}!"
+        assert fits_obj.data.dtype == np.float32, "Cube should be float32!"
+
+        for index, path in enumerate(paths):
+            expected = fits.getdata(path)[::4, ::4]
+            assert np.array_equal(fits_obj.data[index], expected), f"Channel {index} mismatch!"
+
+        assert fits_obj.header['FILTER'] == 'F0', "Header should come from the first layer!"
+
+        print("✓ PASSED: Downsampled cube matches strided slicing")
+        print(f"  - Cube shape: {fits_obj.data.shape}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_load_cube_full_resolution():
+    """Test loading without downsampling"""
+    print("\n" + "="*60)
+    print("TEST 2: Full Resolution Loading")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = write_test_layers(tmp_dir, [(64, 48)] * 3)
+        fits_obj = FITSLoader(chunk_rows=10).load_cube(paths, downsample_factor=1)
+
+        assert fits_obj.data.shape == (3, 64, 48), "Shape should be unchanged!"
+        assert np.array_equal(fits_obj.data[2], fits.getdata(paths[2])), "Data mismatch!"
+
+        print("✓ PASSED: Full resolution cube loaded")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_load_cube_block_mean():
+    """Test loading through an anti-aliased block-mean downsampler"""
+    print("\n" + "="*60)
+    print("TEST 3: Block-mean Downsampled Loading")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = write_test_layers(tmp_dir, [(120, 90)] * 3)
+        downsampler = Downsampler(mode='mean', factor=3, chunk_rows=4)
+        fits_obj = FITSLoader().load_cube(paths, downsampler=downsampler)
+
+        assert fits_obj.data.shape == (3, 40, 30), f"Unexpected shape {fits_obj.data.shape}!"
+        expected = fits.getdata(paths[1]).reshape(40, 3, 30, 3).mean(axis=(1, 3))
+        assert np.allclose(fits_obj.data[1], expected, atol=1e-3), "Block mean mismatch!"
+
+        print("✓ PASSED: Block-mean cube loaded")
+        print(f"  - Cube shape: {fits_obj.data.shape}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_mismatched_layers():
+    """Test that layers with different sizes are rejected"""
+    print("\n" + "="*60)
+    print("TEST 4: Mismatched Layer Dimensions")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        paths = write_test_layers(tmp_dir, [(64, 48), (64, 48), (32, 48)])
+
+        try:
+            FITSLoader().load_cube(paths, downsample_factor=2)
+            assert False, "Should have raised ValueError!"
+        except ValueError as e:
+            print(f"✓ PASSED: Correctly raised ValueError: {e}")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_scaled_layers():
+    """Test layers stored with BZERO/BSCALE (unsigned 16-bit and scaled integers)"""
+    print("\n" + "="*60)
+    print("TEST 5: Scaled Integer Layers")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(7)
+        expected = []
+        paths = []
+        for index in range(3):
+            path = os.path.join(tmp_dir, f"scaled_{index}.fits")
+            if index < 2:
+                # Unsigned 16-bit: stored as BITPIX=16 with BZERO=32768
+                data = rng.integers(0, 65536, (60, 40)).astype(np.uint16)
+                fits.PrimaryHDU(data).writeto(path)
+            else:
+                data = rng.integers(-1000, 1000, (60, 40)).astype(np.int16)
+                hdu = fits.PrimaryHDU(data)
+                hdu.header['BSCALE'] = 0.5
+                hdu.header['BZERO'] = 100.0
+                hdu.writeto(path)
+                data = data * 0.5 + 100.0
+            paths.append(path)
+            expected.append(data.astype(np.float32))
+        assert 'BZERO' in fits.getheader(paths[0]), "uint16 layer should be stored scaled!"
+
+        fits_obj = FITSLoader().load_cube(paths)
+        assert np.array_equal(fits_obj.data, np.stack(expected)), "Scaled data read wrong!"
+
+        # Uploads are parsed from memory
+        in_memory = []
+        for path in paths:
+            with open(path, 'rb') as f:
+                in_memory.append(BytesIO(f.read()))
+        assert np.array_equal(FITSLoader().load_cube(in_memory).data, fits_obj.data), \
+            "In-memory scaled data read wrong!"
+
+        downsampled = FITSLoader().load_cube(paths, downsampler=Downsampler(mode='mean', factor=2))
+        assert downsampled.data.shape == (3, 30, 20), "Wrong downsampled shape!"
+
+        print("✓ PASSED: uint16 and BSCALE/BZERO layers loaded with their scaling")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def run_all_tests():
+    """Run all fits_loader tests"""
+    print("\n" + "#"*60)
+    print("# TESTING fits_loader.py")
+    print("#"*60)
+
+    try:
+        test_load_cube_matches_strided_slicing()
+        test_load_cube_full_resolution()
+        test_load_cube_block_mean()
+        test_mismatched_layers()
+        test_scaled_layers()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
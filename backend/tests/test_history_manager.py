@@ -7,8 +7,8 @@ HOW TO RUN:
 
 EXPECTED OUTPUT:
     - All tests should print "✓ PASSED" for each test case
-    - Creates/modifies history.json file
-    - Prints history entries in readable format
+    - Creates/modifies the history.db database
+    - Prints history entries in readable format and the cost of one write
 """
 
 import sys
@@ -18,12 +18,19 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from history_manager import HistoryManager
 from models import HistoryItem
 from datetime import datetime
+import multiprocessing
+import subprocess
+import sqlite3
+import tempfile
+import shutil
 import json
+import time
 
 def cleanup_history_file():
-    """Remove history.json if it exists"""
-    if os.path.exists('history.json'):
-        os.remove('history.json')
+    """Remove the history database (and its WAL files) and any old history.json"""
+    for path in ('history.db', 'history.db-wal', 'history.db-shm', 'history.json'):
+        if os.path.exists(path):
+            os.remove(path)
 
 def test_initialization():
     """Test HistoryManager initialization"""
@@ -37,7 +44,7 @@ def test_initialization():
     manager = HistoryManager()
     
     assert manager.history_log == [], "History should be empty on first init!"
-    assert not os.path.exists('history.json'), "History file shouldn't exist yet!"
+    assert manager.count() == 0, "History should be empty on first init!"
     
     print("✓ PASSED: HistoryManager initialized with empty history")
 
@@ -68,13 +75,13 @@ def test_add_entry():
     
     # Verify
     assert len(manager.history_log) == 2, "Should have 2 entries!"
-    assert os.path.exists('history.json'), "History file should be created!"
+    assert os.path.exists('history.db'), "History database should be created!"
     assert manager.history_log[0].input_filename == "fileA.fits, fileB.fits, fileC.fits", "Latest entry should be first!"
     
     print("✓ PASSED: Entries added successfully")
     print(f"  - Total entries: {len(manager.history_log)}")
     print(f"  - Latest entry: {manager.history_log[0].input_filename}")
-    print(f"  - History file exists: {os.path.exists('history.json')}")
+    print(f"  - History database exists: {os.path.exists('history.db')}")
 
 def test_get_history():
     """Test retrieving history"""
@@ -110,8 +117,7 @@ def test_persistence():
     print("="*60)
     
     # Clear any existing history first
-    if os.path.exists('history.json'):
-        os.remove('history.json')
+    cleanup_history_file()
     
     # Create first manager and add entry
     manager1 = HistoryManager()
@@ -122,6 +128,8 @@ def test_persistence():
         status="Success"
     )
     manager1.add_entry(item)
+    # Writes queued entries (write-behind) and releases the database
+    manager1.close()
     
     # Create second manager (should load from file)
     manager2 = HistoryManager()
@@ -172,30 +180,329 @@ def test_corrupt_file_handling():
     print("TEST 6: Corrupt File Handling")
     print("="*60)
     
-    # Create corrupt history file
-    with open('history.json', 'w') as f:
+    # Create corrupt legacy history file, imported on the first start
+    tmp_dir = tempfile.mkdtemp()
+    legacy_file = os.path.join(tmp_dir, 'history.json')
+    with open(legacy_file, 'w') as f:
         f.write("This is not valid JSON {{{")
     
     # Should handle gracefully
-    manager = HistoryManager()
-    
-    assert manager.history_log == [], "Should return empty list for corrupt file!"
-    
-    print("✓ PASSED: Corrupt file handled gracefully")
-    print(f"  - Loaded history: {len(manager.history_log)} entries")
+    try:
+        manager = HistoryManager(db_path=os.path.join(tmp_dir, 'history.db'), legacy_file=legacy_file)
+        assert manager.history_log == [], "Should return empty list for corrupt file!"
+        print("✓ PASSED: Corrupt file handled gracefully")
+        print(f"  - Loaded history: {len(manager.history_log)} entries")
+        manager.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_legacy_import():
+    """Test the one-time import of an old history.json"""
+    print("\n" + "="*60)
+    print("TEST 7: Legacy history.json Import")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        legacy_file = os.path.join(tmp_dir, 'history.json')
+        entries = [HistoryItem(f"old{i}.fits", {'index': i}, "Success",
+                               timestamp=datetime(2025, 1, 1 + i)).to_dict() for i in range(3)]
+        # The old file kept the newest entry first
+        with open(legacy_file, 'w') as f:
+            json.dump(entries[::-1], f, indent=2)
+
+        db_path = os.path.join(tmp_dir, 'history.db')
+        manager = HistoryManager(db_path=db_path, legacy_file=legacy_file)
+        assert manager.get_history() == entries[::-1], "Imported history differs!"
+        manager.add_entry(HistoryItem("new.fits", {}, "Success"))
+        manager.close()
+
+        # Imported only once
+        again = HistoryManager(db_path=db_path, legacy_file=legacy_file)
+        assert again.count() == 4, f"Expected 4 entries, got {again.count()}!"
+        assert again.history_log[0].input_filename == "new.fits", "Newest entry should be first!"
+        again.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("✓ PASSED: Old history imported once, order kept")
+
+def _write_entries(db_path, worker, count):
+    manager = HistoryManager(db_path=db_path, legacy_file=None)
+    for i in range(count):
+        manager.add_entry(HistoryItem(f"worker{worker}_{i}.fits", {'worker': worker}, "Success"))
+    manager.close()
+
+def test_concurrent_processes():
+    """Test atomic writes from several processes, and the indexes"""
+    print("\n" + "="*60)
+    print("TEST 8: Concurrent Writers")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmp_dir, 'history.db')
+        HistoryManager(db_path=db_path, legacy_file=None).close()
+
+        processes = [multiprocessing.Process(target=_write_entries, args=(db_path, worker, 100))
+                     for worker in range(4)]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        assert all(process.exitcode == 0 for process in processes), "A writer process failed!"
+
+        manager = HistoryManager(db_path=db_path, legacy_file=None)
+        assert manager.count() == 400, f"Lost writes: {manager.count()} of 400 entries!"
+        names = {item.input_filename for item in manager.history_log}
+        assert len(names) == 400, "Duplicated or mixed-up entries!"
+
+        indexes = {row[0] for row in sqlite3.connect(db_path).execute(
+            "SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'history'")}
+        assert {'history_timestamp', 'history_status', 'history_filename'} <= indexes, \
+            f"Missing indexes: {indexes}"
+        manager.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("✓ PASSED: 4 processes x 100 entries, none lost")
+
+def test_constant_write_cost():
+    """Test that adding an entry does not slow down as the history grows"""
+    print("\n" + "="*60)
+    print("TEST 9: Constant Write Cost")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        manager = HistoryManager(db_path=os.path.join(tmp_dir, 'history.db'), legacy_file=None,
+                                 write_behind=False)
+        settings = {'palette': 'natural', 'stretch_name': 'power', 'power': 2.4, 'saturation': 1.3}
+
+        def time_writes(count=200):
+            start = time.perf_counter()
+            for i in range(count):
+                manager.add_entry(HistoryItem(f"timed{i}.fits", settings, "Success"))
+            return (time.perf_counter() - start) / count
+
+        empty = time_writes()
+        # Grow the history to 100k entries in bulk
+        with manager._lock, manager._transaction():
+            manager._insert([manager._row(HistoryItem(f"bulk{i}.fits", settings, "Success"))
+                             for i in range(100_000)])
+        full = time_writes()
+        assert full < empty * 5, f"Writes slowed down from {empty * 1e6:.0f} to {full * 1e6:.0f} us!"
+
+        removed = manager.compact(max_entries=1000, vacuum=True)
+        assert manager.count() == 1000, "Compaction should keep the newest entries!"
+        assert removed == 100_400 - 1000, f"Unexpected number removed: {removed}"
+        assert manager.history_log[0].input_filename == "timed199.fits", "Newest entry lost!"
+        manager.close()
+
+        # Startup compaction with a retention limit
+        limited = HistoryManager(db_path=os.path.join(tmp_dir, 'history.db'), legacy_file=None,
+                                 max_entries=10)
+        assert limited.count() == 10, "max_entries should trim the history at startup!"
+        limited.close()
+
+        # The compaction script
+        result = subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.dirname(
+            os.path.abspath(__file__))), 'compact_history.py'), '--db', os.path.join(tmp_dir, 'history.db'),
+            '--max-entries', '5'], capture_output=True, text=True)
+        assert result.returncode == 0, f"compact_history.py failed: {result.stderr}"
+        assert HistoryManager(db_path=os.path.join(tmp_dir, 'history.db'), legacy_file=None).count() == 5
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("✓ PASSED: Write cost independent of history size")
+    print(f"  - Per write: {empty * 1e6:.0f} us empty, {full * 1e6:.0f} us with 100k entries")
+
+def test_query():
+    """Test paging, filters and projection of HistoryManager.query"""
+    print("\n" + "="*60)
+    print("TEST 10: Paged Queries")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        manager = HistoryManager(db_path=os.path.join(tmp_dir, 'history.db'), legacy_file=None)
+        for i in range(30):
+            manager.add_entry(HistoryItem(f"night{i}_Ha.fits", {'palette': 'hubble' if i % 3 else 'natural'},
+                                          "Failure" if i % 5 == 0 else "Success",
+                                          timestamp=datetime(2025, 3, 1 + i)))
+
+        # Walking the cursor visits every entry once, newest first
+        seen = []
+        cursor = None
+        while True:
+            entries, cursor, version = manager.query(7, cursor=cursor)
+            seen.extend(entry['filename'] for entry in entries)
+            if cursor is None:
+                break
+        assert seen == [f"night{i}_Ha.fits" for i in reversed(range(30))], "Pages skipped or repeated entries!"
+
+        entries, _, _ = manager.query(100, status="Failure", palette="natural")
+        assert [entry['filename'] for entry in entries] == ["night15_Ha.fits", "night0_Ha.fits"], \
+            "Wrong filtered entries!"
+        entries, _, _ = manager.query(100, since=datetime(2025, 3, 10), until=datetime(2025, 3, 13))
+        assert len(entries) == 3, "Date range should select 3 days!"
+        entries, _, _ = manager.query(100, filename="NIGHT2_")
+        assert [entry['filename'] for entry in entries] == ["night2_Ha.fits"], \
+            "Filename match should be a literal, case-insensitive substring!"
+
+        entries, _, _ = manager.query(2, fields=('id', 'status'))
+        assert entries == [{'id': 30, 'status': 'Success'}, {'id': 29, 'status': 'Success'}], \
+            f"Unexpected projection {entries}!"
+        try:
+            manager.query(2, fields=('password',))
+            assert False, "Unknown fields should raise ValueError!"
+        except ValueError:
+            pass
+
+        # The version moves with every change
+        manager.add_entry(HistoryItem("late.fits", {}, "Success"))
+        assert manager.version() == version + 1, "Adding an entry should change the version!"
+        manager.clear_history()
+        assert manager.version() == version + 2, "Clearing should change the version!"
+        manager.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("✓ PASSED: Cursor pages, filters and projection")
+
+def test_write_behind():
+    """Test batched background writes, flush triggers and durability settings"""
+    print("\n" + "="*60)
+    print("TEST 11: Write-behind Batching")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmp_dir, 'history.db')
+
+        def stored():
+            """Rows on disk, as another process sees them"""
+            with sqlite3.connect(db_path) as conn:
+                return conn.execute('SELECT COUNT(*) FROM history').fetchone()[0]
+
+        def wait_for(count, timeout=5):
+            deadline = time.time() + timeout
+            while stored() != count and time.time() < deadline:
+                time.sleep(0.01)
+            return stored()
+
+        # Size trigger
+        manager = HistoryManager(db_path=db_path, legacy_file=None, write_behind=True,
+                                 batch_size=50, flush_interval=60)
+        for i in range(49):
+            manager.add_entry(HistoryItem(f"queued{i}.fits", {}, "Success"))
+        time.sleep(0.1)
+        assert stored() == 0, "Entries below the batch size should wait in memory!"
+        manager.add_entry(HistoryItem("queued49.fits", {}, "Success"))
+        assert wait_for(50) == 50, "A full batch should be written by the writer thread!"
+
+        # Reads see queued entries; close writes the rest
+        manager.add_entry(HistoryItem("read.fits", {}, "Failure"))
+        assert manager.history_log[0].input_filename == "read.fits", "Reads should flush the queue!"
+        for i in range(3):
+            manager.add_entry(HistoryItem(f"shutdown{i}.fits", {}, "Success"))
+        manager.close()
+        assert stored() == 54, "close() should flush queued entries!"
+        assert not manager._writer.is_alive(), "Writer thread should stop on close!"
+
+        # Time trigger, with an fsync per batch
+        manager = HistoryManager(db_path=db_path, legacy_file=None, write_behind=True,
+                                 batch_size=1000, flush_interval=0.1, durability='batch')
+        assert manager._conn.execute('PRAGMA synchronous').fetchone()[0] == 2, "batch should be FULL sync!"
+        manager.add_entry(HistoryItem("timed.fits", {}, "Success"))
+        assert wait_for(55) == 55, "The flush interval should write a partial batch!"
+
+        start = time.perf_counter()
+        for i in range(200):
+            manager.add_entry(HistoryItem(f"fast{i}.fits", {}, "Success"))
+        queued = (time.perf_counter() - start) / 200
+        manager.close()
+
+        direct = HistoryManager(db_path=db_path, legacy_file=None, write_behind=False, durability='batch')
+        start = time.perf_counter()
+        for i in range(200):
+            direct.add_entry(HistoryItem(f"slow{i}.fits", {}, "Success"))
+        synchronous = (time.perf_counter() - start) / 200
+        assert direct.count() == 455, f"Lost entries: {direct.count()} of 455!"
+        names = [item.input_filename for item in direct.history_log]
+        assert names.index("fast0.fits") > names.index("fast199.fits"), "Batches out of order!"
+        direct.close()
+
+        try:
+            HistoryManager(db_path=db_path, legacy_file=None, durability='sometimes')
+            assert False, "Unknown durability should raise ValueError!"
+        except ValueError:
+            pass
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("✓ PASSED: Entries batched in the background, flushed on read and close")
+    print(f"  - add_entry with fsync: {synchronous * 1e6:.0f} us direct, {queued * 1e6:.1f} us queued")
+
+def _log_in_forked_child(manager, parent_conn):
+    """Runs in a forked child: log without closing, like a gunicorn worker that gets killed"""
+    manager.add_entry(HistoryItem("child.fits", {}, "Success"))
+    deadline = time.time() + 5
+    while time.time() < deadline:
+        with sqlite3.connect(manager.db_path) as conn:
+            if conn.execute("SELECT COUNT(*) FROM history WHERE filename = 'child.fits'").fetchone()[0]:
+                break
+        time.sleep(0.02)
+    else:
+        sys.exit("The child's entry was never written")
+    if not manager._writer.is_alive():
+        sys.exit("The child has no writer thread")
+    if manager._conn is parent_conn:
+        sys.exit("The child uses the connection of its parent")
+
+def test_fork():
+    """Test that forked processes (gunicorn --preload workers) get their own writer and connection"""
+    print("\n" + "="*60)
+    print("TEST 12: Forked Workers")
+    print("="*60)
+
+    if not hasattr(os, 'fork'):
+        print("  ⊗ No fork() on this platform, skipped")
+        return
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        db_path = os.path.join(tmp_dir, 'history.db')
+        # Built in the parent before the fork, as with WARMUP_ON_START=1
+        manager = HistoryManager(db_path=db_path, legacy_file=None, write_behind=True,
+                                 batch_size=1000, flush_interval=0.05)
+        manager.add_entry(HistoryItem("parent.fits", {}, "Success"))
+        assert manager._writer.is_alive(), "The parent's writer should run!"
+
+        child = multiprocessing.get_context('fork').Process(target=_log_in_forked_child,
+                                                            args=(manager, manager._conn))
+        child.start()
+        child.join(30)
+        assert child.exitcode == 0, "The forked child could not log its entry!"
+
+        names = sorted(item.input_filename for item in manager.history_log)
+        assert names == ["child.fits", "parent.fits"], f"Entries lost or duplicated: {names}"
+        manager.close()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    print("✓ PASSED: A forked child writes its entries with its own writer thread")
 
 def display_history_file():
-    """Display the contents of history.json"""
+    """Display the entries in history.db"""
     print("\n" + "="*60)
-    print("HISTORY FILE CONTENTS (history.json)")
+    print("HISTORY DATABASE CONTENTS (history.db)")
     print("="*60)
     
-    if os.path.exists('history.json'):
-        with open('history.json', 'r') as f:
-            content = f.read()
-            print(content)
+    if os.path.exists('history.db'):
+        print(json.dumps(HistoryManager().get_history(), indent=2))
     else:
-        print("No history file found")
+        print("No history database found")
 
 def run_all_tests():
     """Run all history manager tests"""
@@ -210,6 +517,12 @@ def run_all_tests():
         test_persistence()
         test_clear_history()
         test_corrupt_file_handling()
+        test_legacy_import()
+        test_concurrent_processes()
+        test_constant_write_cost()
+        test_query()
+        test_write_behind()
+        test_fork()
         
         display_history_file()
         
@@ -217,7 +530,7 @@ def run_all_tests():
         print("✓✓✓ ALL TESTS PASSED ✓✓✓")
         print("="*60)
         print("\nGenerated Files:")
-        print("  - history.json (history log file)")
+        print("  - history.db (history database)")
         
     except AssertionError as e:
         print(f"\n✗ TEST FAILED: {e}")
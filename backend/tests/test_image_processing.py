@@ -15,7 +15,7 @@ import sys
 import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from image_processing import AIModel, ImageProcessor
+from image_processing import AIModel, ImageProcessor, stretch_table
 from models import FITSData, ProcessedImage
 import numpy as np
 from PIL import Image
@@ -235,9 +235,10 @@ def test_image_processor():
     assert isinstance(result, ProcessedImage), "Result should be ProcessedImage!"
     
     # Export and save
-    pil_image = result.export_to(format="PNG")
+    pil_image = result.pil_image
     output_file = "test_output_processor_complete.png"
-    pil_image.save(output_file)
+    with open(output_file, 'wb') as f:
+        result.export_to(format="PNG", stream=f)
     
     assert isinstance(pil_image, Image.Image), "Exported image should be PIL Image!"
     assert pil_image.size == (300, 300), "Image size mismatch!"
@@ -297,6 +298,235 @@ def test_edge_cases():
     
     print("✓ PASSED: Edge cases handled correctly")
 
+def test_denoise_cache():
+    """Test that look tweaks reuse the denoised cube"""
+    print("\n" + "="*60)
+    print("TEST 7: Denoised Cube Cache")
+    print("="*60)
+    
+    processor = ImageProcessor()
+    fits_data = create_test_fits_data()
+    
+    # Count how often the network actually runs
+    calls = []
+    denoise_fits_cube = processor.denoiser.denoise_fits_cube
+    def counting_denoise(data):
+        calls.append(data.shape)
+        return denoise_fits_cube(data)
+    processor.denoiser.denoise_fits_cube = counting_denoise
+    
+    params = {
+        'red_channel': 0, 'green_channel': 1, 'blue_channel': 2,
+        'stretch_name': 'power', 'power': 2.4,
+        'black_point': 0.5, 'white_point': 99.8, 'saturation': 1.3,
+        'red_scale': 1.0, 'green_scale': 1.0, 'blue_scale': 1.0,
+        'use_denoising': True
+    }
+    first = processor.process_image(fits_data, params).pil_image
+    
+    # Different palette, stretch and balance on the same data
+    tweaked = dict(params, red_channel=2, blue_channel=0, stretch_name='asinh', red_scale=1.2)
+    processor.process_image(fits_data, tweaked)
+    again = processor.process_image(fits_data, params).pil_image
+    
+    assert len(calls) == 1, f"Denoiser should run once, ran {len(calls)} times!"
+    assert np.array_equal(np.asarray(first), np.asarray(again)), "Cached result differs!"
+    
+    # New data must be denoised again
+    other = FITSData(data=fits_data.get_raw_data() * 2, header={})
+    processor.process_image(other, params)
+    assert len(calls) == 2, "Different data should miss the cache!"
+    
+    stats = processor.get_cache_stats()
+    assert stats['hits'] == 2 and stats['misses'] == 2, f"Unexpected stats {stats}!"
+    
+    print("✓ PASSED: Denoised cubes reused across look changes")
+    print(f"  - Stats: {stats}")
+
+def reference_colorize(model, fits_data, params):
+    """The original expression-based stretch and colorize, for comparison"""
+    def stretch(data, method, power, black_point, white_point):
+        data = data.astype(np.float32)
+        data = np.nan_to_num(data, nan=0.0, posinf=0.0, neginf=0.0)
+        vmin = np.percentile(data, black_point)
+        vmax = np.percentile(data, white_point)
+        data = (data - vmin) / (vmax - vmin + 1e-10)
+        data = np.clip(data, 0, 1)
+        if method == 'power':
+            data = np.power(data, 1.0 / power)
+        elif method == 'asinh':
+            asinh_scale = 0.05
+            data = np.arcsinh(data / asinh_scale) / np.arcsinh(1.0 / asinh_scale)
+            data = (data - data.min()) / (data.max() - data.min() + 1e-10)
+        elif method == 'sqrt':
+            data = np.sqrt(data)
+        elif method == 'log':
+            data = np.log1p(data * 10) / np.log1p(10)
+        return data
+
+    channels = []
+    for color in ('red', 'green', 'blue'):
+        image = fits_data[params[f'{color}_channel']].astype(np.float32)
+        if params[f'{color}_scale'] != 1.0:
+            image = image * params[f'{color}_scale']
+        channels.append(stretch(image, params['stretch_name'], params['power'],
+                                params['black_point'], params['white_point']))
+    rgb = np.dstack(channels)
+    if params['saturation'] != 1.0:
+        rgb = model._boost_saturation_hsv(rgb, params['saturation'])
+    return np.clip(rgb * 255, 0, 255).astype(np.uint8)
+
+def test_inplace_kernel():
+    """Test that the in-place kernel matches the original code bit for bit"""
+    print("\n" + "="*60)
+    print("TEST 8: In-place Kernel Matches Original")
+    print("="*60)
+    
+    model = AIModel()
+    model.block_rows = 7  # Several conversion blocks
+    rng = np.random.default_rng(3)
+    cube = rng.standard_normal((3, 120, 90)).astype(np.float32) * 20 + 100
+    cube[0, 5, 5] = np.nan
+    cube[1, 6, 6] = np.inf
+    cube[2, 7, 7] = -np.inf
+    
+    for stretch_name in ('power', 'asinh', 'sqrt', 'log', 'linear'):
+        for scales, saturation in [((1.0, 1.0, 1.0), 1.0), ((1.2, 1.0, 0.9), 1.3)]:
+            params = {
+                'red_channel': 2, 'green_channel': 0, 'blue_channel': 1,
+                'stretch_name': stretch_name, 'power': 2.4,
+                'black_point': 0.5, 'white_point': 99.8, 'saturation': saturation,
+                'red_scale': scales[0], 'green_scale': scales[1], 'blue_scale': scales[2]
+            }
+            for data in (cube, cube.astype(np.float64)):
+                expected = reference_colorize(model, data, params)
+                actual = np.asarray(model.get_prediction(data, params))
+                assert np.array_equal(actual, expected), \
+                    f"Mismatch for {stretch_name}, saturation {saturation}, {data.dtype}!"
+        print(f"  ✓ {stretch_name}: identical")
+    
+    rgb = rng.random((20, 10, 3)).astype(np.float32)
+    original = rgb.copy()
+    model._to_image(rgb)
+    assert np.array_equal(rgb, original), "_to_image must not modify its input!"
+    
+    print("✓ PASSED: In-place kernel is bit-identical")
+
+def reference_hsv_saturation(rgb, factor):
+    """The original HSV round-trip saturation boost, for comparison"""
+    r, g, b = rgb[:, :, 0], rgb[:, :, 1], rgb[:, :, 2]
+    maxc = np.maximum(np.maximum(r, g), b)
+    minc = np.minimum(np.minimum(r, g), b)
+    v = maxc
+    deltac = maxc - minc
+    s = deltac / (maxc + 1e-10)
+    deltac = np.where(deltac == 0, 1, deltac)
+    rc = (maxc - r) / deltac
+    gc = (maxc - g) / deltac
+    bc = (maxc - b) / deltac
+    h = np.zeros_like(v)
+    h = np.where(r == maxc, bc - gc, h)
+    h = np.where(g == maxc, 2.0 + rc - bc, h)
+    h = np.where(b == maxc, 4.0 + gc - rc, h)
+    h = (h / 6.0) % 1.0
+    s = np.clip(s * factor, 0, 1)
+    i = (h * 6.0).astype(int)
+    f = (h * 6.0) - i
+    p = v * (1.0 - s)
+    q = v * (1.0 - s * f)
+    t = v * (1.0 - s * (1.0 - f))
+    i = i % 6
+    conditions = [i == 0, i == 1, i == 2, i == 3, i == 4, i == 5]
+    r = np.select(conditions, [v, q, p, p, t, v])
+    g = np.select(conditions, [t, v, v, q, p, p])
+    b = np.select(conditions, [p, p, t, v, v, q])
+    return np.dstack([r, g, b])
+
+def test_saturation_modes():
+    """Test the closed-form HSV boost and the luma boost"""
+    print("\n" + "="*60)
+    print("TEST 9: Saturation Modes")
+    print("="*60)
+    
+    model = AIModel()
+    model.block_rows = 16  # Several blocks
+    rng = np.random.default_rng(4)
+    rgb = rng.random((100, 80, 3)) ** 2
+    rgb[:10, :10] = 0.4  # Gray
+    rgb[10:20] = 0.0     # Black
+    
+    for dtype in (np.float32, np.float64):
+        for factor in (0.0, 0.5, 1.3, 5.0):
+            data = rgb.astype(dtype)
+            expected = reference_hsv_saturation(data, factor)
+            actual = model._boost_saturation(data.copy(), factor, 'hsv')
+            assert actual.dtype == dtype, "HSV boost should keep the dtype!"
+            assert np.abs(actual - expected).max() < 1e-6, f"HSV boost differs for factor {factor}!"
+    print("  ✓ hsv: matches the HSV round trip")
+    
+    # Without clipping the luma of every pixel is unchanged
+    muted = 0.4 + 0.1 * rgb
+    boosted = model._boost_saturation(muted.copy(), 1.5, 'luma')
+    weights = np.array([0.2126, 0.7152, 0.0722])
+    assert np.allclose(boosted @ weights, muted @ weights), "Luma boost should keep the luma!"
+    assert boosted.std(axis=2).mean() > muted.std(axis=2).mean() * 1.4, "Luma boost should add chroma!"
+    clipped = model._boost_saturation(rgb.copy(), 5.0, 'luma')
+    assert clipped.min() >= 0 and clipped.max() <= 1, "Luma boost should stay in 0-1!"
+    print("  ✓ luma: keeps brightness, stays in range")
+    
+    try:
+        model._boost_saturation(rgb.copy(), 1.3, 'lab')
+        assert False, "Unknown mode should raise ValueError!"
+    except ValueError:
+        pass
+    
+    fits_data = create_test_fits_data().get_raw_data()
+    params = {
+        'red_channel': 0, 'green_channel': 1, 'blue_channel': 2,
+        'stretch_name': 'power', 'power': 2.4,
+        'black_point': 0.5, 'white_point': 99.8, 'saturation': 1.3,
+        'red_scale': 1.0, 'green_scale': 1.0, 'blue_scale': 1.0,
+        'saturation_mode': 'luma'
+    }
+    assert model.get_prediction(fits_data, params).size == (300, 300), "Luma mode render failed!"
+    
+    print("✓ PASSED: Both saturation modes work")
+
+def test_lut_stretch():
+    """Test the lookup-table stretch against the exact curves"""
+    print("\n" + "="*60)
+    print("TEST 10: Lookup-Table Stretch")
+    print("="*60)
+    
+    model = AIModel()
+    model.block_rows = 13  # Several gather blocks
+    rng = np.random.default_rng(5)
+    data = rng.standard_normal((200, 150)).astype(np.float32) * 5 + 100
+    data[3, 3] = np.nan
+    
+    for method in ('power', 'asinh', 'sqrt', 'log', 'linear'):
+        exact = model._stretch_data(data, method, 2.4, 0.5, 99.8)
+        lut = model._stretch_data(data, method, 2.4, 0.5, 99.8, stretch_mode='lut')
+        assert lut.dtype == np.float32, "Lookup output should be float32!"
+        levels = np.abs(np.clip(exact * 255, 0, 255).astype(int) - np.clip(lut * 255, 0, 255).astype(int))
+        assert levels.max() <= 1, f"{method}: lookup differs by {levels.max()} levels!"
+        assert lut.min() >= 0 and lut.max() <= 1, f"{method}: lookup out of range!"
+        print(f"  ✓ {method}: max error {np.abs(exact - lut).max():.1e}")
+    
+    # Tables are shared between calls and cannot be modified
+    table = stretch_table('power', 2.4, 1024)
+    assert stretch_table('power', 2.4, 1024) is table, "Tables should be cached!"
+    assert not table.flags.writeable, "Cached tables must be read-only!"
+    assert table[0] == 0 and table[-1] == 1, "Table should span the curve's 0-1 range!"
+    
+    try:
+        model._stretch_data(data, 'power', stretch_mode='spline')
+        assert False, "Unknown stretch mode should raise ValueError!"
+    except ValueError:
+        pass
+    
+    print("✓ PASSED: Lookup stretch within one 8-bit level of the exact curves")
+
 def run_all_tests():
     """Run all image processing tests"""
     print("\n" + "#"*60)
@@ -310,6 +540,10 @@ def run_all_tests():
         test_color_balance()
         test_image_processor()
         test_edge_cases()
+        test_denoise_cache()
+        test_inplace_kernel()
+        test_saturation_modes()
+        test_lut_stretch()
         
         print("\n" + "="*60)
         print("✓✓✓ ALL TESTS PASSED ✓✓✓")
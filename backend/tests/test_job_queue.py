@@ -0,0 +1,178 @@
+"""
+Test Module for job_queue.py
+Tests: JobQueue, Job, async /colorize-layers and /jobs endpoints
+
+HOW TO RUN:
+    python tests/test_job_queue.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Submits a small async colorization through the Flask test client
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from job_queue import JobQueue, QueueFullError
+from helpers import make_fits_bytes
+from io import BytesIO
+import threading
+import time
+
+def wait_for(job, timeout=60):
+    """Poll a job until it finishes"""
+    deadline = time.time() + timeout
+    while not job.finished and time.time() < deadline:
+        time.sleep(0.02)
+    return job
+
+def test_job_lifecycle():
+    """Test successful and failing jobs"""
+    print("\n" + "="*60)
+    print("TEST 1: Job Lifecycle")
+    print("="*60)
+
+    queue = JobQueue(max_workers=2, max_pending=2)
+
+    def work(x, progress):
+        progress('halfway', 0.5)
+        return x * 2
+
+    def broken(progress):
+        raise RuntimeError("boom")
+
+    ok = wait_for(queue.submit(work, 21))
+    failed = wait_for(queue.submit(broken))
+
+    assert ok.status == 'done' and ok.result == 42, f"Unexpected job state {ok.to_dict()}!"
+    assert ok.progress == 1.0, "Finished job should report full progress!"
+    assert failed.status == 'failed' and failed.error == 'boom', "Failure not recorded!"
+    assert queue.get(ok.job_id) is ok, "Job lookup failed!"
+    assert queue.get('missing') is None, "Unknown job should be None!"
+    assert queue.stats()['done'] == 1 and queue.stats()['failed'] == 1, "Stats mismatch!"
+
+    queue.shutdown()
+    print("✓ PASSED: Jobs report status, result and errors")
+
+def test_backpressure():
+    """Test that a saturated queue rejects new jobs"""
+    print("\n" + "="*60)
+    print("TEST 2: Backpressure")
+    print("="*60)
+
+    queue = JobQueue(max_workers=1, max_pending=1)
+    release = threading.Event()
+
+    def blocked(progress):
+        release.wait(10)
+
+    jobs = [queue.submit(blocked), queue.submit(blocked)]
+    try:
+        queue.submit(blocked)
+        assert False, "Third job should be rejected!"
+    except QueueFullError as e:
+        print(f"  ✓ Rejected: {e}")
+
+    release.set()
+    for job in jobs:
+        wait_for(job)
+    # Slots are released once jobs finish
+    wait_for(queue.submit(blocked))
+
+    queue.shutdown()
+    print("✓ PASSED: Queue applies backpressure")
+
+def test_retention():
+    """Test that finished jobs are capped and pruning races with finishing jobs"""
+    print("\n" + "="*60)
+    print("TEST 3: Finished Job Retention")
+    print("="*60)
+
+    queue = JobQueue(max_workers=1, max_pending=0, max_finished=3)
+    jobs = [wait_for(queue.submit(lambda progress, i=i: bytes(1000) * i)) for i in range(6)]
+    assert [queue.get(job.job_id) for job in jobs[:3]] == [None] * 3, "Old results kept!"
+    assert all(queue.get(job.job_id) is job for job in jobs[3:]), "Newest results dropped!"
+    assert queue.stats()['done'] == 3, "Too many finished jobs kept!"
+    queue.shutdown()
+
+    # Submitting while jobs finish must never see a finished job without finished_at
+    queue = JobQueue(max_workers=4, max_pending=4, max_finished=5)
+    submitted = 0
+    deadline = time.time() + 2
+    while time.time() < deadline:
+        try:
+            queue.submit(lambda progress: None)
+            submitted += 1
+        except QueueFullError:
+            pass
+    queue.shutdown()
+    assert queue.stats()['done'] <= 5, "Cap not applied after the last jobs finished!"
+
+    print("✓ PASSED: Finished jobs capped, pruning safe under concurrency")
+    print(f"  - Submitted {submitted} jobs in 2 s")
+
+def test_async_endpoint():
+    """Test async submission and polling through the Flask app"""
+    print("\n" + "="*60)
+    print("TEST 4: Async /colorize-layers")
+    print("="*60)
+
+    import app as backend_app
+    client = backend_app.app.test_client()
+
+    response = client.post('/colorize-layers', data={
+        'red_file': (BytesIO(make_fits_bytes(1)), 'async_r.fits'),
+        'green_file': (BytesIO(make_fits_bytes(2)), 'async_g.fits'),
+        'blue_file': (BytesIO(make_fits_bytes(3)), 'async_b.fits'),
+        'palette': 'natural',
+        'downsample_factor': '1',
+        'async': '1',
+    }, content_type='multipart/form-data')
+
+    assert response.status_code == 202, f"Expected 202, got {response.status_code}!"
+    job_id = response.get_json()['job_id']
+
+    deadline = time.time() + 120
+    while time.time() < deadline:
+        status = client.get(f'/jobs/{job_id}').get_json()
+        if status['status'] in ('done', 'failed'):
+            break
+        time.sleep(0.1)
+
+    assert status['status'] == 'done', f"Job did not succeed: {status}!"
+    result = client.get(f'/jobs/{job_id}/result')
+    assert result.status_code == 200, "Result should be available!"
+    assert result.get_json()['imageData'].startswith('data:image/png;base64,'), "Missing image!"
+    assert client.get('/jobs/unknown').status_code == 404, "Unknown job should be 404!"
+
+    print("✓ PASSED: Async job submitted, polled and retrieved")
+    print(f"  - Job id: {job_id}")
+
+def run_all_tests():
+    """Run all job_queue tests"""
+    print("\n" + "#"*60)
+    print("# TESTING job_queue.py")
+    print("#"*60)
+
+    try:
+        test_job_lifecycle()
+        test_backpressure()
+        test_retention()
+        test_async_endpoint()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
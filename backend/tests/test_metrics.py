@@ -0,0 +1,212 @@
+"""
+Test Module for metrics.py
+Tests: Counter/Gauge/Histogram and their Prometheus text format, stage timers
+       (bytes, nested peak memory), the /metrics endpoint after real requests
+
+HOW TO RUN:
+    python tests/test_metrics.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints the cost of a stage timer and the stages of a request
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import metrics
+from metrics import Counter, Gauge, Histogram, Registry, stage, STAGE_SECONDS, STAGE_BYTES, STAGE_PEAK_MEMORY
+from helpers import make_fits_bytes
+from io import BytesIO
+import numpy as np
+import re
+import time
+
+# name{labels} value, as Prometheus parses it
+SAMPLE_LINE = re.compile(r'^[a-zA-Z_:][a-zA-Z0-9_:]*(\{([a-zA-Z_][a-zA-Z0-9_]*="([^"\\]|\\.)*",?)*\})? '
+                         r'(-?[0-9.e+-]+|\+Inf|NaN)$')
+
+def samples(text):
+    """dict 'name{labels}' -> float of every sample line; checks the comment lines too"""
+    values = {}
+    for line in text.splitlines():
+        if line.startswith('#'):
+            assert re.match(r'^# (HELP|TYPE) \w+ ', line), f"Bad comment line: {line}"
+            continue
+        assert SAMPLE_LINE.match(line), f"Bad sample line: {line}"
+        name, value = line.rsplit(' ', 1)
+        values[name] = float(value)
+    return values
+
+def test_metric_types():
+    """Test counters, gauges, histograms and the exposition format"""
+    print("\n" + "="*60)
+    print("TEST 1: Metric Types and Text Format")
+    print("="*60)
+
+    registry = Registry()
+    requests = registry.register(Counter('test_requests_total', "Requests.", ('route',)))
+    queue = registry.register(Gauge('test_queue_depth', "Queued jobs."))
+    latency = registry.register(Histogram('test_latency_seconds', "Latency.", ('route',),
+                                          buckets=(0.1, 1.0)))
+
+    requests.inc(route='/a')
+    requests.inc(2, route='/a')
+    requests.inc(route='say "hi"\n')
+    queue.set(4)
+    for value in (0.05, 0.5, 0.5, 7.0):
+        latency.observe(value, route='/a')
+
+    try:
+        requests.inc(path='/a')
+        assert False, "Unknown labels should be rejected!"
+    except ValueError:
+        pass
+
+    text = registry.render()
+    print(text)
+    values = samples(text)
+    assert values['test_requests_total{route="/a"}'] == 3, "Counter did not add up!"
+    assert values['test_requests_total{route="say \\"hi\\"\\n"}'] == 1, "Label values not escaped!"
+    assert values['test_queue_depth'] == 4, "Gauge not rendered!"
+    assert values['test_latency_seconds_bucket{route="/a",le="0.1"}'] == 1, "Wrong first bucket!"
+    assert values['test_latency_seconds_bucket{route="/a",le="1"}'] == 3, "Buckets not cumulative!"
+    assert values['test_latency_seconds_bucket{route="/a",le="+Inf"}'] == 4, "Wrong +Inf bucket!"
+    assert values['test_latency_seconds_count{route="/a"}'] == 4, "Wrong count!"
+    assert abs(values['test_latency_seconds_sum{route="/a"}'] - 8.05) < 1e-9, "Wrong sum!"
+    assert '# TYPE test_latency_seconds histogram' in text, "Missing TYPE line!"
+
+    print("✓ PASSED: Metrics rendered in the Prometheus text format")
+
+def test_stages():
+    """Test stage timing, byte counts and peak memory of nested stages"""
+    print("\n" + "="*60)
+    print("TEST 2: Stage Timers")
+    print("="*60)
+
+    metrics.REGISTRY.clear()
+    with stage('test_sleep', 1000):
+        time.sleep(0.02)
+    with stage('test_sleep') as record:
+        record.bytes = 500
+    try:
+        with stage('test_fail'):
+            raise RuntimeError("boom")
+    except RuntimeError:
+        pass
+
+    assert STAGE_SECONDS.count(stage='test_sleep') == 2, "Both runs should be timed!"
+    assert STAGE_SECONDS.count(stage='test_fail') == 1, "Failed runs should be timed!"
+    assert STAGE_BYTES.get(stage='test_sleep') == 1500, "Bytes not counted!"
+    values = samples(metrics.render())
+    assert values['colorizer_stage_seconds_sum{stage="test_sleep"}'] >= 0.02, "Sleep not timed!"
+    assert STAGE_PEAK_MEMORY.get(stage='test_sleep') is None, "Memory traced without opt-in!"
+
+    # Peak memory: the outer stage must keep the peak of the inner one
+    metrics.METRICS_TRACE_MEMORY = True
+    try:
+        with stage('test_outer'):
+            with stage('test_inner'):
+                big = np.ones(4_000_000)  # 32 MB
+                del big
+            small = np.ones(1_000_000)  # 8 MB
+            del small
+    finally:
+        metrics.METRICS_TRACE_MEMORY = False
+        import tracemalloc
+        tracemalloc.stop()
+    inner = STAGE_PEAK_MEMORY.get(stage='test_inner')
+    outer = STAGE_PEAK_MEMORY.get(stage='test_outer')
+    print(f"  - Peaks: inner {inner / 1e6:.1f} MB, outer {outer / 1e6:.1f} MB")
+    assert 32e6 <= inner < 40e6, "Wrong inner peak!"
+    assert outer >= inner, "Outer stage lost the inner peak!"
+
+    # Timers run several times per request: they must stay cheap
+    runs = 20000
+    start = time.perf_counter()
+    for _ in range(runs):
+        with stage('test_overhead', 10):
+            pass
+    cost = (time.perf_counter() - start) / runs * 1e6
+    print(f"  - Stage timer: {cost:.1f} µs per run")
+    assert cost < 100, "Stage timers are too slow!"
+    metrics.REGISTRY.clear()
+
+    print("✓ PASSED: Stages timed with their bytes and peak memory")
+
+def test_endpoint():
+    """Test /metrics after colorize requests"""
+    print("\n" + "="*60)
+    print("TEST 3: /metrics Endpoint")
+    print("="*60)
+
+    import app as backend_app
+    client = backend_app.app.test_client()
+    metrics.REGISTRY.clear()
+    layers = [make_fits_bytes(seed) for seed in (1, 2, 3)]
+
+    def post(**fields):
+        data = {'palette': 'hubble', 'response_mode': 'binary'}
+        for channel, layer in zip(('red', 'green', 'blue'), layers):
+            data[f'{channel}_file'] = (BytesIO(layer), f'metrics_{channel}.fits')
+        data.update(fields)
+        return client.post('/colorize-layers', data=data, content_type='multipart/form-data')
+
+    for _ in range(2):
+        assert post().status_code == 200, "Colorize request failed!"
+    assert post(palette='no-such-palette').status_code == 200, "Unknown palette request failed!"
+    assert post(percentile_method='nope').status_code != 200, "Bad settings should fail!"
+
+    response = client.get('/metrics')
+    assert response.status_code == 200, "/metrics failed!"
+    assert response.content_type.startswith('text/plain; version=0.0.4'), "Wrong content type!"
+    values = samples(response.get_data(as_text=True))
+
+    request_count = 'colorizer_request_seconds_count{palette="%s",stretch="power",status="%s"}'
+    assert values[request_count % ('hubble', 'Success')] == 2, "Requests not counted per palette!"
+    assert values[request_count % ('other', 'Success')] == 1, "Unknown palettes should share a label!"
+    assert values[request_count % ('hubble', 'Failure')] == 1, "Failures not counted!"
+
+    stages = {name.split('"')[1]: value for name, value in values.items()
+              if name.startswith('colorizer_stage_seconds_count')}
+    print(f"  - Stage runs: {stages}")
+    for name in ('reading', 'loading', 'stretch', 'saturation', 'to_uint8', 'encoding', 'formatting'):
+        assert stages.get(name, 0) >= 1, f"Stage '{name}' not timed!"
+    assert values['colorizer_stage_bytes_total{stage="reading"}'] == 4 * sum(map(len, layers)), \
+        "Upload bytes not counted!"
+
+    # The second identical request was served from the result cache
+    if backend_app.get_controller().result_cache is not None:
+        assert values['colorizer_cache_hits_total{cache="results"}'] >= 1, "Cache hit not exposed!"
+        assert 0 < values['colorizer_cache_hit_ratio{cache="results"}'] <= 1, "Bad hit ratio!"
+    metrics.REGISTRY.clear()
+
+    print("✓ PASSED: /metrics exposes stages, request latencies and cache hits")
+
+def run_all_tests():
+    """Run all metrics tests"""
+    print("\n" + "#"*60)
+    print("# TESTING metrics.py")
+    print("#"*60)
+
+    try:
+        test_metric_types()
+        test_stages()
+        test_endpoint()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
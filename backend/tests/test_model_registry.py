@@ -0,0 +1,125 @@
+"""
+Test Module for model_registry.py
+Tests: ModelRegistry, shared denoiser models
+
+HOW TO RUN:
+    python tests/test_model_registry.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Shows how often each model was actually loaded
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from model_registry import ModelRegistry, registry
+from denoiser import AstronomicalDenoiser
+from image_processing import ImageProcessor
+import threading
+import time
+
+def test_lazy_single_load():
+    """Test that a model is loaded once per key"""
+    print("\n" + "="*60)
+    print("TEST 1: Lazy Single Load")
+    print("="*60)
+
+    models = ModelRegistry()
+    calls = []
+
+    def loader():
+        calls.append(1)
+        return object()
+
+    first = models.get('a', loader)
+    second = models.get('a', loader)
+    other = models.get('b', loader)
+
+    assert first is second, "Same key should return the same model!"
+    assert first is not other, "Different keys should return different models!"
+    assert len(calls) == 2, f"Loader should run once per key, ran {len(calls)} times!"
+    assert 'a' in models and sorted(models.keys()) == ['a', 'b'], "Keys not tracked!"
+
+    models.clear()
+    assert 'a' not in models, "clear() should drop all models!"
+
+    print("✓ PASSED: Models load lazily, once per key")
+
+def test_concurrent_get():
+    """Test that concurrent first use from many threads loads once"""
+    print("\n" + "="*60)
+    print("TEST 2: Concurrent Access")
+    print("="*60)
+
+    models = ModelRegistry()
+    calls = []
+
+    def slow_loader():
+        calls.append(1)
+        time.sleep(0.1)
+        return object()
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(models.get('m', slow_loader)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) == 1, f"Loader ran {len(calls)} times!"
+    assert all(r is results[0] for r in results), "All threads should share one model!"
+
+    print("✓ PASSED: 8 threads shared a single load")
+
+def test_denoisers_share_weights():
+    """Test that denoisers and processors reuse the registry"""
+    print("\n" + "="*60)
+    print("TEST 3: Shared Denoiser Weights")
+    print("="*60)
+
+    registry.clear()
+    first = AstronomicalDenoiser(model_path='models/does_not_exist.pth')
+    second = AstronomicalDenoiser(model_path='models/does_not_exist.pth', tile_size=64)
+    assert first._engine is None, "Model should not be loaded before first use!"
+
+    first.preload()
+    assert first.registry_key in registry, "Preload should populate the registry!"
+    assert first.model is second.model, "Same config should share one model!"
+
+    processor_a = ImageProcessor()
+    processor_b = ImageProcessor()
+    processor_a.preload_models()
+    assert processor_a.denoiser.engine is processor_b.denoiser.engine, "Processors should share the model!"
+
+    print("✓ PASSED: Denoisers share one loaded model")
+    print(f"  - Registry keys: {len(registry.keys())}")
+
+def run_all_tests():
+    """Run all model_registry tests"""
+    print("\n" + "#"*60)
+    print("# TESTING model_registry.py")
+    print("#"*60)
+
+    try:
+        test_lazy_single_load()
+        test_concurrent_get()
+        test_denoisers_share_weights()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
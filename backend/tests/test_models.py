@@ -18,6 +18,7 @@ sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 from models import FITSData, ProcessedImage, HistoryItem
 from PIL import Image
 import numpy as np
+from io import BytesIO
 from datetime import datetime
 
 def test_fits_data():
@@ -59,17 +60,30 @@ def test_processed_image():
     proc_img = ProcessedImage(pil_img)
     
     # Test export_to
-    exported = proc_img.export_to(format="PNG")
+    exported_bytes = proc_img.export_to(format="PNG")
+    exported = Image.open(BytesIO(exported_bytes))
     
     # Save to file for visual verification
     output_path = "test_output_model.png"
-    exported.save(output_path)
+    with open(output_path, 'wb') as f:
+        proc_img.export_to(format="png", stream=f)
     
     # Assertions
+    assert exported_bytes.startswith(b'\x89PNG'), "Export should be PNG-encoded!"
     assert exported.size == (200, 200), "Image size mismatch!"
     assert exported.mode == 'RGB', "Image mode mismatch!"
+    assert np.array_equal(np.asarray(exported), sample_array), "PNG should be lossless!"
     assert os.path.exists(output_path), "Output file not created!"
     
+    # Other formats
+    for fmt, magic in [('jpeg', b'\xff\xd8'), ('webp', b'RIFF'), ('tiff16', b'II*\x00')]:
+        assert proc_img.export_to(format=fmt).startswith(magic), f"{fmt} export has wrong signature!"
+    try:
+        proc_img.export_to(format="bmp")
+        assert False, "Unknown format should raise ValueError!"
+    except ValueError:
+        pass
+    
     print(f"✓ PASSED: ProcessedImage created and exported")
     print(f"  - Image size: {exported.size}")
     print(f"  - Image mode: {exported.mode}")
@@ -0,0 +1,139 @@
+"""
+Test Module for parallel.py
+Tests: parallel_map, parallel channel processing in AIModel and the denoiser
+
+HOW TO RUN:
+    python tests/test_parallel.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints the colorize time with one and with several channel workers
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import parallel
+from parallel import parallel_map, worker_count
+from image_processing import AIModel
+import numpy as np
+import threading
+import time
+
+def use_workers(count):
+    """Switch the channel pool size (the pool is rebuilt on next use)"""
+    parallel.CHANNEL_WORKERS = count
+    parallel._pool = None
+
+def test_parallel_map():
+    """Test results, ordering, errors and nesting of parallel_map"""
+    print("\n" + "="*60)
+    print("TEST 1: parallel_map")
+    print("="*60)
+
+    use_workers(3)
+    assert worker_count() == 3, "CHANNEL_WORKERS should set the worker count!"
+
+    threads = set()
+    def square(x):
+        threads.add(threading.current_thread().name)
+        time.sleep(0.01)
+        return x * x
+    assert parallel_map(square, range(10)) == [x * x for x in range(10)], "Results out of order!"
+    assert all(name.startswith('channel') for name in threads), "Work should run on the pool!"
+
+    def fail(x):
+        if x == 2:
+            raise ValueError("bad channel")
+        return x
+    try:
+        parallel_map(fail, range(4))
+        assert False, "Errors in workers should reach the caller!"
+    except ValueError:
+        pass
+
+    # Nested calls run inline instead of waiting on the busy pool
+    def outer(x):
+        return parallel_map(lambda y: (threading.current_thread().name, y), range(2))
+    for inner in parallel_map(outer, range(3)):
+        assert len({name for name, _ in inner}) == 1, "Nested calls should stay on one thread!"
+
+    use_workers(1)
+    assert parallel_map(square, [3]) == [9], "Single worker should run inline!"
+    use_workers(0)
+    assert worker_count() >= 1, "Auto worker count should be at least 1!"
+
+    print("✓ PASSED: parallel_map keeps order and propagates errors")
+    print(f"  - Auto worker count: {worker_count()}")
+
+def test_identical_results():
+    """Test that parallel colorization and denoising match the sequential results"""
+    print("\n" + "="*60)
+    print("TEST 2: Parallel Matches Sequential")
+    print("="*60)
+
+    model = AIModel()
+    model.block_rows = 32  # Several blocks per stage
+    rng = np.random.default_rng(0)
+    cube = (rng.standard_normal((3, 400, 300)) * 5 + 100).astype(np.float32)
+    cube[1, 3, 3] = np.nan
+
+    timings = {}
+    for stretch_name, saturation_mode in [('power', 'hsv'), ('asinh', 'luma'), ('log', 'hsv')]:
+        params = {
+            'red_channel': 2, 'green_channel': 0, 'blue_channel': 1,
+            'stretch_name': stretch_name, 'power': 2.4,
+            'black_point': 0.5, 'white_point': 99.8, 'saturation': 1.3,
+            'red_scale': 1.1, 'green_scale': 1.0, 'blue_scale': 0.9,
+            'saturation_mode': saturation_mode
+        }
+        results = {}
+        for workers in (1, 3):
+            use_workers(workers)
+            start = time.perf_counter()
+            results[workers] = np.asarray(model.get_prediction(cube, params))
+            timings[workers] = timings.get(workers, 0) + time.perf_counter() - start
+        assert np.array_equal(results[1], results[3]), f"{stretch_name}: parallel result differs!"
+        print(f"  ✓ {stretch_name} / {saturation_mode}: identical")
+
+    from denoiser import AstronomicalDenoiser
+    denoiser = AstronomicalDenoiser()
+    small = cube[:, :120, :100].copy()
+    small[2] = 4.0  # Flat channel
+    use_workers(1)
+    sequential = denoiser.denoise_fits_cube(small)
+    use_workers(3)
+    assert np.array_equal(denoiser.denoise_fits_cube(small), sequential), "Parallel denoise differs!"
+    print("  ✓ denoise_fits_cube: identical")
+
+    use_workers(0)
+    print("✓ PASSED: Channel pool changes no pixel")
+    print(f"  - Colorize time: 1 worker {timings[1] * 1000:.0f} ms, "
+          f"3 workers {timings[3] * 1000:.0f} ms ({os.cpu_count()} cores)")
+
+def run_all_tests():
+    """Run all parallel tests"""
+    print("\n" + "#"*60)
+    print("# TESTING parallel.py")
+    print("#"*60)
+
+    try:
+        test_parallel_map()
+        test_identical_results()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,149 @@
+"""
+Test Module for percentiles.py
+Tests: estimate_percentiles (exact, subsample, histogram), stretch normalization
+
+HOW TO RUN:
+    python tests/test_percentiles.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints the time of each method on a 16-megapixel channel
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from percentiles import estimate_percentiles, PERCENTILE_METHODS
+from image_processing import AIModel
+import numpy as np
+import time
+
+def make_channel(size=4096, seed=0):
+    """Noisy sky background with a few bright sources"""
+    rng = np.random.default_rng(seed)
+    data = rng.standard_normal((size, size)).astype(np.float32) * 5 + 100
+    hot = rng.integers(0, data.size, data.size // 1000)
+    data.flat[hot] = rng.random(hot.size).astype(np.float32) * 1e4
+    return data
+
+def test_exact_matches_numpy():
+    """Test that 'exact' is bit-identical to np.percentile"""
+    print("\n" + "="*60)
+    print("TEST 1: Exact Method Matches np.percentile")
+    print("="*60)
+
+    rng = np.random.default_rng(1)
+    for trial in range(500):
+        size = int(rng.integers(1, 2000))
+        data = (rng.standard_normal(size) * rng.random() * 100).astype(np.float32)
+        qs = [0.0, float(rng.random() * 5), 0.5, 99.8, float(95 + rng.random() * 5), 100.0]
+        expected = [np.percentile(data, q) for q in qs]
+        actual = estimate_percentiles(data, qs, 'exact')
+        for e, a in zip(expected, actual):
+            assert e == a and type(e) == type(a), f"Mismatch for n={size}: {expected} vs {actual}!"
+
+    data = make_channel(256)
+    original = data.copy()
+    estimate_percentiles(data, [0.5, 99.8], 'exact')
+    assert np.array_equal(data, original), "Input must not be reordered!"
+
+    print("✓ PASSED: 500 random arrays give identical values")
+
+def test_approximate_methods():
+    """Test accuracy of subsample and histogram estimates"""
+    print("\n" + "="*60)
+    print("TEST 2: Approximate Methods")
+    print("="*60)
+
+    data = make_channel()
+    qs = [0.5, 99.8]
+    timings = {}
+    results = {}
+    for method in PERCENTILE_METHODS:
+        start = time.perf_counter()
+        results[method] = estimate_percentiles(data, qs, method)
+        timings[method] = time.perf_counter() - start
+
+    exact = results['exact']
+    # Background noise sigma is 5: approximate values must be well within that
+    for method in ('subsample', 'histogram'):
+        error = max(abs(float(a) - float(e)) for a, e in zip(results[method], exact))
+        assert error < 0.5, f"{method} error {error} too large!"
+
+    bin_width = (float(data.max()) - float(data.min())) / 256
+    coarse = estimate_percentiles(data, qs, 'histogram', bins=256)
+    assert all(abs(float(c) - float(e)) <= bin_width for c, e in zip(coarse, exact)), \
+        "Histogram error should stay within one bin!"
+
+    # A few hot pixels put the whole sky into the first bin of the first histogram
+    rng = np.random.default_rng(3)
+    sky = (rng.standard_normal(4_000_000) * 0.02 + 0.1).astype(np.float32)
+    sky[rng.choice(sky.size, 200, replace=False)] = 3e5
+    expected = estimate_percentiles(sky, qs, 'exact')
+    actual = estimate_percentiles(sky, qs, 'histogram')
+    error = max(abs(float(a) - float(e)) for a, e in zip(actual, expected))
+    assert error < 1e-4, f"Hot pixels spoil the histogram: {actual} vs {expected}!"
+
+    flat = np.full((100, 100), 7.0, dtype=np.float32)
+    assert estimate_percentiles(flat, qs, 'histogram') == [7.0, 7.0], "Constant data failed!"
+
+    try:
+        estimate_percentiles(data, qs, 'guess')
+        assert False, "Unknown method should raise ValueError!"
+    except ValueError:
+        pass
+
+    print("✓ PASSED: Approximations are accurate")
+    for method in PERCENTILE_METHODS:
+        print(f"  - {method:9s}: {timings[method] * 1000:6.1f} ms, {results[method]}")
+
+def test_stretch_uses_estimator():
+    """Test the stretch with exact and approximate percentiles"""
+    print("\n" + "="*60)
+    print("TEST 3: Stretch Normalization")
+    print("="*60)
+
+    model = AIModel()
+    data = make_channel(2048)
+
+    # Reference: the original per-call np.percentile normalization
+    vmin, vmax = np.percentile(data, 0.5), np.percentile(data, 99.8)
+    expected = np.power(np.clip((data - vmin) / (vmax - vmin + 1e-10), 0, 1), 1.0 / 2.4)
+
+    exact = model._stretch_data(data, 'power', 2.4, 0.5, 99.8, percentile_method='exact')
+    assert np.array_equal(exact, expected), "Exact stretch should not change the output!"
+
+    approx = model._stretch_data(data, 'power', 2.4, 0.5, 99.8, percentile_method='subsample')
+    # The power curve is steep near black, so allow a few percent there
+    assert np.abs(approx - expected).max() < 0.05, "Subsampled stretch differs too much!"
+
+    print("✓ PASSED: Stretch output unchanged with 'exact'")
+    print(f"  - Max difference with 'subsample': {np.abs(approx - expected).max():.5f}")
+
+def run_all_tests():
+    """Run all percentiles tests"""
+    print("\n" + "#"*60)
+    print("# TESTING percentiles.py")
+    print("#"*60)
+
+    try:
+        test_exact_matches_numpy()
+        test_approximate_methods()
+        test_stretch_uses_estimator()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
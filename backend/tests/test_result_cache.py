@@ -0,0 +1,254 @@
+"""
+Test Module for result_cache.py
+Tests: LRUCache, DiskLRUCache, ResultCache, cached AppController results,
+       bounded response_mode='url' images
+
+HOW TO RUN:
+    python tests/test_result_cache.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints cache hit/miss counters and the timing of a cached request
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from result_cache import LRUCache, DiskLRUCache, ResultCache, create_result_cache
+from controller import AppController, STATIC_FOLDER, RESULTS_SUBFOLDER
+from helpers import MockFileStorage
+from astropy.io import fits
+import numpy as np
+import tempfile
+import shutil
+import time
+
+def test_memory_lru():
+    """Test size-bounded LRU eviction and counters"""
+    print("\n" + "="*60)
+    print("TEST 1: In-memory LRU")
+    print("="*60)
+
+    cache = LRUCache(max_bytes=100)
+    cache.put('a', 'A', 40)
+    cache.put('b', 'B', 40)
+    assert cache.get('a') == 'A', "Entry a should be cached!"
+
+    # 'b' is now least recently used and gets evicted
+    cache.put('c', 'C', 40)
+    assert cache.get('b') is None, "Entry b should have been evicted!"
+    assert cache.get('c') == 'C' and cache.get('a') == 'A', "Entries a and c should remain!"
+
+    cache.put('huge', 'H', 1000)
+    assert cache.get('huge') is None, "Oversized entries should not be stored!"
+
+    stats = cache.stats()
+    assert stats['hits'] == 3 and stats['misses'] == 2, f"Unexpected counters {stats}!"
+    assert stats['evictions'] == 1 and stats['bytes'] == 80, f"Unexpected size stats {stats}!"
+
+    print("✓ PASSED: LRU evicts by size and counts hits/misses")
+    print(f"  - Stats: {stats}")
+
+def test_disk_lru():
+    """Test the on-disk LRU cache"""
+    print("\n" + "="*60)
+    print("TEST 2: On-disk LRU")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        cache = DiskLRUCache(tmp_dir, max_bytes=10)
+        cache.put('one', b'12345')
+        cache.put('two', b'67890')
+        assert cache.get('one') == b'12345', "Entry should be read from disk!"
+
+        cache.put('three', b'abcde')
+        assert not os.path.exists(os.path.join(tmp_dir, 'two')), "Evicted file should be deleted!"
+
+        # A new instance picks up what is already on disk
+        reopened = DiskLRUCache(tmp_dir, max_bytes=10)
+        assert reopened.get('three') == b'abcde', "Entries should survive a restart!"
+        assert len(reopened) == 2, "Reopened cache should index existing files!"
+
+        # Finished files are moved in; over budget they stay until the next entry
+        big_path = os.path.join(tmp_dir, 'big.tmp')
+        with open(big_path, 'wb') as f:
+            f.write(b'x' * 20)
+        reopened.put_file('big', big_path)
+        assert reopened.touch('big') and not reopened.touch('one'), "Wrong entries after put_file!"
+        assert sorted(os.listdir(tmp_dir)) == ['big'], "Older files should be evicted!"
+
+        # Temporary files of a crashed writer are removed on start, fresh ones are kept
+        for name in ('stale.tmp', 'fresh.tmp'):
+            open(os.path.join(tmp_dir, name), 'wb').close()
+        old = time.time() - 2 * 3600
+        os.utime(os.path.join(tmp_dir, 'stale.tmp'), (old, old))
+        DiskLRUCache(tmp_dir, max_bytes=10)
+        assert sorted(os.listdir(tmp_dir)) == ['big', 'fresh.tmp'], "Stale temporary file not removed!"
+
+        print("✓ PASSED: Disk cache evicts files and persists entries")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_result_cache_keys():
+    """Test content-addressed keys"""
+    print("\n" + "="*60)
+    print("TEST 3: Content-addressed Keys")
+    print("="*60)
+
+    key1 = ResultCache.make_key(['aa', 'bb', 'cc'], {'palette': 'natural', 'power': 2.4})
+    key2 = ResultCache.make_key(['aa', 'bb', 'cc'], {'power': 2.4, 'palette': 'natural'})
+    key3 = ResultCache.make_key(['bb', 'aa', 'cc'], {'palette': 'natural', 'power': 2.4})
+    key4 = ResultCache.make_key(['aa', 'bb', 'cc'], {'palette': 'hubble', 'power': 2.4})
+
+    assert key1 == key2, "Parameter order should not matter!"
+    assert key1 != key3, "Channel order should matter!"
+    assert key1 != key4, "Different parameters should give different keys!"
+
+    cache = create_result_cache('memory', max_bytes=1024)
+    cache.put(key1, b'\x89PNG\nbytes', {'TELESCOP': 'HST'})
+    image_bytes, metadata = cache.get(key1)
+    assert image_bytes == b'\x89PNG\nbytes' and metadata == {'TELESCOP': 'HST'}, "Round trip failed!"
+    assert create_result_cache('off') is None, "'off' should disable caching!"
+
+    print("✓ PASSED: Keys depend on contents and settings only")
+
+def test_controller_cache_hit():
+    """Test that a repeated request is served from the cache"""
+    print("\n" + "="*60)
+    print("TEST 4: Repeated Colorization Hits the Cache")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    try:
+        rng = np.random.default_rng(5)
+        paths = []
+        for name in ('r', 'g', 'b'):
+            path = os.path.join(tmp_dir, f"cache_{name}.fits")
+            fits.PrimaryHDU(rng.random((96, 96)).astype(np.float32)).writeto(path)
+            paths.append(path)
+
+        def make_files(prefix):
+            # Different file names, same contents
+            return {channel: MockFileStorage(path, f"{prefix}_{os.path.basename(path)}")
+                    for channel, path in zip(('red', 'green', 'blue'), paths)}
+
+        controller = AppController()
+        controller.result_cache = create_result_cache('memory')
+
+        start = time.perf_counter()
+        first, error = controller.colorize_layers(make_files('first'), {'palette': 'natural'})
+        cold = time.perf_counter() - start
+        assert error is None, f"Colorization failed: {error}"
+
+        start = time.perf_counter()
+        second, error = controller.colorize_layers(make_files('second'), {'palette': 'natural'})
+        warm = time.perf_counter() - start
+        assert error is None, f"Cached colorization failed: {error}"
+
+        assert second == first, "Cached result should equal the original!"
+        stats = controller.get_cache_stats()['results']
+        assert stats['hits'] == 1 and stats['misses'] == 1, f"Unexpected stats {stats}!"
+
+        controller.colorize_layers(make_files('third'), {'palette': 'hubble'})
+        assert controller.get_cache_stats()['results']['misses'] == 2, "New palette should miss!"
+
+        # Server-side settings are part of the key too
+        import percentiles
+        sample_size = percentiles.PERCENTILE_SAMPLE_SIZE
+        try:
+            percentiles.PERCENTILE_SAMPLE_SIZE = 1000
+            controller.colorize_layers(make_files('fourth'), {'palette': 'natural',
+                                                              'percentile_method': 'subsample'})
+            percentiles.PERCENTILE_SAMPLE_SIZE = sample_size
+            controller.colorize_layers(make_files('fifth'), {'palette': 'natural',
+                                                             'percentile_method': 'subsample'})
+        finally:
+            percentiles.PERCENTILE_SAMPLE_SIZE = sample_size
+        controller.image_processor.denoiser_config['precision'] = 'int8'
+        controller.colorize_layers(make_files('sixth'), {'palette': 'natural'})
+        assert controller.get_cache_stats()['results']['misses'] == 5, \
+            "Other server settings should miss!"
+
+        print("✓ PASSED: Repeated request served from cache")
+        print(f"  - Cold: {cold * 1000:.0f} ms, cached: {warm * 1000:.1f} ms")
+    finally:
+        shutil.rmtree(tmp_dir)
+
+def test_url_results_bounded():
+    """Test that images saved for response_mode='url' stay within their budget"""
+    print("\n" + "="*60)
+    print("TEST 5: Bounded URL Results")
+    print("="*60)
+
+    tmp_dir = tempfile.mkdtemp()
+    cwd = os.getcwd()
+    try:
+        # The controller writes under static/ relative to the working directory
+        os.chdir(tmp_dir)
+        paths = []
+        rng = np.random.default_rng(6)
+        for name in ('r', 'g', 'b'):
+            path = os.path.join(tmp_dir, f"url_{name}.fits")
+            fits.PrimaryHDU(rng.random((64, 64)).astype(np.float32)).writeto(path)
+            paths.append(path)
+        results_dir = os.path.join(STATIC_FOLDER, RESULTS_SUBFOLDER)
+        os.makedirs(results_dir)
+        stale_path = os.path.join(results_dir, 'stream.123.456.tmp')
+        open(stale_path, 'wb').close()
+        old = time.time() - 2 * 3600
+        os.utime(stale_path, (old, old))
+
+        controller = AppController()
+        controller.result_cache = None
+        assert not os.path.exists(stale_path), "Temporary file of a crashed render not removed!"
+
+        def render(palette):
+            files = {channel: MockFileStorage(path, os.path.basename(path))
+                     for channel, path in zip(('red', 'green', 'blue'), paths)}
+            result, error = controller.colorize_layers(files, {'palette': palette}, response_mode='url')
+            assert error is None, f"Colorization failed: {error}"
+            return os.path.basename(result['imageUrl'])
+
+        first = render('natural')
+        # Room for about one image
+        controller.url_results.max_bytes = os.path.getsize(os.path.join(results_dir, first)) * 3 // 2
+        assert render('natural') == first, "Same render should reuse its file!"
+        second = render('hubble')
+        assert os.listdir(results_dir) == [second], "Oldest image should be evicted!"
+        controller.history_manager.close()
+
+        print("✓ PASSED: URL results evicted beyond the budget, stale temporary files removed")
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(tmp_dir)
+
+def run_all_tests():
+    """Run all result_cache tests"""
+    print("\n" + "#"*60)
+    print("# TESTING result_cache.py")
+    print("#"*60)
+
+    try:
+        test_memory_lru()
+        test_disk_lru()
+        test_result_cache_keys()
+        test_controller_cache_hit()
+        test_url_results_bounded()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,120 @@
+"""
+Test Module for backend startup latency
+Tests: lazy imports in app.py, controller.py, image_processing.py, colorizer.py
+
+HOW TO RUN:
+    python tests/test_startup.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints the measured import time of app.py (set STARTUP_BUDGET_SECONDS
+      to change the allowed budget, default 3 seconds)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import subprocess
+import json
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', 3.0))
+
+def measure_in_subprocess(code):
+    """Run `code` in a fresh interpreter and return the JSON it prints"""
+    result = subprocess.run([sys.executable, '-c', code], cwd=BACKEND_DIR,
+                            capture_output=True, text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+def test_import_time():
+    """Benchmark importing the Flask app"""
+    print("\n" + "="*60)
+    print("TEST 1: App Import Time")
+    print("="*60)
+
+    stats = measure_in_subprocess(
+        "import json, sys, time\n"
+        "start = time.perf_counter()\n"
+        "import app\n"
+        "elapsed = time.perf_counter() - start\n"
+        "print(json.dumps({'seconds': elapsed, 'torch': 'torch' in sys.modules,\n"
+        "                  'astropy': 'astropy' in sys.modules}))\n")
+
+    assert not stats['torch'], "Importing app should not import torch!"
+    assert not stats['astropy'], "Importing app should not import astropy!"
+    assert stats['seconds'] < STARTUP_BUDGET_SECONDS, \
+        f"Import took {stats['seconds']:.2f}s, budget is {STARTUP_BUDGET_SECONDS}s!"
+
+    print("✓ PASSED: App imports without torch/astropy")
+    print(f"  - Import time: {stats['seconds'] * 1000:.0f} ms")
+
+def test_light_requests_stay_light():
+    """Test that /health and /history do not load torch"""
+    print("\n" + "="*60)
+    print("TEST 2: Light Requests Skip Heavy Imports")
+    print("="*60)
+
+    stats = measure_in_subprocess(
+        "import json, sys, time\n"
+        "import app\n"
+        "client = app.app.test_client()\n"
+        "start = time.perf_counter()\n"
+        "codes = [client.get('/health').status_code, client.get('/history').status_code]\n"
+        "elapsed = time.perf_counter() - start\n"
+        "print(json.dumps({'codes': codes, 'seconds': elapsed, 'torch': 'torch' in sys.modules}))\n")
+
+    assert stats['codes'] == [200, 200], f"Unexpected status codes {stats['codes']}!"
+    assert not stats['torch'], "/health and /history should not import torch!"
+
+    print("✓ PASSED: Health and history served without torch")
+    print(f"  - First requests took: {stats['seconds'] * 1000:.0f} ms")
+
+def test_warm_up_loads_model():
+    """Test that the explicit warm-up hook loads the denoiser"""
+    print("\n" + "="*60)
+    print("TEST 3: Warm-up Hook")
+    print("="*60)
+
+    stats = measure_in_subprocess(
+        "import json, sys, time\n"
+        "import app\n"
+        "start = time.perf_counter()\n"
+        "app.warm_up()\n"
+        "elapsed = time.perf_counter() - start\n"
+        "from model_registry import registry\n"
+        "print(json.dumps({'seconds': elapsed, 'torch': 'torch' in sys.modules,\n"
+        "                  'models': len(registry.keys())}))\n")
+
+    assert stats['torch'], "Warm-up should import torch!"
+    assert stats['models'] == 1, "Warm-up should load the denoiser into the registry!"
+
+    print("✓ PASSED: Warm-up loads the model ahead of requests")
+    print(f"  - Warm-up time: {stats['seconds'] * 1000:.0f} ms")
+
+def run_all_tests():
+    """Run all startup tests"""
+    print("\n" + "#"*60)
+    print("# TESTING backend startup")
+    print("#"*60)
+
+    try:
+        test_import_time()
+        test_light_requests_stay_light()
+        test_warm_up_loads_model()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
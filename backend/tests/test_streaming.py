@@ -0,0 +1,233 @@
+"""
+Test Module for streaming.py
+Tests: StripColorizer (statistics pass, strip encoding, strip denoising),
+       streaming through /colorize-layers
+
+HOW TO RUN:
+    python tests/test_streaming.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints the peak heap memory of streamed vs in-memory rendering
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+from streaming import StripColorizer
+from image_processing import ImageProcessor
+from downsampler import Downsampler
+from models import FITSData
+from test_encoders import decode_png
+from astropy.io import fits
+from io import BytesIO
+from PIL import Image
+import numpy as np
+import tracemalloc
+import base64
+
+def make_cube(shape=(3, 301, 203), seed=0):
+    """Noisy layers with a few hot pixels and a NaN"""
+    rng = np.random.default_rng(seed)
+    cube = (rng.standard_normal(shape) * 5 + 100).astype(np.float32)
+    hot = rng.integers(0, cube[1].size, 200)
+    cube[1].flat[hot] = 5000
+    cube[0, 5, 5] = np.nan
+    return cube
+
+def make_params(**overrides):
+    params = {
+        'red_channel': 2, 'green_channel': 0, 'blue_channel': 1,
+        'stretch_name': 'power', 'power': 2.4,
+        'black_point': 0.5, 'white_point': 99.8, 'saturation': 1.3,
+        'red_scale': 1.2, 'green_scale': 1.0, 'blue_scale': 0.9,
+        'percentile_method': 'subsample', 'use_denoising': False,
+        'output_format': 'png', 'compress_level': 1
+    }
+    params.update(overrides)
+    return params
+
+def render_in_memory(processor, cube, downsampler, params):
+    """The regular path: downsample the whole cube, then process it"""
+    small = np.empty((cube.shape[0],) + downsampler.output_shape(cube.shape[1:]), dtype=np.float32)
+    for index in range(cube.shape[0]):
+        downsampler.downsample_into(cube[index], cube.shape[1:], small[index])
+    return processor.process_image(FITSData(small, None), dict(params))
+
+def test_matches_in_memory():
+    """Test that streamed images equal in-memory renders with 'subsample' percentiles"""
+    print("\n" + "="*60)
+    print("TEST 1: Streamed Image Matches In-memory Render")
+    print("="*60)
+
+    processor = ImageProcessor()
+    cube = make_cube()
+    downsampler = Downsampler(mode='mean', factor=2)
+    # A small sample, so the subsample path is really exercised
+    colorizer = StripColorizer(processor.model_engine, strip_rows=17, sample_size=5000)
+
+    import percentiles
+    sample_size = percentiles.PERCENTILE_SAMPLE_SIZE
+    percentiles.PERCENTILE_SAMPLE_SIZE = 5000
+    try:
+        for stretch_name in ('power', 'asinh', 'log'):
+            for overrides in ({}, {'saturation_mode': 'luma'}, {'stretch_mode': 'lut'}):
+                params = make_params(stretch_name=stretch_name, **overrides)
+                expected = np.asarray(render_in_memory(processor, cube, downsampler, params).pil_image)
+                stream = BytesIO()
+                colorizer.render(list(cube), cube.shape[1:], downsampler, params, stream)
+                assert np.array_equal(decode_png(stream.getvalue()), expected), \
+                    f"Streamed {stretch_name} {overrides} differs!"
+            print(f"  ✓ {stretch_name}: identical")
+
+        # 16-bit TIFF goes through the same strips
+        params = make_params(output_format='tiff16')
+        expected = render_in_memory(processor, cube, downsampler, params).to_uint16()
+        stream = BytesIO()
+        colorizer.render(list(cube), cube.shape[1:], downsampler, params, stream)
+        offset = Image.open(BytesIO(stream.getvalue())).tile[0][2]
+        decoded = np.frombuffer(stream.getvalue(), dtype='<u2', count=expected.size, offset=offset)
+        assert np.array_equal(decoded.reshape(expected.shape), expected), "Streamed TIFF differs!"
+    finally:
+        percentiles.PERCENTILE_SAMPLE_SIZE = sample_size
+
+    try:
+        colorizer.render(list(cube), cube.shape[1:], downsampler, make_params(output_format='jpeg'),
+                         BytesIO())
+        assert False, "JPEG cannot be streamed and should raise ValueError!"
+    except ValueError:
+        pass
+
+    print("✓ PASSED: Strip by strip gives the same pixels")
+
+def test_denoised_strips():
+    """Test that strip denoising with a halo matches denoising the whole cube"""
+    print("\n" + "="*60)
+    print("TEST 2: Denoising Strip by Strip")
+    print("="*60)
+
+    processor = ImageProcessor()
+    processor.denoise_cache = None
+    cube = make_cube((3, 150, 120), seed=1)
+    cube[2] = 7.0  # Flat channels are passed through
+    downsampler = Downsampler(mode='stride', factor=1)
+    params = make_params(use_denoising=True, output_format='png16')
+
+    expected = render_in_memory(processor, cube, downsampler, params).to_uint16()
+    stream = BytesIO()
+    StripColorizer(processor.model_engine, processor.denoiser, strip_rows=40).render(
+        list(cube), cube.shape[1:], downsampler, params, stream)
+    actual = decode_png(stream.getvalue())
+
+    levels = np.abs(actual.astype(int) - expected).max()
+    # Only float noise from the different tile shapes is allowed
+    assert levels <= 2, f"Denoised strips differ by {levels} of 65535!"
+
+    print("✓ PASSED: Strip denoising matches the whole-cube result")
+    print(f"  - Max difference: {levels} of 65535")
+
+def test_memory_bound():
+    """Test that the strips keep memory independent of the image height"""
+    print("\n" + "="*60)
+    print("TEST 3: Bounded Memory")
+    print("="*60)
+
+    processor = ImageProcessor()
+    cube = make_cube((3, 2400, 1000), seed=2)
+    downsampler = Downsampler(mode='stride', factor=1)
+    params = make_params(stretch_name='asinh')
+
+    tracemalloc.start()
+    StripColorizer(processor.model_engine, strip_rows=64).render(
+        list(cube), cube.shape[1:], downsampler, params, BytesIO())
+    streamed_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    render_in_memory(processor, cube, downsampler, params).export_to('png', compress_level=1)
+    memory_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert streamed_peak < memory_peak / 4, "Streaming should need a fraction of the memory!"
+
+    print("✓ PASSED: Streaming memory is bounded by the strip size")
+    print(f"  - Peak heap: streamed {streamed_peak / 1e6:.0f} MB, in memory {memory_peak / 1e6:.0f} MB")
+
+def test_streaming_endpoint():
+    """Test streaming=1 through /colorize-layers"""
+    print("\n" + "="*60)
+    print("TEST 4: Streaming Requests")
+    print("="*60)
+
+    import app as backend_app
+    client = backend_app.app.test_client()
+
+    def post(dtype=np.float32, **fields):
+        data = {'palette': 'natural', 'downsample_factor': '1'}
+        cube = make_cube((3, 80, 60), seed=3)
+        for index, channel in enumerate(('red', 'green', 'blue')):
+            buffer = BytesIO()
+            layer = np.nan_to_num(cube[index]) if dtype == np.uint16 else cube[index]
+            fits.PrimaryHDU(layer.astype(dtype)).writeto(buffer)
+            buffer.seek(0)
+            data[f'{channel}_file'] = (buffer, f'stream_{channel}.fits')
+        data.update(fields)
+        return client.post('/colorize-layers', data=data, content_type='multipart/form-data')
+
+    # Smaller than the percentile sample: streamed pixels equal the exact render
+    regular = post(response_mode='binary').data
+    streamed = post(response_mode='url', streaming='1').get_json()
+    image_response = client.get(streamed['imageUrl'])
+    assert np.array_equal(np.asarray(Image.open(BytesIO(image_response.data))),
+                          np.asarray(Image.open(BytesIO(regular)))), "Streamed URL image differs!"
+    image_response.close()
+
+    body = post(streaming='1', output_format='png16').get_json()
+    assert body['imageData'].startswith('data:image/png;base64,'), "Expected a PNG data URI!"
+    assert len(base64.b64decode(body['imageData'].split(',', 1)[1])) > 0, "Empty streamed PNG!"
+
+    # Unsigned 16-bit layers are stored scaled (BZERO), in memory and spilled to disk alike
+    import uploads
+    spool_mb = uploads.UPLOAD_SPOOL_MB
+    try:
+        for uploads.UPLOAD_SPOOL_MB in (spool_mb, 0):
+            scaled = post(dtype=np.uint16, streaming='1', response_mode='binary')
+            assert scaled.status_code == 200, f"Streaming uint16 layers failed: {scaled.get_json()}"
+    finally:
+        uploads.UPLOAD_SPOOL_MB = spool_mb
+
+    failed = post(streaming='1', output_format='jpeg')
+    assert failed.status_code == 500 and 'stream' in failed.get_json()['error'].lower(), \
+        "Streaming JPEG should fail with a clear error!"
+
+    print("✓ PASSED: Streaming renders served in every response mode")
+    print(f"  - URL: {streamed['imageUrl']}")
+
+def run_all_tests():
+    """Run all streaming tests"""
+    print("\n" + "#"*60)
+    print("# TESTING streaming.py")
+    print("#"*60)
+
+    try:
+        test_matches_in_memory()
+        test_denoised_strips()
+        test_memory_bound()
+        test_streaming_endpoint()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
@@ -0,0 +1,164 @@
+"""
+Test Module for uploads.py
+Tests: UploadSpool (in memory, spilled to a temporary file, cleanup),
+       /colorize-layers parsing uploads without saving them
+
+HOW TO RUN:
+    python tests/test_uploads.py
+
+EXPECTED OUTPUT:
+    - All tests should print "✓ PASSED" for each test case
+    - Prints where the uploads of each request were kept
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+
+import uploads
+from uploads import UploadSpool
+from fits_loader import FITSLoader
+from helpers import make_fits_bytes
+from astropy.io import fits
+from io import BytesIO
+import numpy as np
+import hashlib
+import tempfile
+import shutil
+import time
+
+def write_chunks(spool, data, chunk_size=7000):
+    """Write like werkzeug's parser does, in pieces"""
+    for start in range(0, len(data), chunk_size):
+        spool.write(data[start:start + chunk_size])
+    spool.seek(0)
+
+def test_spool():
+    """Test in-memory and spilled spools"""
+    print("\n" + "="*60)
+    print("TEST 1: UploadSpool")
+    print("="*60)
+
+    data = make_fits_bytes(0, (120, 90))
+    expected = fits.getdata(BytesIO(data))
+    temp_dir = tempfile.mkdtemp()
+    try:
+        for max_bytes in (len(data), 10_000):
+            spool = UploadSpool(max_bytes=max_bytes, temp_dir=temp_dir)
+            write_chunks(spool, data)
+            spilled = max_bytes < len(data)
+            assert spool.in_memory != spilled, "Spool spilled at the wrong size!"
+            assert (len(os.listdir(temp_dir)) == 1) == spilled, "Unexpected spill files!"
+            assert spool.size() == len(data), "Wrong spool size!"
+            assert spool.read() == data, "Spool contents differ!"
+            assert spool.digest() == hashlib.sha256(data).hexdigest(), "Wrong digest!"
+
+            # astropy closes its file objects: every source must be new
+            for _ in range(2):
+                cube = FITSLoader().load_cube([spool.source(), spool.source()])
+                assert np.array_equal(cube.data[1], expected), "Parsed data differs!"
+            with FITSLoader().open_layers([spool.source()]) as (sections, shape, header):
+                assert np.array_equal(sections[0][10:20], expected[10:20]), "Sections differ!"
+
+            spool.close()
+            assert os.listdir(temp_dir) == [], "Spill file not deleted on close!"
+            try:
+                spool.source()
+                assert False, "Closed spools should not be readable!"
+            except ValueError:
+                pass
+            print(f"  ✓ {'spilled' if spilled else 'in memory'}: parsed and cleaned up")
+
+        # Unclosed spools are cleaned up when collected
+        spool = UploadSpool.from_stream(BytesIO(data), max_bytes=0, temp_dir=temp_dir)
+        assert len(os.listdir(temp_dir)) == 1, "from_stream should spill!"
+        del spool
+        assert os.listdir(temp_dir) == [], "Spill file outlived its spool!"
+    finally:
+        shutil.rmtree(temp_dir)
+
+    print("✓ PASSED: Uploads parsed from memory or a self-deleting file")
+
+def test_endpoint_uploads():
+    """Test that requests never save uploads and clean up their spill files"""
+    print("\n" + "="*60)
+    print("TEST 2: Uploads Through /colorize-layers")
+    print("="*60)
+
+    import app as backend_app
+    client = backend_app.app.test_client()
+    layers = [make_fits_bytes(seed) for seed in (1, 2, 3)]
+
+    def post(**fields):
+        data = {'palette': 'natural', 'response_mode': 'binary'}
+        for channel, layer in zip(('red', 'green', 'blue'), layers):
+            data[f'{channel}_file'] = (BytesIO(layer), f'upload_{channel}.fits')
+        data.update(fields)
+        return client.post('/colorize-layers', data=data, content_type='multipart/form-data')
+
+    controller = backend_app.get_controller()
+    result_cache = controller.result_cache
+    controller.result_cache = None  # Every request parses its uploads
+    spool_mb = uploads.UPLOAD_SPOOL_MB
+    temp_dir = tempfile.mkdtemp()
+    uploads.UPLOAD_TEMP_DIR = temp_dir
+    try:
+        in_memory = post()
+        assert in_memory.status_code == 200, f"In-memory request failed: {in_memory.get_json()}"
+        assert os.listdir(temp_dir) == [], "Small uploads should stay in memory!"
+
+        uploads.UPLOAD_SPOOL_MB = 0  # Spill everything
+        spilled = post()
+        assert spilled.status_code == 200, f"Spilled request failed: {spilled.get_json()}"
+        assert spilled.data == in_memory.data, "Spilled uploads gave another image!"
+        assert os.listdir(temp_dir) == [], "Spill files left after the request!"
+
+        # Background jobs own their uploads until they finish
+        body = post(progressive='1').get_json()
+        assert 'preview_error' not in body, f"Preview failed: {body.get('preview_error')}"
+        deadline = time.time() + 120
+        while time.time() < deadline:
+            status = client.get(body['status_url']).get_json()
+            if status['status'] in ('done', 'failed'):
+                break
+            time.sleep(0.05)
+        assert status['status'] == 'done', f"Job did not succeed: {status}!"
+        assert client.get(body['result_url']).data == in_memory.data, "Job image differs!"
+        assert os.listdir(temp_dir) == [], "Spill files left after the job!"
+    finally:
+        uploads.UPLOAD_SPOOL_MB = spool_mb
+        uploads.UPLOAD_TEMP_DIR = None
+        controller.result_cache = result_cache
+        shutil.rmtree(temp_dir)
+
+    assert not os.path.exists(os.path.join('uploads', 'upload_red.fits')), \
+        "Uploads should not be saved under their names!"
+
+    print("✓ PASSED: Uploads parsed without saving, temporary files removed")
+    print(f"  - Layer size: {len(layers[0])} bytes, spilled with UPLOAD_SPOOL_MB=0")
+
+def run_all_tests():
+    """Run all upload tests"""
+    print("\n" + "#"*60)
+    print("# TESTING uploads.py")
+    print("#"*60)
+
+    try:
+        test_spool()
+        test_endpoint_uploads()
+
+        print("\n" + "="*60)
+        print("✓✓✓ ALL TESTS PASSED ✓✓✓")
+        print("="*60)
+
+    except AssertionError as e:
+        print(f"\n✗ TEST FAILED: {e}")
+        sys.exit(1)
+    except Exception as e:
+        print(f"\n✗ UNEXPECTED ERROR: {e}")
+        import traceback
+        traceback.print_exc()
+        sys.exit(1)
+
+if __name__ == "__main__":
+    run_all_tests()
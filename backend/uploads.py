@@ -0,0 +1,128 @@
+import os
+import hashlib
+import shutil
+import tempfile
+from io import BytesIO
+from result_cache import ResultCache
+
+# Uploads up to this size stay in memory and are parsed from there; larger ones
+# are written once to a temporary file that is memory-mapped while reading
+UPLOAD_SPOOL_MB = int(os.environ.get('UPLOAD_SPOOL_MB', 256))
+# Where uploads above UPLOAD_SPOOL_MB are spilled (default: the system temp directory)
+UPLOAD_TEMP_DIR = os.environ.get('UPLOAD_TEMP_DIR') or None
+
+class UploadSpool:
+    """
+    Write-once buffer for one uploaded file.
+
+    Used as the stream werkzeug parses the request body into, so an upload is
+    copied exactly once: into memory, or, past `max_bytes`, into a temporary
+    file. The file is deleted on close; werkzeug closes the streams of a
+    request when it ends.
+
+    Every `source()` is a fresh file object (astropy closes the ones it is
+    given), so the same upload can be opened several times.
+    """
+
+    def __init__(self, max_bytes=None, temp_dir=None):
+        """
+        Args:
+            max_bytes: size kept in memory (default UPLOAD_SPOOL_MB)
+            temp_dir: directory of the spill file (default UPLOAD_TEMP_DIR)
+        """
+        self.max_bytes = UPLOAD_SPOOL_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.temp_dir = UPLOAD_TEMP_DIR if temp_dir is None else temp_dir
+        self.path = None
+        self._buffer = BytesIO()
+        self._file = None
+        self.closed = False
+
+    @classmethod
+    def from_stream(cls, stream, **kwargs):
+        """Spool any readable binary stream, from its current position."""
+        spool = cls(**kwargs)
+        shutil.copyfileobj(stream, spool, 1024 * 1024)
+        spool.seek(0)
+        return spool
+
+    @property
+    def in_memory(self):
+        return self.path is None
+
+    def _active(self):
+        if self.closed:
+            raise ValueError("I/O operation on closed upload")
+        return self._buffer if self._file is None else self._file
+
+    def write(self, data):
+        if self._file is None and self._buffer.tell() + len(data) > self.max_bytes:
+            self._rollover()
+        return self._active().write(data)
+
+    def _rollover(self):
+        """Move the buffered bytes to a temporary file and keep writing there."""
+        fd, self.path = tempfile.mkstemp(prefix='upload.', suffix='.fits', dir=self.temp_dir)
+        self._file = os.fdopen(fd, 'w+b')
+        self._file.write(self._buffer.getbuffer())
+        self._file.seek(self._buffer.tell())
+        self._buffer = None
+
+    def read(self, size=-1):
+        return self._active().read(size)
+
+    def readline(self, size=-1):
+        return self._active().readline(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        return self._active().seek(offset, whence)
+
+    def tell(self):
+        return self._active().tell()
+
+    def size(self):
+        """Number of bytes uploaded."""
+        if self._file is None:
+            return self._active().getbuffer().nbytes
+        self._file.flush()
+        return os.path.getsize(self.path)
+
+    def source(self):
+        """
+        A new binary file object for fits.open: a BytesIO sharing the buffer,
+        or the spill file opened for reading (memory-mapped by astropy, and
+        still readable if the spool is closed meanwhile).
+        """
+        active = self._active()
+        if self._file is None:
+            # getvalue() shares the buffer's bytes instead of copying them
+            return BytesIO(active.getvalue())
+        active.flush()
+        return open(self.path, 'rb')
+
+    def digest(self):
+        """SHA-256 hex digest of the upload."""
+        active = self._active()
+        if self._file is None:
+            return hashlib.sha256(active.getbuffer()).hexdigest()
+        active.flush()
+        return ResultCache.file_digest(self.path)
+
+    def close(self):
+        """Release the buffer and delete the temporary file, if any."""
+        if self.closed:
+            return
+        self.closed = True
+        self._buffer = None
+        if self._file is not None:
+            self._file.close()
+            os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __del__(self):
+        # Temporary files must not outlive an upload that was never closed
+        self.close()
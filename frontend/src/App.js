@@ -6,6 +6,12 @@ import HistoryViewer from './components/HistoryViewer';
 import './App.css';
 
 const API_URL = 'http://127.0.0.1:5000';
+const POLL_INTERVAL_MS = 500;
+// Quick preview first, full render as a background job. Off by default: jobs live in the
+// backend process that accepted them, so this needs a single worker or sticky routing
+const PROGRESSIVE = process.env.REACT_APP_PROGRESSIVE === '1';
+
+const sleep = (ms) => new Promise(resolve => setTimeout(resolve, ms));
 
 function App() {
   const [redFile, setRedFile] = useState(null);
@@ -14,6 +20,7 @@ function App() {
   const [processedImage, setProcessedImage] = useState(null);
   const [metadata, setMetadata] = useState(null);
   const [isLoading, setIsLoading] = useState(false);
+  const [isRefining, setIsRefining] = useState(false);
   const [error, setError] = useState('');
   const [historyKey, setHistoryKey] = useState(0);
   const [theme, setTheme] = useState('light');
@@ -31,25 +38,66 @@ function App() {
     setIsLoading(true);
     setError('');
 
-    const formData = new FormData();
-    formData.append('red_file', redFile);
-    formData.append('green_file', greenFile);
-    formData.append('blue_file', blueFile);
-    formData.append('palette', modelParams.palette);
-
-    try {
-      const response = await axios.post(`${API_URL}/colorize-layers`, formData, {
+    const colorize = (fields) => {
+      const formData = new FormData();
+      formData.append('red_file', redFile);
+      formData.append('green_file', greenFile);
+      formData.append('blue_file', blueFile);
+      formData.append('palette', modelParams.palette);
+      Object.entries(fields).forEach(([name, value]) => formData.append(name, value));
+      return axios.post(`${API_URL}/colorize-layers`, formData, {
         headers: {
           'Content-Type': 'multipart/form-data',
         },
       });
-      setProcessedImage(response.data.imageData);
-      setMetadata(response.data.metadata);
+    };
+    const showResult = (result) => {
+      setProcessedImage(result.imageData);
+      setMetadata(result.metadata);
       setHistoryKey(prevKey => prevKey + 1);
+    };
+
+    try {
+      if (!PROGRESSIVE) {
+        showResult((await colorize({})).data);
+        return;
+      }
+
+      const response = await colorize({ progressive: '1' });
+      if (response.data.preview) {
+        setProcessedImage(response.data.preview.imageData);
+        setMetadata(response.data.preview.metadata);
+      }
+      setIsLoading(false);
+      setIsRefining(true);
+
+      // Poll the job until the full-quality image replaces the preview
+      let job = response.data;
+      let result;
+      try {
+        while (job.status !== 'done' && job.status !== 'failed') {
+          await sleep(POLL_INTERVAL_MS);
+          job = (await axios.get(`${API_URL}${response.data.status_url}`)).data;
+        }
+        if (job.status === 'done') {
+          result = (await axios.get(`${API_URL}${response.data.result_url}`)).data;
+        }
+      } catch (err) {
+        if (err.response?.status !== 404) {
+          throw err;
+        }
+        // A backend process that does not know the job answered: render in the request instead
+        result = (await colorize({})).data;
+      }
+      if (!result) {
+        throw new Error(job.error);
+      }
+      showResult(result);
     } catch (err) {
-      setError(err.response?.data?.error || 'An error occurred during colorization.');
+      setError(err.response?.data?.error || err.message || 'An error occurred during colorization.');
     } finally {
       setIsLoading(false);
+      setIsRefining(false);
     }
   };
 
@@ -83,12 +131,12 @@ function App() {
                 <input type="file" accept=".fits,.fit" onChange={(e) => setBlueFile(e.target.files[0])} />
               </div>
             </div>
-            <ControlPanel onColorize={handleColorize} isLoading={isLoading} />
+            <ControlPanel onColorize={handleColorize} isLoading={isLoading || isRefining} />
             {error && <p className="error">{error}</p>}
             <HistoryViewer historyKey={historyKey} />
           </div>
           <div className="right-panel">
-            <ImageViewer imageUrl={processedImage} metadata={metadata} isLoading={isLoading} />
+            <ImageViewer imageUrl={processedImage} metadata={metadata} isLoading={isLoading} isRefining={isRefining} />
           </div>
         </div>
       </main>
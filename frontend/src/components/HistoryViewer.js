@@ -2,6 +2,9 @@ import React, { useState, useEffect } from 'react';
 import axios from 'axios';
 
 const API_URL = 'http://127.0.0.1:5000';
+// Only the latest entries are shown, and only these fields
+const HISTORY_LIMIT = 5;
+const HISTORY_FIELDS = 'id,timestamp,filename,status';
 
 function HistoryViewer({ historyKey }) {
   const [history, setHistory] = useState([]);
@@ -9,7 +12,9 @@ function HistoryViewer({ historyKey }) {
   useEffect(() => {
     const fetchHistory = async () => {
       try {
-        const response = await axios.get(`${API_URL}/history`);
+        const response = await axios.get(`${API_URL}/history`, {
+          params: { limit: HISTORY_LIMIT, fields: HISTORY_FIELDS },
+        });
         setHistory(response.data);
       } catch (err) {
         console.error('Could not fetch processing history.');
@@ -23,8 +28,8 @@ function HistoryViewer({ historyKey }) {
       <h2>4. Processing History Log (P0.4)</h2>
       <ul className="history-list">
         {history.length > 0 ? (
-          history.slice(0, 5).map((item, index) => ( // Show latest 5
-            <li key={index} className={`history-item ${item.status.toLowerCase()}`}>
+          history.map((item) => (
+            <li key={item.id} className={`history-item ${item.status.toLowerCase()}`}>
               <span>{new Date(item.timestamp).toLocaleTimeString()}</span>
               <span>{item.filename}</span>
               <span>{item.status}</span>
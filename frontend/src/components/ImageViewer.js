@@ -1,6 +1,6 @@
 import React from 'react';
 
-function ImageViewer({ imageUrl, metadata, isLoading }) {
+function ImageViewer({ imageUrl, metadata, isLoading, isRefining }) {
   const handleExport = () => {
     if (imageUrl) {
       const link = document.createElement('a');
@@ -20,7 +20,8 @@ function ImageViewer({ imageUrl, metadata, isLoading }) {
         {imageUrl && !isLoading && <img src={imageUrl} alt="Processed astronomical" />}
         {!imageUrl && !isLoading && <p>Your colorized image will appear here.</p>}
       </div>
-      {imageUrl && <button onClick={handleExport}>Export Image (PNG)</button>}
+      {isRefining && <p>Preview shown, rendering full quality...</p>}
+      {imageUrl && !isRefining && <button onClick={handleExport}>Export Image (PNG)</button>}
       {metadata && (
         <div className="metadata-container">
           <h3>FITS Metadata Display</h3>